@@ -0,0 +1,99 @@
+import argparse
+import random
+import time
+import tracemalloc
+
+
+from bolt.common import annotation_table
+from bolt.common import constants
+
+
+# Memory of PCGR annotation data held as dicts (as from pcgr.compile_annotation_data) compared with
+# an annotation table. Synthetic annotations draw tiers, counts, and CSQ payloads from pools with
+# repetition similar to PCGR output. Allocated memory is measured with tracemalloc.
+#
+# Usage: python -m benchmarks.annotation_table [--records N] [--csq_pool N]
+
+
+TIERS = ('TIER_1', 'TIER_2', 'TIER_3', 'TIER_4', 'NONCODING')
+CONTIGS = tuple(f'chr{e}' for e in (*range(1, 23), 'X', 'Y'))
+
+
+def generate_annotations(record_count, csq_pool_size, seed=1):
+    rng = random.Random(seed)
+
+    csq_pool = [
+        ','.join(
+            f'T|{rng.choice(("missense_variant", "intron_variant", "upstream_gene_variant"))}|MODERATE|GENE{i}|'
+            f'ENSG{rng.randrange(10**10):011}|Transcript|ENST{rng.randrange(10**10):011}|protein_coding|{j}/10'
+            for j in range(rng.randint(1, 4))
+        )
+        for i in range(csq_pool_size)
+    ]
+
+    for i in range(record_count):
+        key = (CONTIGS[i * len(CONTIGS) // record_count], 1_000 + i * 100, rng.choice('ACGT'), rng.choice('ACGT'))
+        # NOTE: strings are copied for each record as they would be when parsed from PCGR output
+        record_ann = {
+            constants.VcfInfo.PCGR_CSQ: rng.choice(csq_pool).encode().decode(),
+            constants.VcfInfo.PCGR_TIER: rng.choice(TIERS).encode().decode(),
+            constants.VcfInfo.PCGR_COSMIC_COUNT: rng.choice((0, 0, 0, 1, 2)),
+            constants.VcfInfo.PCGR_ICGC_PCAWG_COUNT: rng.choice((0, 0, 0, 1, 5)),
+        }
+        if rng.random() < 0.05:
+            record_ann[constants.VcfInfo.PCGR_MUTATION_HOTSPOT] = f'GENE{i % 100}|p.X{i % 500}Y'
+        yield key, record_ann
+
+
+def measure(build_fn, entries):
+    tracemalloc.start()
+    time_start = time.perf_counter()
+    data = build_fn(entries)
+    seconds = time.perf_counter() - time_start
+    allocated, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return data, allocated, seconds
+
+
+def build_dict(entries):
+    return {key: record_ann for key, record_ann in entries}
+
+
+def build_table(entries):
+    table = annotation_table.AnnotationTable()
+    for key, record_ann in entries:
+        table.add(key, record_ann)
+    return table
+
+
+def time_lookups(data, keys):
+    time_start = time.perf_counter()
+    for key in keys:
+        data[key]
+    return time.perf_counter() - time_start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--records', type=int, default=500_000)
+    parser.add_argument('--csq_pool', type=int, default=20_000)
+    args = parser.parse_args()
+
+    # NOTE: entries are regenerated for each build so that only memory retained by the built
+    # structure is counted
+    data_dict, dict_bytes, dict_seconds = measure(build_dict, generate_annotations(args.records, args.csq_pool))
+    data_table, table_bytes, table_seconds = measure(build_table, generate_annotations(args.records, args.csq_pool))
+
+    keys = list(data_dict)
+    assert all(data_table[key] == data_dict[key] for key in keys[:1000])
+    dict_lookup_seconds = time_lookups(data_dict, keys)
+    table_lookup_seconds = time_lookups(data_table, keys)
+
+    print(f'records:  {args.records}')
+    print(f'dict:     {dict_bytes / 1024**2:.1f} MB, built in {dict_seconds:.2f} s, lookups {dict_lookup_seconds:.2f} s')
+    print(f'table:    {table_bytes / 1024**2:.1f} MB, built in {table_seconds:.2f} s, lookups {table_lookup_seconds:.2f} s')
+    print(f'ratio:    {dict_bytes / table_bytes:.1f}x')
+
+
+if __name__ == '__main__':
+    main()
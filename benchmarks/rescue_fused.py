@@ -0,0 +1,60 @@
+import argparse
+import pathlib
+import tempfile
+import time
+
+
+from bolt.workflows.smlv_somatic import rescue as smlv_somatic_rescue
+
+
+from . import vcf_generator
+
+
+# Comparison of the staged and fused smlv_somatic rescue paths. Wall time and total bytes written to
+# the output directory are reported for each; the staged path requires bcftools.
+#
+# Usage: python -m benchmarks.rescue_fused [--records N] [--repeats N]
+
+
+def time_run(rescue_fn, inputs, dirpath, repeats):
+    timings = list()
+    for i in range(repeats):
+        output_dir = dirpath / f'{rescue_fn.__name__}_{i}'
+        output_dir.mkdir()
+
+        time_start = time.perf_counter()
+        rescue_fn(inputs['smlv_fp'], 'tumor', inputs['sage_fp'], inputs['hotspots_fp'], output_dir)
+        timings.append(time.perf_counter() - time_start)
+
+    bytes_written = sum(fp.stat().st_size for fp in output_dir.rglob('*') if fp.is_file())
+    return min(timings), bytes_written
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--records', type=int, default=500_000)
+    parser.add_argument('--repeats', type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as dirpath:
+        dirpath = pathlib.Path(dirpath)
+
+        inputs = {
+            'smlv_fp': dirpath / 'smlv.vcf.gz',
+            'sage_fp': dirpath / 'sage.vcf.gz',
+            'hotspots_fp': dirpath / 'hotspots.bed',
+        }
+        vcf_generator.write_smlv_vcf(inputs['smlv_fp'], args.records, sage_fp=inputs['sage_fp'], sage_novel_step=20)
+        vcf_generator.write_regions_bed(inputs['hotspots_fp'])
+
+        staged_seconds, staged_bytes = time_run(smlv_somatic_rescue.rescue_staged, inputs, dirpath, args.repeats)
+        fused_seconds, fused_bytes = time_run(smlv_somatic_rescue.rescue_fused, inputs, dirpath, args.repeats)
+
+    print(f'records:  {args.records}')
+    print(f'staged:   {staged_seconds:.2f} s, {staged_bytes / 1024**2:.1f} MB written')
+    print(f'fused:    {fused_seconds:.2f} s, {fused_bytes / 1024**2:.1f} MB written')
+    print(f'speedup:  {staged_seconds / fused_seconds:.2f}x')
+
+
+if __name__ == '__main__':
+    main()
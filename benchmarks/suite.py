@@ -0,0 +1,261 @@
+import argparse
+import datetime
+import importlib.metadata
+import json
+import multiprocessing
+import pathlib
+import platform
+import resource
+import sys
+import tempfile
+import time
+
+
+import cyvcf2
+
+
+from bolt.common import constants
+from bolt.common import pcgr
+from bolt.external import prioritize_sv
+from bolt.workflows.smlv_somatic import filter as smlv_somatic_filter
+from bolt.workflows.smlv_somatic import report as smlv_somatic_report
+from bolt.workflows.smlv_somatic import rescue as smlv_somatic_rescue
+import bolt.util as util
+
+
+from . import vcf_generator
+
+
+# Benchmarks of bolt's Python record loops on synthetic input. Each benchmark runs in a forked
+# process so that peak RSS is measured per benchmark, and results are written as JSON for comparison
+# across releases.
+#
+# Usage: python -m benchmarks.suite [--records N] [--sv_records N] [--output_fp FP] [--only NAME ...]
+
+
+# Records are read in chunks with only function calls timed for per-record benchmarks, which keeps
+# memory bounded for inputs with millions of records
+CHUNK_SIZE = 10_000
+
+
+def bench_set_filter_data(inputs, output_dir):
+    tumor_index = vcf_generator.SAMPLES.index('tumor')
+
+    input_fh = cyvcf2.VCF(inputs['smlv_fp'])
+    smlv_somatic_filter.add_header_entries(input_fh)
+
+    count = 0
+    seconds = 0
+    for records in util.get_batches(input_fh, CHUNK_SIZE):
+        time_start = time.perf_counter()
+        for record in records:
+            smlv_somatic_filter.set_filter_data(record, tumor_index)
+        seconds += time.perf_counter() - time_start
+        count += len(records)
+    return count, seconds
+
+
+def bench_set_filter_data_batch(inputs, output_dir):
+    tumor_index = vcf_generator.SAMPLES.index('tumor')
+
+    input_fh = cyvcf2.VCF(inputs['smlv_fp'])
+    smlv_somatic_filter.add_header_entries(input_fh)
+
+    count = 0
+    seconds = 0
+    for records in util.get_batches(input_fh, CHUNK_SIZE):
+        time_start = time.perf_counter()
+        smlv_somatic_filter.set_filter_data_batch(records, tumor_index)
+        seconds += time.perf_counter() - time_start
+        count += len(records)
+    return count, seconds
+
+
+def bench_annotate_existing_sage_calls(inputs, output_dir):
+    time_start = time.perf_counter()
+    smlv_somatic_rescue.annotate_existing_sage_calls(
+        inputs['smlv_fp'],
+        'tumor',
+        inputs['sage_fp'],
+        output_dir,
+    )
+    seconds = time.perf_counter() - time_start
+    return inputs['smlv_count'], seconds
+
+
+def bench_prepare_vcf_somatic(inputs, output_dir):
+    time_start = time.perf_counter()
+    pcgr.prepare_vcf_somatic(inputs['smlv_fp'], 'tumor', 'normal', output_dir)
+    seconds = time.perf_counter() - time_start
+    return inputs['smlv_count'], seconds
+
+
+def bench_annotate_record(inputs, output_dir):
+    input_fh = cyvcf2.VCF(inputs['smlv_fp'])
+
+    # Annotate every record with PCGR data similar to that collected by transfer_annotations_somatic
+    annotations = dict()
+    for i, record in enumerate(input_fh):
+        key = (record.CHROM, record.POS, record.REF, record.ALT[0])
+        annotations[key] = {
+            constants.VcfInfo.PCGR_TIER: f'TIER_{i % 4 + 1}',
+            constants.VcfInfo.PCGR_CSQ: f'missense_variant|GENE{i % 500}|ENST{i:011}',
+            constants.VcfInfo.PCGR_TCGA_PANCANCER_COUNT: i % 10,
+        }
+
+    count = 0
+    seconds = 0
+    for records in util.get_batches(cyvcf2.VCF(inputs['smlv_fp']), CHUNK_SIZE):
+        time_start = time.perf_counter()
+        for record in records:
+            pcgr.annotate_record(record, annotations)
+        seconds += time.perf_counter() - time_start
+        count += len(records)
+    return count, seconds
+
+
+def bench_prioritize_sv_process_record(inputs, output_dir):
+    reference_data = vcf_generator.get_sv_reference_data()
+
+    input_fh = cyvcf2.VCF(inputs['sv_fp'])
+    prioritize_sv.add_cyvcf2_hdr(input_fh, 'SIMPLE_ANN', '.', 'String', '')
+    prioritize_sv.add_cyvcf2_hdr(input_fh, 'SV_TOP_TIER', '1', 'Integer', '')
+
+    count = 0
+    seconds = 0
+    for records in util.get_batches(input_fh, CHUNK_SIZE):
+        time_start = time.perf_counter()
+        for record in records:
+            prioritize_sv.process_record(record, *reference_data)
+        seconds += time.perf_counter() - time_start
+        count += len(records)
+    return count, seconds
+
+
+def bench_count_variant_types(inputs, output_dir):
+    time_start = time.perf_counter()
+    smlv_somatic_report.count_variant_types(inputs['smlv_fp'])
+    seconds = time.perf_counter() - time_start
+    return inputs['smlv_count'], seconds
+
+
+BENCHMARKS = {
+    'filter.set_filter_data': bench_set_filter_data,
+    'filter.set_filter_data_batch': bench_set_filter_data_batch,
+    'rescue.annotate_existing_sage_calls': bench_annotate_existing_sage_calls,
+    'pcgr.prepare_vcf_somatic': bench_prepare_vcf_somatic,
+    'pcgr.annotate_record': bench_annotate_record,
+    'prioritize_sv.process_record': bench_prioritize_sv_process_record,
+    'report.count_variant_types': bench_count_variant_types,
+}
+
+
+def run_benchmark(bench_fn, inputs, output_dir):
+    # Run in a forked process to obtain peak RSS for this benchmark alone; returns None and an error
+    # message if the benchmark fails
+    mp_context = multiprocessing.get_context('fork')
+    conn_recv, conn_send = mp_context.Pipe(duplex=False)
+
+    def target():
+        # NOTE: util.execute_command exits on failure, so SystemExit is also caught here
+        try:
+            count, seconds = bench_fn(inputs, output_dir)
+        except BaseException as exc:
+            conn_send.send((None, f'{type(exc).__name__}: {exc}'))
+            return
+        # NOTE: ru_maxrss is reported in kilobytes on Linux
+        peak_rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        conn_send.send(((count, seconds, peak_rss_kb), None))
+
+    process = mp_context.Process(target=target)
+    process.start()
+    # Close the parent copy of the sending end so that recv raises EOFError if the child exits
+    # without sending
+    conn_send.close()
+    try:
+        data, error = conn_recv.recv()
+    except EOFError:
+        data, error = None, None
+    process.join()
+
+    if error is None and (data is None or process.exitcode != 0):
+        error = f'benchmark process exited with code {process.exitcode}'
+    if error is not None:
+        return None, error
+
+    count, seconds, peak_rss_kb = data
+    result = {
+        'records': count,
+        'seconds': round(seconds, 4),
+        'records_per_second': round(count / seconds, 1),
+        'peak_rss_mb': round(peak_rss_kb / 1024, 1),
+    }
+    return result, None
+
+
+def get_bolt_version():
+    try:
+        return importlib.metadata.version('bolt')
+    except importlib.metadata.PackageNotFoundError:
+        return None
+
+
+def get_arguments():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--records', type=int, default=100_000)
+    parser.add_argument('--sv_records', type=int, default=10_000)
+    parser.add_argument('--only', nargs='+', choices=list(BENCHMARKS))
+    parser.add_argument('--output_fp', type=pathlib.Path, default='bolt_benchmarks.json')
+    return parser.parse_args()
+
+
+def main():
+    args = get_arguments()
+
+    results = {
+        'bolt_version': get_bolt_version(),
+        'python_version': platform.python_version(),
+        'date': datetime.datetime.now().isoformat(timespec='seconds'),
+        'records': args.records,
+        'sv_records': args.sv_records,
+        'benchmarks': dict(),
+    }
+
+    with tempfile.TemporaryDirectory(prefix='bolt_benchmarks.') as dirpath:
+        dirpath = pathlib.Path(dirpath)
+
+        inputs = {
+            'smlv_fp': dirpath / 'smlv.vcf.gz',
+            'smlv_count': args.records,
+            'sage_fp': dirpath / 'sage.vcf.gz',
+            'sv_fp': dirpath / 'sv.vcf.gz',
+            'sv_count': args.sv_records,
+        }
+        vcf_generator.write_smlv_vcf(inputs['smlv_fp'], args.records, sage_fp=inputs['sage_fp'])
+        vcf_generator.write_sv_vcf(inputs['sv_fp'], args.sv_records)
+
+        for name, bench_fn in BENCHMARKS.items():
+            if args.only and name not in args.only:
+                continue
+
+            output_dir = dirpath / name
+            output_dir.mkdir()
+
+            result, error = run_benchmark(bench_fn, inputs, output_dir)
+            if error is not None:
+                results['benchmarks'][name] = {'error': error}
+                print(f'{name:40} failed: {error}', file=sys.stderr)
+                continue
+            results['benchmarks'][name] = result
+            print(f'{name:40} {result["records_per_second"]:>12,.0f} records/s {result["peak_rss_mb"]:>10,.1f} MB')
+
+    with args.output_fp.open('w') as fh:
+        json.dump(results, fh, indent=4)
+        fh.write('\n')
+
+    if any('error' in result for result in results['benchmarks'].values()):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
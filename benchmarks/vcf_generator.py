@@ -0,0 +1,208 @@
+import random
+
+
+from bolt.common import bgzf
+from bolt.common import constants
+import bolt.util as util
+
+
+# Synthetic VCFs for benchmarking; records are generated and written as text so that inputs with
+# millions of records can be created without holding them in memory. Outputs are bgzip compressed
+# and TBI indexed.
+
+
+SAMPLES = ('normal', 'tumor')
+CONTIGS = [(f'chr{i}', 250_000_000) for i in range(1, 23)]
+
+
+# Annotations present in the smlv_somatic annotate output that are not defined in constants
+HEADER_LINES_SMLV = (
+    '##INFO=<ID=GIAB_CONF,Number=0,Type=Flag,Description="">',
+    '##INFO=<ID=DIFFICULT_segdup,Number=0,Type=Flag,Description="">',
+    '##INFO=<ID=ENCODE,Number=0,Type=Flag,Description="">',
+    '##INFO=<ID=HMF_HOTSPOT,Number=0,Type=Flag,Description="">',
+    '##INFO=<ID=PON_COUNT,Number=1,Type=Integer,Description="">',
+    '##INFO=<ID=gnomAD_AF,Number=1,Type=Float,Description="">',
+    '##FILTER=<ID=weak_evidence,Description="">',
+    '##FILTER=<ID=minTumorQual,Description="">',
+    '##FORMAT=<ID=GT,Number=1,Type=String,Description="">',
+    '##FORMAT=<ID=AD,Number=R,Type=Integer,Description="">',
+    '##FORMAT=<ID=AF,Number=A,Type=Float,Description="">',
+    '##FORMAT=<ID=DP,Number=1,Type=Integer,Description="">',
+    '##FORMAT=<ID=SB,Number=1,Type=Float,Description="">',
+    '##FORMAT=<ID=SQ,Number=1,Type=Float,Description="">',
+)
+
+INFO_CHOICES_SMLV = (
+    '.',
+    'GIAB_CONF',
+    'GIAB_CONF',
+    'GIAB_CONF;gnomAD_AF=0.001',
+    'DIFFICULT_segdup;GIAB_CONF',
+    'PON_COUNT=6;gnomAD_AF=0.02',
+    'ENCODE;PCGR_TIER=TIER_2',
+    'SAGE_HOTSPOT;GIAB_CONF',
+    'HMF_HOTSPOT;PCGR_COSMIC_COUNT=12',
+    'PCGR_CLINVAR_CLNSIG=benign,likely_pathogenic;GIAB_CONF',
+    'PCGR_CLINVAR_CLNSIG=uncertain_significance;PCGR_TCGA_PANCANCER_COUNT=2',
+)
+
+ALLELE_CHOICES = (
+    ('A', 'T'),
+    ('C', 'G'),
+    ('G', 'A'),
+    ('T', 'C'),
+    ('A', 'AT'),
+    ('CT', 'C'),
+)
+
+
+HEADER_LINES_SV = (
+    '##INFO=<ID=SVTYPE,Number=1,Type=String,Description="">',
+    '##INFO=<ID=END,Number=1,Type=Integer,Description="">',
+    '##INFO=<ID=ANN,Number=.,Type=String,Description="">',
+    '##INFO=<ID=LOF,Number=.,Type=String,Description="">',
+    '##INFO=<ID=PURPLE_CN,Number=.,Type=Float,Description="">',
+    '##FORMAT=<ID=GT,Number=1,Type=String,Description="">',
+)
+
+SV_GENES = [f'GENE{i}' for i in range(200)]
+SV_EFFECTS = (
+    'exon_loss_variant',
+    'gene_fusion',
+    'bidirectional_gene_fusion',
+    'upstream_gene_variant',
+    'downstream_gene_variant',
+    'intron_variant',
+    'transcript_ablation',
+)
+SV_IMPACTS = ('HIGH', 'MODERATE', 'LOW', 'MODIFIER')
+
+
+def get_header(header_lines, samples):
+    lines = ['##fileformat=VCFv4.2']
+    lines.extend(f'##contig=<ID={contig},length={length}>' for contig, length in CONTIGS)
+    lines.extend(header_lines)
+    columns = ['#CHROM', 'POS', 'ID', 'REF', 'ALT', 'QUAL', 'FILTER', 'INFO', 'FORMAT', *samples]
+    lines.append('\t'.join(columns))
+    return '\n'.join(lines) + '\n'
+
+
+def get_positions(count, rng):
+    # Evenly distribute records over contigs in sorted order
+    per_contig = -(-count // len(CONTIGS))
+    n = 0
+    for contig, length in CONTIGS:
+        step = length // (per_contig + 1)
+        for i in range(1, per_contig + 1):
+            if n == count:
+                return
+            yield contig, i * step + rng.randrange(step // 2)
+            n += 1
+
+
+def write_smlv_vcf(fp, count, *, seed=1, sage_fp=None, sage_step=10, sage_novel_step=None):
+    # Write a small variant VCF resembling the smlv_somatic annotate output; where sage_fp is given,
+    # every sage_step-th record is also written as a SAGE re-call and every sage_novel_step-th record
+    # has a novel SAGE call at the same position
+    rng = random.Random(seed)
+
+    header_lines = [
+        *(util.get_vcf_header_line(e) for e in constants.VCF_HEADER_ENTRIES),
+        *HEADER_LINES_SMLV,
+    ]
+    header = get_header(header_lines, SAMPLES)
+    output_fh = bgzf.VcfIndexedLineWriter(fp, header)
+    sage_fh = bgzf.VcfIndexedLineWriter(sage_fp, header) if sage_fp else None
+
+    for i, (contig, pos) in enumerate(get_positions(count, rng)):
+        ref, alt = rng.choice(ALLELE_CHOICES)
+        vfilter = 'weak_evidence' if rng.random() < 0.2 else 'PASS'
+        info = rng.choice(INFO_CHOICES_SMLV)
+
+        tumor_ad_alt = rng.randint(1, 30)
+        tumor_ad_ref = rng.randint(10, 80)
+        tumor_dp = tumor_ad_ref + tumor_ad_alt
+        tumor_af = tumor_ad_alt / tumor_dp
+        normal_dp = rng.randint(20, 60)
+        sq = rng.randint(5, 60)
+        samples = (
+            f'0/0:{normal_dp},0:0:{normal_dp}:{sq}',
+            f'0/1:{tumor_ad_ref},{tumor_ad_alt}:{tumor_af:.3f}:{tumor_dp}:{sq}',
+        )
+        line = '\t'.join([contig, str(pos), '.', ref, alt, '.', vfilter, info, 'GT:AD:AF:DP:SQ', *samples])
+        output_fh.write_line(line + '\n')
+
+        if sage_fh and i % sage_step == 0:
+            sage_filter = 'PASS' if rng.random() < 0.8 else 'minTumorQual'
+            sage_samples = (
+                f'0/0:{normal_dp},0:0:{normal_dp}:0.5',
+                f'0/1:{tumor_ad_ref},{tumor_ad_alt}:{tumor_af:.3f}:{tumor_dp}:0.5',
+            )
+            sage_line = '\t'.join([contig, str(pos), '.', ref, alt, '.', sage_filter, '.', 'GT:AD:AF:DP:SB', *sage_samples])
+            sage_fh.write_line(sage_line + '\n')
+
+        if sage_fh and sage_novel_step and i % sage_novel_step == 0:
+            sage_samples = (
+                f'0/0:{normal_dp},0:0:{normal_dp}:0.5',
+                f'0/1:{tumor_ad_ref},{sq}:{sq / (tumor_ad_ref + sq):.3f}:{tumor_ad_ref + sq}:0.5',
+            )
+            sage_line = '\t'.join([contig, str(pos), '.', ref, f'{alt}T', '.', 'PASS', '.', 'GT:AD:AF:DP:SB', *sage_samples])
+            sage_fh.write_line(sage_line + '\n')
+
+    output_fh.close()
+    if sage_fh:
+        sage_fh.close()
+
+    return fp
+
+
+def write_regions_bed(fp, *, width=50_000, step=100_000):
+    # Write regions of the given width at regular steps over each contig
+    with open(fp, 'w') as fh:
+        for contig, length in CONTIGS:
+            for start in range(0, length, step):
+                print(contig, start, min(start + width, length), sep='\t', file=fh)
+    return fp
+
+
+def write_sv_vcf(fp, count, *, seed=1):
+    # Write a SnpEff annotated SV VCF as taken by prioritize_sv; see get_sv_reference_data for the
+    # matching gene and transcript sets
+    rng = random.Random(seed)
+
+    header = get_header(HEADER_LINES_SV, SAMPLES[1:])
+    output_fh = bgzf.VcfIndexedLineWriter(fp, header)
+
+    for contig, pos in get_positions(count, rng):
+        svtype = rng.choice(('DEL', 'DUP', 'INV', 'BND'))
+        annotations = list()
+        for _ in range(rng.randint(1, 6)):
+            effect = rng.choice(SV_EFFECTS)
+            # NOTE: only fusion and up/downstream effects may involve two genes
+            gene_count = 1 if effect in ('exon_loss_variant', 'intron_variant') else rng.choice((1, 2))
+            genes = '&'.join(rng.sample(SV_GENES, gene_count))
+            impact = rng.choice(SV_IMPACTS)
+            transcript = f'ENST{rng.randrange(1000):011}.1'
+            annotations.append(f'<{svtype}>|{effect}|{impact}|{genes}|ENSG0|transcript|{transcript}|protein_coding|2/5|||||||')
+        info_entries = [f'SVTYPE={svtype}', f'END={pos + 1000}', f'ANN={",".join(annotations)}']
+        if rng.random() < 0.3:
+            info_entries.append(f'LOF=({rng.choice(SV_GENES)}|ENSG0|1|1.00)')
+        info_entries.append(f'PURPLE_CN={rng.choice((0.1, 1.0, 2.0, 3.5))},{rng.choice((0.2, 2.0))}')
+
+        line = '\t'.join([contig, str(pos), '.', 'N', f'<{svtype}>', '.', 'PASS', ';'.join(info_entries), 'GT', '0/1'])
+        output_fh.write_line(line + '\n')
+
+    output_fh.close()
+    return fp
+
+
+def get_sv_reference_data():
+    # Positional arguments to prioritize_sv.process_record following the record
+    all_trs = {f'ENST{i:011}' for i in range(1000)}
+    princ_trs = {f'ENST{i:011}' for i in range(0, 1000, 2)}
+    known_pairs = {(SV_GENES[i], SV_GENES[i + 1]) for i in range(0, 40, 2)}
+    fus_promisc = set(SV_GENES[40:60])
+    prio_genes = set(SV_GENES[::3])
+    tsgenes = set(SV_GENES[::7])
+    return princ_trs, all_trs, known_pairs, fus_promisc, prio_genes, tsgenes
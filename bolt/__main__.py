@@ -1,13 +1,16 @@
 import click
 
 
+from .common import metrics
 from .workflows import cli as workflow_cli
 
 
 @click.group(cls=workflow_cli.ClickCustomGroupOrder)
 @click.version_option()
-def cli():
-    pass
+@click.option('--metrics', 'metrics_enabled', is_flag=True, help='Write runtime metrics to output directory.')
+def cli(metrics_enabled):
+    if metrics_enabled:
+        metrics.enable()
 
 
 def entry():
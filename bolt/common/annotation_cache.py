@@ -0,0 +1,145 @@
+import hashlib
+import json
+import os
+import pathlib
+import shutil
+import tempfile
+
+
+import numpy as np
+
+
+from . import intervals
+from . import variant_keys
+
+
+# Annotation resources compiled to NumPy arrays that are memory-mapped when loaded, allowing pages to
+# be shared by concurrent processes on the same host. Entries are keyed by the checksum of the source
+# file and the parameters used to read it, and are built automatically when missing or when a source
+# changes. The manifest records the size and modification time of each source so that checksums are
+# only recomputed when either changes.
+
+
+VERSION = 3
+MANIFEST_NAME = 'manifest.json'
+CHECKSUM_CHUNK_SIZE = 2**20
+
+
+def load_regions(cache_dir, fp, *, padding=0, one_based=False):
+    # Regions as returned by intervals.read_regions_arrays
+    params = {'kind': 'regions', 'padding': padding, 'one_based': one_based}
+
+    def build_fn(entry_dir):
+        regions = intervals.read_regions_arrays(fp, padding=padding, one_based=one_based)
+        write_arrays(entry_dir, {contig: {'starts': s, 'ends': e} for contig, (s, e) in regions.items()})
+
+    arrays = read_arrays(get_entry_dir(cache_dir, fp, params, build_fn))
+    return {contig: (a['starts'], a['ends']) for contig, a in arrays.items()}
+
+
+def load_variants(cache_dir, fp, field, *, op='first', bloom=True):
+    # Keys, checks, values, and Bloom filter (empty where not used) for each contig, see variant_keys
+    params = {'kind': 'variants', 'field': field, 'op': op, 'bloom': bloom}
+
+    def build_fn(entry_dir):
+        contig_values = variant_keys.read_variant_values(fp, field, op=op)
+        contig_arrays = dict()
+        for contig, (keys, checks, values) in contig_values.items():
+            bloom_bits = variant_keys.build_bloom(keys) if bloom else np.zeros(0, dtype=np.uint8)
+            contig_arrays[contig] = {'keys': keys, 'checks': checks, 'values': values, 'bloom': bloom_bits}
+        write_arrays(entry_dir, contig_arrays)
+
+    arrays = read_arrays(get_entry_dir(cache_dir, fp, params, build_fn))
+    return {contig: (a['keys'], a['checks'], a['values'], a['bloom']) for contig, a in arrays.items()}
+
+
+def get_entry_dir(cache_dir, fp, params, build_fn):
+    cache_dir = pathlib.Path(cache_dir)
+    cache_dir.mkdir(mode=0o755, parents=True, exist_ok=True)
+
+    checksum = get_source_checksum(cache_dir, fp)
+    entry_key_data = json.dumps({'version': VERSION, 'checksum': checksum, **params}, sort_keys=True)
+    entry_dir = cache_dir / hashlib.sha256(entry_key_data.encode()).hexdigest()
+    if entry_dir.exists():
+        return entry_dir
+
+    # Build in a temporary directory then rename so that concurrent processes only ever observe
+    # complete entries; where another process completes the same entry first, that entry is kept
+    build_dir = pathlib.Path(tempfile.mkdtemp(prefix='build.', dir=cache_dir))
+    try:
+        build_fn(build_dir)
+        write_json(build_dir / 'entry.json', {'source': str(pathlib.Path(fp).resolve()), 'checksum': checksum, **params})
+        os.rename(build_dir, entry_dir)
+    except OSError:
+        if not entry_dir.exists():
+            raise
+    finally:
+        shutil.rmtree(build_dir, ignore_errors=True)
+    return entry_dir
+
+
+def get_source_checksum(cache_dir, fp):
+    fp = pathlib.Path(fp).resolve()
+    fp_stat = fp.stat()
+
+    manifest_fp = cache_dir / MANIFEST_NAME
+    manifest = dict()
+    if manifest_fp.exists():
+        with manifest_fp.open('r') as fh:
+            manifest = json.load(fh)
+
+    source = manifest.get(str(fp))
+    if source and source['size'] == fp_stat.st_size and source['mtime_ns'] == fp_stat.st_mtime_ns:
+        return source['checksum']
+
+    checksum = hashlib.sha256()
+    with fp.open('rb') as fh:
+        while (data := fh.read(CHECKSUM_CHUNK_SIZE)):
+            checksum.update(data)
+
+    manifest[str(fp)] = {
+        'size': fp_stat.st_size,
+        'mtime_ns': fp_stat.st_mtime_ns,
+        'checksum': checksum.hexdigest(),
+    }
+    # NOTE: concurrent updates may drop manifest entries, which only causes checksums to be recomputed
+    write_json(manifest_fp, manifest)
+
+    return manifest[str(fp)]['checksum']
+
+
+def write_arrays(entry_dir, contig_arrays):
+    # Arrays for each contig are concatenated into a single .npy file per name, which is required for
+    # memory-mapping, with contig offsets recorded separately
+    offsets = dict()
+    arrays = dict()
+    for contig, contig_data in contig_arrays.items():
+        offsets[contig] = dict()
+        for name, array in contig_data.items():
+            name_arrays = arrays.setdefault(name, list())
+            begin = sum(len(a) for a in name_arrays)
+            offsets[contig][name] = [begin, begin + len(array)]
+            name_arrays.append(array)
+
+    for name, name_arrays in arrays.items():
+        np.save(entry_dir / f'{name}.npy', np.concatenate(name_arrays))
+    write_json(entry_dir / 'offsets.json', offsets)
+
+
+def read_arrays(entry_dir):
+    with (entry_dir / 'offsets.json').open('r') as fh:
+        offsets = json.load(fh)
+
+    arrays = {fp.stem: np.load(fp, mmap_mode='r') for fp in entry_dir.glob('*.npy')}
+    return {
+        contig: {name: arrays[name][begin:end] for name, (begin, end) in contig_offsets.items()}
+        for contig, contig_offsets in offsets.items()
+    }
+
+
+def write_json(fp, data):
+    # Write to a temporary file then rename so that readers never observe partial content
+    with tempfile.NamedTemporaryFile('w', dir=fp.parent, prefix=f'.{fp.name}.', delete=False) as fh:
+        json.dump(data, fh, indent=4)
+        fh.write('\n')
+    os.replace(fh.name, fp)
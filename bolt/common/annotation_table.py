@@ -0,0 +1,143 @@
+import array
+import collections.abc
+
+
+# Compact in-memory table of per-variant annotations with the lookup interface of the dicts built by
+# pcgr.compile_annotation_data, i.e. (CHROM, POS, REF, ALT) keys mapping to {VcfInfo: value}. Rows
+# are stored as parallel arrays: contig codes, positions, and codes into a shared pool of interned
+# values for REF, ALT, and each annotation field. Repeated values such as tiers, counts, and CSQ
+# payloads are therefore held once. The order of fields for each row, which sets INFO order on
+# transfer, is also interned. Keys are found with an open addressing hash index over row numbers,
+# which is updated as rows are added so that duplicate keys are rejected.
+
+
+MISSING = -1
+
+
+class AnnotationTable(collections.abc.Mapping):
+
+    def __init__(self):
+        self.pool = list()
+        self.pool_codes = dict()
+
+        self.contigs = list()
+        self.contig_codes = dict()
+
+        self.contig_column = array.array('h')
+        self.position_column = array.array('q')
+        self.ref_column = array.array('i')
+        self.alt_column = array.array('i')
+        self.field_order_column = array.array('i')
+        self.field_columns = dict()
+
+        self.index = array.array('q', [MISSING]) * 8
+
+    def __len__(self):
+        return len(self.position_column)
+
+    def __iter__(self):
+        for row in range(len(self)):
+            yield self.get_key(row)
+
+    def __contains__(self, key):
+        return self.find_row(key) is not None
+
+    def __getitem__(self, key):
+        if (row := self.find_row(key)) is None:
+            raise KeyError(key)
+        return self.get_annotation(row)
+
+    def add(self, key, record_ann):
+        contig, position, ref, alt = key
+        if (contig_code := self.contig_codes.get(contig)) is None:
+            contig_code = self.contig_codes[contig] = len(self.contigs)
+            self.contigs.append(contig)
+        codes = (contig_code, position, self.intern(ref), self.intern(alt))
+
+        slot, row = self.find_slot(codes)
+        if row is not None:
+            raise ValueError(f'annotation table already has an entry for {key}')
+
+        self.contig_column.append(contig_code)
+        self.position_column.append(position)
+        self.ref_column.append(codes[2])
+        self.alt_column.append(codes[3])
+        self.field_order_column.append(self.intern(tuple(record_ann)))
+
+        for field in record_ann:
+            if field not in self.field_columns:
+                self.field_columns[field] = array.array('i', [MISSING]) * (len(self) - 1)
+        for field, column in self.field_columns.items():
+            column.append(self.intern(record_ann[field]) if field in record_ann else MISSING)
+
+        if len(self) * 2 > len(self.index):
+            self.build_index()
+        else:
+            self.index[slot] = len(self) - 1
+
+    def fill(self, key, record_ann):
+        # Set fields of an existing row where not already present, as in compile_annotation_data
+        row = self.find_row(key)
+        field_order = self.pool[self.field_order_column[row]]
+        fields_new = [field for field in record_ann if field not in field_order]
+        if not fields_new:
+            return
+
+        for field in fields_new:
+            if field not in self.field_columns:
+                self.field_columns[field] = array.array('i', [MISSING]) * len(self)
+            self.field_columns[field][row] = self.intern(record_ann[field])
+        self.field_order_column[row] = self.intern((*field_order, *fields_new))
+
+    def intern(self, value):
+        # NOTE: pool codes are keyed by type as well as value so that e.g. 1 and 1.0 remain distinct
+        if (code := self.pool_codes.get((type(value), value))) is None:
+            code = self.pool_codes[(type(value), value)] = len(self.pool)
+            self.pool.append(value)
+        return code
+
+    def get_key(self, row):
+        return (
+            self.contigs[self.contig_column[row]],
+            self.position_column[row],
+            self.pool[self.ref_column[row]],
+            self.pool[self.alt_column[row]],
+        )
+
+    def get_annotation(self, row):
+        field_order = self.pool[self.field_order_column[row]]
+        return {field: self.pool[self.field_columns[field][row]] for field in field_order}
+
+    def find_row(self, key):
+        contig, position, ref, alt = key
+        if (contig_code := self.contig_codes.get(contig)) is None:
+            return None
+        if (ref_code := self.pool_codes.get((str, ref))) is None or (alt_code := self.pool_codes.get((str, alt))) is None:
+            return None
+        _, row = self.find_slot((contig_code, position, ref_code, alt_code))
+        return row
+
+    def find_slot(self, codes):
+        # Returns the slot and row of the given codes, or the empty slot for these and None
+        mask = len(self.index) - 1
+        slot = hash(codes) & mask
+        while (row := self.index[slot]) != MISSING:
+            if codes == self.get_row_codes(row):
+                return slot, row
+            slot = (slot + 1) & mask
+        return slot, None
+
+    def get_row_codes(self, row):
+        return (self.contig_column[row], self.position_column[row], self.ref_column[row], self.alt_column[row])
+
+    def build_index(self):
+        # Linear probing with at most half of the slots used
+        slot_count = 1 << max(len(self) * 2, 1).bit_length()
+        index = array.array('q', [MISSING]) * slot_count
+        mask = slot_count - 1
+        for row in range(len(self)):
+            slot = hash(self.get_row_codes(row)) & mask
+            while index[slot] != MISSING:
+                slot = (slot + 1) & mask
+            index[slot] = row
+        self.index = index
@@ -0,0 +1,46 @@
+import cyvcf2
+import pysam
+
+
+# Bgzip compressed VCF output written and tabix indexed by htslib. Records are written through
+# cyvcf2 and pre-formatted VCF lines through the htslib BGZF writer; outputs are indexed on close,
+# equivalent to bcftools index -t.
+
+
+class VcfIndexedWriter:
+
+    def __init__(self, fp, template):
+        # The template is either a cyvcf2.VCF, whose header is used, or a VCF header string
+        self.fp = fp
+        if isinstance(template, str):
+            self.writer = cyvcf2.Writer.from_string(str(fp), template, mode='wz')
+        else:
+            self.writer = cyvcf2.Writer(str(fp), template, mode='wz')
+
+    def write_record(self, record):
+        self.writer.write_record(record)
+
+    def close(self):
+        self.writer.close()
+        index_vcf(self.fp)
+
+
+class VcfIndexedLineWriter:
+
+    def __init__(self, fp, header):
+        self.fp = fp
+        self.fh = pysam.BGZFile(str(fp), 'wb')
+        if not header.endswith('\n'):
+            header = f'{header}\n'
+        self.fh.write(header.encode())
+
+    def write_line(self, line):
+        self.fh.write(line.encode())
+
+    def close(self):
+        self.fh.close()
+        index_vcf(self.fp)
+
+
+def index_vcf(fp):
+    pysam.tabix_index(str(fp), preset='vcf', force=True)
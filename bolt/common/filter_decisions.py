@@ -0,0 +1,111 @@
+import numpy as np
+
+
+from . import constants
+
+
+# Compact columnar record of smlv_somatic filter decisions, written by filter alongside its output
+# VCFs so that report can compute summary counts without decoding every record again. Columns:
+#   filters        FILTERs set prior to any rescue, as a bitmask of FILTER_BITS
+#   rescues        rescues applied, as a bitmask of RESCUE_BITS
+#   variant_class  one of VARIANT_CLASSES
+#   sage_novel     whether INFO/SAGE_NOVEL is set
+FILTER_NAMES = (*(e.value for e in constants.VcfFilter), 'other')
+FILTER_BITS = {e: 1 << i for i, e in enumerate(FILTER_NAMES)}
+FILTER_OTHER = FILTER_BITS['other']
+
+FILTER_ANNOTATION_MASK = (
+    FILTER_BITS[constants.VcfFilter.MAX_VARIANTS_NON_PASS.value] |
+    FILTER_BITS[constants.VcfFilter.MAX_VARIANTS_GNOMAD.value] |
+    FILTER_BITS[constants.VcfFilter.MAX_VARIANTS_NON_CANCER_GENES.value]
+)
+
+RESCUE_NAMES = (
+    constants.VcfInfo.PCGR_TIER_RESCUE.value,
+    constants.VcfInfo.SAGE_HOTSPOT_RESCUE.value,
+    constants.VcfInfo.CLINICAL_POTENTIAL_RESCUE.value,
+)
+RESCUE_BITS = {e: 1 << i for i, e in enumerate(RESCUE_NAMES)}
+
+VARIANT_CLASSES = ('snps', 'indels', 'others')
+
+
+class FilterDecisionCollector:
+
+    # Collect filter decisions from records as they are written; records must have filters and
+    # rescues applied by smlv_somatic filter
+
+    def __init__(self):
+        self.filters = list()
+        self.rescues = list()
+        self.variant_class = list()
+        self.sage_novel = list()
+        self.filters_cache = dict()
+
+    def add(self, record):
+        info = dict(record.INFO)
+
+        # Restore FILTERs removed by rescue
+        filters_key = (
+            record.FILTER,
+            info.get(constants.VcfInfo.RESCUED_FILTERS_EXISTING.value),
+            info.get(constants.VcfInfo.RESCUED_FILTERS_PENDING.value),
+        )
+        if (filters := self.filters_cache.get(filters_key)) is None:
+            filters = self.filters_cache[filters_key] = get_filter_bits(*filters_key)
+        self.filters.append(filters)
+
+        rescues = 0
+        for info_name in RESCUE_BITS.keys() & info.keys():
+            rescues |= RESCUE_BITS[info_name]
+        self.rescues.append(rescues)
+
+        if record.is_snp:
+            self.variant_class.append(0)
+        elif record.is_indel:
+            self.variant_class.append(1)
+        else:
+            self.variant_class.append(2)
+
+        self.sage_novel.append(info.get(constants.VcfInfo.SAGE_NOVEL.value) is not None)
+
+    def write(self, fp):
+        # NOTE: np.savez appends .npz where absent, so require it to keep the filepath predictable
+        assert str(fp).endswith('.npz')
+        np.savez_compressed(
+            fp,
+            filter_names=np.array(FILTER_NAMES),
+            rescue_names=np.array(RESCUE_NAMES),
+            filters=np.array(self.filters, dtype=np.uint16),
+            rescues=np.array(self.rescues, dtype=np.uint8),
+            variant_class=np.array(self.variant_class, dtype=np.uint8),
+            sage_novel=np.array(self.sage_novel, dtype=bool),
+        )
+        return fp
+
+
+def get_filter_bits(filter_str, rescued_existing, rescued_pending):
+    filter_names = list()
+    for filters in (filter_str, rescued_existing, rescued_pending):
+        if filters:
+            filter_names.extend(filters.replace(';', ',').split(','))
+
+    bits = 0
+    for filter_name in filter_names:
+        if filter_name == 'PASS':
+            continue
+        bits |= FILTER_BITS.get(filter_name, FILTER_OTHER)
+    return bits
+
+
+def read(fp):
+    with np.load(fp) as data:
+        # Bit layout must match that of this version
+        assert tuple(data['filter_names']) == FILTER_NAMES
+        assert tuple(data['rescue_names']) == RESCUE_NAMES
+        return {k: data[k] for k in ('filters', 'rescues', 'variant_class', 'sage_novel')}
+
+
+def get_pass_mask(data):
+    # Records either have no FILTERs or have been rescued
+    return (data['filters'] == 0) | (data['rescues'] != 0)
@@ -0,0 +1,90 @@
+import bisect
+import collections
+import gzip
+
+
+import cyvcf2
+import numpy as np
+
+
+def read_regions(fp, *, padding=0, one_based=False):
+    # Read regions from a BED-like file into merged, sorted intervals for each contig. Intervals are
+    # zero-based and half-open; where one_based is set, the start and end columns are instead taken
+    # as one-based and inclusive, matching how bcftools interprets regions files without a .bed
+    # extension. As with bcftools, a VCF may also be given, in which case each record spans POS to
+    # POS+len(REF)-1 and one_based does not apply
+    if is_vcf(fp):
+        entries = iter_regions_vcf(fp)
+    else:
+        entries = iter_regions_bed(fp, one_based)
+
+    regions = collections.defaultdict(list)
+    for contig, start, end in entries:
+        regions[contig].append((max(start - padding, 0), end + padding))
+    return {contig: merge_intervals(intervals) for contig, intervals in regions.items()}
+
+
+def iter_regions_bed(fp, one_based):
+    open_fn = gzip.open if str(fp).endswith('.gz') else open
+    with open_fn(fp, 'rt') as fh:
+        for line in fh:
+            if not line.strip() or line.startswith(('#', 'track', 'browser')):
+                continue
+            contig, start, end, *_ = line.rstrip('\n').split('\t')
+            start = int(start) - 1 if one_based else int(start)
+            yield contig, start, int(end)
+
+
+def iter_regions_vcf(fp):
+    # NOTE: record end accounts for INFO/END where present, as does bcftools
+    for record in cyvcf2.VCF(fp):
+        yield record.CHROM, record.start, record.end
+
+
+def is_vcf(fp):
+    # Detect VCF and BCF by content rather than by name, as done by htslib
+    with open(fp, 'rb') as fh:
+        is_gzip = fh.read(2) == b'\x1f\x8b'
+    with (gzip.open(fp, 'rb') if is_gzip else open(fp, 'rb')) as fh:
+        data = fh.read(16)
+    return data.startswith((b'##fileformat=VCF', b'BCF\x02'))
+
+
+def merge_intervals(intervals):
+    # Returns separate lists of starts and ends for use with bisect
+    starts = list()
+    ends = list()
+    for start, end in sorted(intervals):
+        if ends and start <= ends[-1]:
+            ends[-1] = max(ends[-1], end)
+        else:
+            starts.append(start)
+            ends.append(end)
+    return starts, ends
+
+
+def overlaps(regions, contig, start, end):
+    # Test whether the zero-based, half-open interval overlaps any region
+    if (contig_regions := regions.get(contig)) is None:
+        return False
+    starts, ends = contig_regions
+    i = bisect.bisect_left(starts, end) - 1
+    return i >= 0 and ends[i] > start
+
+
+def read_regions_arrays(fp, **kwargs):
+    # As read_regions but with NumPy arrays for vectorised overlap queries
+    regions = read_regions(fp, **kwargs)
+    return {
+        contig: (np.array(starts, dtype=np.int64), np.array(ends, dtype=np.int64))
+        for contig, (starts, ends) in regions.items()
+    }
+
+
+def overlaps_array(regions, contig, starts, ends):
+    # Test whether each zero-based, half-open interval on a contig overlaps any region
+    if (contig_regions := regions.get(contig)) is None:
+        return np.zeros(len(starts), dtype=bool)
+    region_starts, region_ends = contig_regions
+    i = np.searchsorted(region_starts, ends, side='left') - 1
+    return (i >= 0) & (region_ends[np.maximum(i, 0)] > starts)
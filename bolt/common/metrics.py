@@ -0,0 +1,132 @@
+import contextlib
+import json
+import pathlib
+import resource
+import time
+
+
+# Runtime metrics for external commands and Python record loops, enabled with the --metrics flag of
+# the bolt CLI group. The collector is None when metrics are disabled so that instrumented code
+# paths otherwise run unchanged.
+COLLECTOR = None
+
+
+class MetricsCollector:
+
+    def __init__(self):
+        self.commands = list()
+        self.record_loops = list()
+
+
+def enable():
+    global COLLECTOR
+    COLLECTOR = MetricsCollector()
+
+
+def is_enabled():
+    return COLLECTOR is not None
+
+
+@contextlib.contextmanager
+def record_command(command):
+    # Wall time and rusage of an external command. Child rusage includes all waited descendants,
+    # i.e. every process in a pipeline; max RSS is the largest of any descendant so far as this
+    # cannot be obtained for a single child
+    if COLLECTOR is None:
+        yield None
+        return
+
+    entry = {'command': command}
+    usage_start = resource.getrusage(resource.RUSAGE_CHILDREN)
+    time_start = time.perf_counter()
+    try:
+        yield entry
+    finally:
+        entry['wall_seconds'] = round(time.perf_counter() - time_start, 4)
+        entry.update(get_rusage_delta(usage_start, resource.getrusage(resource.RUSAGE_CHILDREN)))
+        COLLECTOR.commands.append(entry)
+
+
+def iter_records(name, records, *, input_fp=None, output_fp=None):
+    # Wrap a record iterable to collect wall time, rusage, and record count of the loop; returns
+    # the iterable unchanged when metrics are disabled
+    if COLLECTOR is None:
+        return records
+    return iter_records_collect(name, records, input_fp, output_fp)
+
+
+def iter_records_collect(name, records, input_fp, output_fp):
+    entry = {'name': name, 'records': 0}
+    usage_start = get_rusage_total()
+    time_start = time.perf_counter()
+    try:
+        for record in records:
+            entry['records'] += 1
+            yield record
+    finally:
+        entry['wall_seconds'] = round(time.perf_counter() - time_start, 4)
+        entry.update(get_rusage_delta(usage_start, get_rusage_total()))
+        if entry['wall_seconds']:
+            entry['records_per_second'] = round(entry['records'] / entry['wall_seconds'], 1)
+        else:
+            entry['records_per_second'] = None
+        # NOTE: output files are generally still open when the loop completes so output sizes are
+        # instead obtained when metrics are written
+        entry['input_fp'] = str(input_fp) if input_fp else None
+        entry['input_bytes'] = get_file_size(input_fp)
+        entry['output_fp'] = str(output_fp) if output_fp else None
+        COLLECTOR.record_loops.append(entry)
+
+
+def get_rusage_total():
+    # Include children so that work done by process pools is captured
+    usage_self = resource.getrusage(resource.RUSAGE_SELF)
+    usage_children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return (
+        usage_self.ru_utime + usage_children.ru_utime,
+        usage_self.ru_stime + usage_children.ru_stime,
+        usage_self.ru_maxrss,
+    )
+
+
+def get_rusage_delta(usage_start, usage_end):
+    if isinstance(usage_start, resource.struct_rusage):
+        usage_start = (usage_start.ru_utime, usage_start.ru_stime, usage_start.ru_maxrss)
+        usage_end = (usage_end.ru_utime, usage_end.ru_stime, usage_end.ru_maxrss)
+    # NOTE: ru_maxrss is reported in kilobytes on Linux
+    return {
+        'user_cpu_seconds': round(usage_end[0] - usage_start[0], 4),
+        'system_cpu_seconds': round(usage_end[1] - usage_start[1], 4),
+        'max_rss_mb': round(usage_end[2] / 1024, 1),
+    }
+
+
+def get_file_size(fp):
+    if fp is None or not (fp := pathlib.Path(fp)).exists():
+        return None
+    return fp.stat().st_size
+
+
+def write(fp, command_name, wall_seconds):
+    usage_self = resource.getrusage(resource.RUSAGE_SELF)
+    usage_children = resource.getrusage(resource.RUSAGE_CHILDREN)
+
+    for entry in COLLECTOR.record_loops:
+        entry['output_bytes'] = get_file_size(entry['output_fp'])
+
+    data = {
+        'command': command_name,
+        'wall_seconds': round(wall_seconds, 4),
+        'user_cpu_seconds': round(usage_self.ru_utime, 4),
+        'system_cpu_seconds': round(usage_self.ru_stime, 4),
+        'max_rss_mb': round(usage_self.ru_maxrss / 1024, 1),
+        'children_user_cpu_seconds': round(usage_children.ru_utime, 4),
+        'children_system_cpu_seconds': round(usage_children.ru_stime, 4),
+        'children_max_rss_mb': round(usage_children.ru_maxrss / 1024, 1),
+        'commands': COLLECTOR.commands,
+        'record_loops': COLLECTOR.record_loops,
+    }
+
+    with open(fp, 'w') as fh:
+        json.dump(data, fh, indent=4)
+        fh.write('\n')
@@ -1,15 +1,26 @@
+import array
+import collections
+import concurrent.futures
 import csv
+import decimal
+import itertools
 import pathlib
 import re
 import shutil
 import tempfile
+import threading
 
 
 import cyvcf2
+import numpy as np
 
 
 from .. import util
+from ..common import annotation_table
+from ..common import bgzf
 from ..common import constants
+from ..common import metrics
+from ..common import pcgr_cache
 
 
 def prepare_vcf_somatic(input_fp, tumor_name, normal_name, output_dir):
@@ -25,45 +36,71 @@ def prepare_vcf_somatic(input_fp, tumor_name, normal_name, output_dir):
     # and normal FORMAT/AF and FORMAT/DP annotations as INFO annotations as required by PCGR.
 
     input_fh = cyvcf2.VCF(input_fp)
+    sample_indices = get_sample_indices_somatic(input_fh, tumor_name, normal_name)
 
+    output_fp = output_dir / f'{tumor_name}.pcgr_prep.vcf.gz'
+    output_fh = bgzf.VcfIndexedLineWriter(output_fp, get_minimal_header(input_fh))
+
+    records = metrics.iter_records(
+        f'{__name__}.prepare_vcf_somatic',
+        input_fh,
+        input_fp=input_fp,
+        output_fp=output_fp,
+    )
+    for records_batch in util.get_batches(records, 10_000):
+        write_prepared_records_somatic(output_fh, records_batch, sample_indices)
+
+    output_fh.close()
+
+    return output_fp
+
+
+def get_sample_indices_somatic(input_fh, tumor_name, normal_name):
     tumor_index = input_fh.samples.index(tumor_name)
     normal_index = input_fh.samples.index(normal_name)
     assert tumor_name != normal_name
     assert tumor_index != normal_index
+    return [tumor_index, normal_index]
 
-    output_fp = output_dir / f'{tumor_name}.pcgr_prep.vcf.gz'
-    output_fh = cyvcf2.Writer.from_string(output_fp, get_minimal_header(input_fh), 'wz')
 
-    for record in input_fh:
-        # Collect tumor and normal FORMAT/AF and FORMAT/DP
-        [tumor_dp] = record.format('DP')[tumor_index]
-        [tumor_af] = record.format('AF')[tumor_index]
-        [normal_dp] = record.format('DP')[normal_index]
-        [normal_af] = record.format('AF')[normal_index]
+def write_prepared_records_somatic(output_fh, records, sample_indices):
+    # Collect tumor and normal FORMAT/AF and FORMAT/DP for the batch of records
+    dps = [record.format('DP')[sample_indices, 0] for record in records]
+    afs = [record.format('AF')[sample_indices, 0] for record in records]
 
+    for record, (tumor_dp, normal_dp), (tumor_af, normal_af) in zip(records, dps, afs):
         # Manually create INFO entries
         info_entries = (
-            f'{constants.VcfInfo.TUMOR_AF.value}={tumor_af:.3}',
+            f'{constants.VcfInfo.TUMOR_AF.value}={format_float(f"{tumor_af:.3}")}',
             f'{constants.VcfInfo.TUMOR_DP.value}={tumor_dp}',
-            f'{constants.VcfInfo.NORMAL_AF.value}={normal_af:.3}',
+            f'{constants.VcfInfo.NORMAL_AF.value}={format_float(f"{normal_af:.3}")}',
             f'{constants.VcfInfo.NORMAL_DP.value}={normal_dp}',
         )
         info = ';'.join(info_entries)
 
         # Construct clean record containing new INFO data, also set FILTER=PASS and remove all
         # FORMAT and sample columns
-        record_variant_comps = str(record).split('\t')[:6]  # CHROM, POS, ID, REF, ALT, QUAL
-        record_str_new = '\t'.join([*record_variant_comps, 'PASS', info])
-        record_new = output_fh.variant_from_string(record_str_new)
-        output_fh.write_record(record_new)
-
-    output_fh.close()
-
-    # Index output
-    command = fr'''bcftools index -t {output_fp}'''
-    util.execute_command(command)
-
-    return output_fp
+        record_str_new = '\t'.join([
+            record.CHROM,
+            str(record.POS),
+            record.ID or '.',
+            record.REF,
+            ','.join(record.ALT) or '.',
+            '.' if record.QUAL is None else format_float(record.QUAL),
+            'PASS',
+            info,
+        ])
+        output_fh.write_line(f'{record_str_new}\n')
+
+
+def format_float(value):
+    # Format as htslib does when writing floats: six significant figures with ties rounded away
+    # from zero, and without trailing zeros
+    value = decimal.Decimal(value)
+    if not value:
+        return '0'
+    quantum = decimal.Decimal(1).scaleb(value.adjusted() - 5)
+    return f'{float(value.quantize(quantum, rounding=decimal.ROUND_HALF_UP)):g}'
 
 
 def prepare_vcf_germline(input_fp, normal_name, output_dir):
@@ -84,6 +121,7 @@ def get_minimal_header(input_fh):
     # Get a minimal VCF header for the PCGR input VCF
     # Filetype line
     filetype_line = '##fileformat=VCFv4.2'
+    filter_line = '##FILTER=<ID=PASS,Description="All filters passed">'
 
     # Chromosome lines
     # NOTE(SW): the purpose of using an existing header is to obtain compatibile contig size for
@@ -107,19 +145,110 @@ def get_minimal_header(input_fh):
     column_line = '#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO'
 
     # Construct and return
-    return '\n'.join([filetype_line, *chrom_lines, *format_lines, column_line])
+    return '\n'.join([filetype_line, filter_line, *chrom_lines, *format_lines, column_line])
+
 
+def run_somatic(input_fp, pcgr_refdata_dir, output_dir, threads=1, pcgr_conda=None, pcgrr_conda=None, purity=None, ploidy=None, sample_id=None, chunk_size=None, workers=1):
+    # Where chunk_size is set and the input has more records, PCGR is instead run on size-balanced
+    # chunks of the input, with up to workers concurrent PCGR instances, and the outputs used for
+    # annotation transfer are merged
+    pcgr_output_dir = output_dir / 'pcgr/'
+
+    if not sample_id:
+        sample_id = 'nosampleset'
+
+    run_kwargs = {
+        'pcgr_conda': pcgr_conda,
+        'pcgrr_conda': pcgrr_conda,
+        'purity': purity,
+        'ploidy': ploidy,
+        'sample_id': sample_id,
+    }
+
+    if chunk_size is None or (record_count := util.count_vcf_records(input_fp)) <= chunk_size:
+        run_somatic_pcgr(input_fp, pcgr_refdata_dir, pcgr_output_dir, threads=threads, **run_kwargs)
+        return pcgr_output_dir
+
+    chunk_count = -(-record_count // chunk_size)
+    workers = min(chunk_count, threads, workers)
+    worker_threads = max(threads // workers, 1)
+
+    with tempfile.TemporaryDirectory(prefix='pcgr_chunks.', dir=output_dir) as chunk_dir:
+        chunk_fps = write_chunks(input_fp, record_count, chunk_count, pathlib.Path(chunk_dir))
 
-def run_somatic(input_fp, pcgr_refdata_dir, output_dir, threads=1, pcgr_conda=None, pcgrr_conda=None, purity=None, ploidy=None, sample_id=None):
+        # Chunks that have not yet started are skipped on the first failure
+        chunk_failed = threading.Event()
+
+        def run_chunk(chunk_fp, chunk_output_dir):
+            if chunk_failed.is_set():
+                return None
+            try:
+                return run_somatic_pcgr(chunk_fp, pcgr_refdata_dir, chunk_output_dir, threads=worker_threads, **run_kwargs)
+            except BaseException:
+                chunk_failed.set()
+                raise
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = list()
+            for i, chunk_fp in enumerate(chunk_fps):
+                chunk_output_dir = pcgr_output_dir / f'chunk_{i:03}/'
+                futures.append(executor.submit(run_chunk, chunk_fp, chunk_output_dir))
+            chunk_output_dirs = [future.result() for future in futures]
+
+    merge_chunk_outputs(chunk_output_dirs, pcgr_output_dir, sample_id)
+
+    return pcgr_output_dir
+
+
+def write_chunks(input_fp, record_count, chunk_count, output_dir):
+    # Split records into contiguous chunks of near equal size so that chunk outputs remain sorted
+    # when concatenated in order
+    chunk_size_quot, chunk_size_rem = divmod(record_count, chunk_count)
+
+    input_fh = cyvcf2.VCF(input_fp)
+    records = iter(input_fh)
+
+    chunk_fps = list()
+    for i in range(chunk_count):
+        chunk_fp = output_dir / f'chunk_{i:03}.vcf.gz'
+        chunk_fh = bgzf.VcfIndexedWriter(chunk_fp, input_fh)
+        for record in itertools.islice(records, chunk_size_quot + (i < chunk_size_rem)):
+            chunk_fh.write_record(record)
+        chunk_fh.close()
+        chunk_fps.append(chunk_fp)
+
+    assert next(records, None) is None
+    return chunk_fps
+
+
+def merge_chunk_outputs(chunk_output_dirs, output_dir, sample_id):
+    # Merge only the PCGR outputs used for annotation transfer; all other outputs (e.g. reports)
+    # remain for each chunk
+    tsv_name = f'{sample_id}.pcgr_acmg.grch38.snvs_indels.tiers.tsv'
+    vcf_name = f'{sample_id}.pcgr_acmg.grch38.vcf.gz'
+
+    with (output_dir / tsv_name).open('w') as output_fh:
+        for i, chunk_output_dir in enumerate(chunk_output_dirs):
+            with (chunk_output_dir / tsv_name).open('r') as chunk_fh:
+                header_line = chunk_fh.readline()
+                if i == 0:
+                    output_fh.write(header_line)
+                shutil.copyfileobj(chunk_fh, output_fh)
+
+    vcf_fps_str = ' '.join(str(d / vcf_name) for d in chunk_output_dirs)
+    command = fr'''
+        bcftools concat -Oz -o {output_dir / vcf_name} {vcf_fps_str} && \
+            bcftools index -t {output_dir / vcf_name}
+    '''
+    util.execute_command(command)
+
+
+def run_somatic_pcgr(input_fp, pcgr_refdata_dir, pcgr_output_dir, threads=1, pcgr_conda=None, pcgrr_conda=None, purity=None, ploidy=None, sample_id=None):
 
     # NOTE(SW): Nextflow FusionFS v2.2.8 does not support PCGR output to S3; instead write to a
     # temporary directory outside of the FusionFS mounted directory then manually copy across
 
     temp_dir = tempfile.TemporaryDirectory()
-    pcgr_output_dir = output_dir / 'pcgr/'
-
-    if not sample_id:
-        sample_id = 'nosampleset'
 
     command_args = [
         f'--sample_id {sample_id}',
@@ -240,7 +369,67 @@ def run_germline(input_fp, panel_fp, pcgr_refdata_dir, output_dir, threads=1, pc
     return cpsr_output_dir
 
 
-def transfer_annotations_somatic(input_fp, tumor_name, filter_name, pcgr_dir, output_dir):
+def run_somatic_cached(input_fp, tumor_name, pcgr_refdata_dir, cache_fp, output_dir, **kwargs):
+    # Run PCGR only for variants without cached annotations, then add the new annotations to the
+    # cache and return annotation data for all variants. Sample-level PCGR outputs (e.g. reports)
+    # therefore only cover uncached variants
+    data_version = pcgr_cache.get_data_version(pcgr_refdata_dir)
+
+    uncached_fp = output_dir / f'{tumor_name}.pcgr_prep.uncached.vcf.gz'
+    input_fh = cyvcf2.VCF(input_fp)
+    uncached_fh = bgzf.VcfIndexedWriter(uncached_fp, input_fh)
+
+    pcgr_data = annotation_table.AnnotationTable()
+    cached_keys = list()
+    uncached_count = 0
+    records = metrics.iter_records(
+        f'{__name__}.run_somatic_cached',
+        input_fh,
+        input_fp=input_fp,
+        output_fp=uncached_fp,
+    )
+    with pcgr_cache.open_cache(cache_fp) as conn:
+        for records_batch in util.get_batches(records, 10_000):
+            keys = [get_record_key(record) for record in records_batch]
+            pcgr_data_batch = pcgr_cache.get_annotations(conn, data_version, keys)
+            for key, record in zip(keys, records_batch):
+                if (record_ann := pcgr_data_batch.get(key)) is not None:
+                    # NOTE: repeated input variants share a single entry
+                    if key not in pcgr_data:
+                        pcgr_data.add(key, record_ann)
+                        cached_keys.append(key)
+                else:
+                    uncached_fh.write_record(record)
+                    uncached_count += 1
+        pcgr_cache.set_last_used(conn, data_version, cached_keys)
+    uncached_fh.close()
+
+    if not uncached_count:
+        return pcgr_data
+
+    pcgr_dir = run_somatic(uncached_fp, pcgr_refdata_dir, output_dir, **kwargs)
+    pcgr_data_uncached = collect_somatic_annotation_data(pcgr_dir)
+
+    # NOTE: the cache is not held open while PCGR runs so that it can be used by other processes
+    with pcgr_cache.open_cache(cache_fp) as conn:
+        pcgr_cache.put_annotations(conn, data_version, pcgr_data_uncached)
+
+    for key, record_ann in pcgr_data_uncached.items():
+        pcgr_data.add(key, record_ann)
+    return pcgr_data
+
+
+def collect_somatic_annotation_data(pcgr_dir):
+    # Gather PCGR annotation data for records into a compact annotation table
+    return collect_annotation_table(*get_somatic_annotation_sources(pcgr_dir), TSV_SOURCE_PCGR)
+
+
+def stream_somatic_annotation_data(pcgr_dir):
+    # As collect_somatic_annotation_data but joined while transferring annotations
+    return StreamedAnnotations(*get_somatic_annotation_sources(pcgr_dir), TSV_SOURCE_PCGR)
+
+
+def get_somatic_annotation_sources(pcgr_dir):
     # Set destination INFO field names and source TSV fields
     info_field_map = {
         constants.VcfInfo.PCGR_MUTATION_HOTSPOT: 'MUTATION_HOTSPOT',
@@ -255,35 +444,44 @@ def transfer_annotations_somatic(input_fp, tumor_name, filter_name, pcgr_dir, ou
     # Enforce matching defined and source INFO annotations
     check_annotation_headers(info_field_map, pcgr_vcf_fp)
 
-    # Gather PCGR annotation data for records
-    pcgr_data = collect_pcgr_annotation_data(pcgr_tsv_fp, pcgr_vcf_fp, info_field_map)
-
-    # Open filehandles, set required header entries
-    input_fh = cyvcf2.VCF(input_fp)
+    return pcgr_tsv_fp, pcgr_vcf_fp, info_field_map
 
-    util.add_vcf_header_entry(input_fh, constants.VcfInfo.PCGR_TIER)
-    util.add_vcf_header_entry(input_fh, constants.VcfInfo.PCGR_CSQ)
-    util.add_vcf_header_entry(input_fh, constants.VcfInfo.PCGR_MUTATION_HOTSPOT)
-    util.add_vcf_header_entry(input_fh, constants.VcfInfo.PCGR_CLINVAR_CLNSIG)
-    util.add_vcf_header_entry(input_fh, constants.VcfInfo.PCGR_COSMIC_COUNT)
-    util.add_vcf_header_entry(input_fh, constants.VcfInfo.PCGR_TCGA_PANCANCER_COUNT)
-    util.add_vcf_header_entry(input_fh, constants.VcfInfo.PCGR_ICGC_PCAWG_COUNT)
 
+def transfer_annotations_somatic(input_fp, tumor_name, filter_name, pcgr_data, output_dir, threads=1):
+    # Transfer annotations and write to output
     output_fp = output_dir / f'{tumor_name}.annotations.vcf.gz'
-    output_fh = cyvcf2.Writer(output_fp, input_fh, 'wz')
+    util.process_vcf_records(
+        input_fp,
+        output_fp,
+        transfer_annotations_somatic_record,
+        header_fn=add_annotation_header_entries_somatic,
+        threads=threads,
+        filter_name=filter_name,
+        pcgr_data=pcgr_data,
+    )
+
+    return output_fp
 
-    # Transfer annotations and write to output
-    for record in input_fh:
-        # Do not process chrM since *snvs_indels.tiers.tsv does not include these annotations
-        if record.CHROM == 'chrM':
-            continue
-        # Immediately print out variants that were not annotated
-        if filter_name in record.FILTERS:
-            output_fh.write_record(record)
-            continue
-        # Annotate and write
-        record_ann = annotate_record(record, pcgr_data)
-        output_fh.write_record(record_ann)
+
+def add_annotation_header_entries_somatic(fh):
+    util.add_vcf_header_entry(fh, constants.VcfInfo.PCGR_TIER)
+    util.add_vcf_header_entry(fh, constants.VcfInfo.PCGR_CSQ)
+    util.add_vcf_header_entry(fh, constants.VcfInfo.PCGR_MUTATION_HOTSPOT)
+    util.add_vcf_header_entry(fh, constants.VcfInfo.PCGR_CLINVAR_CLNSIG)
+    util.add_vcf_header_entry(fh, constants.VcfInfo.PCGR_COSMIC_COUNT)
+    util.add_vcf_header_entry(fh, constants.VcfInfo.PCGR_TCGA_PANCANCER_COUNT)
+    util.add_vcf_header_entry(fh, constants.VcfInfo.PCGR_ICGC_PCAWG_COUNT)
+
+
+def transfer_annotations_somatic_record(record, filter_name, pcgr_data):
+    # Do not process chrM since *snvs_indels.tiers.tsv does not include these annotations
+    if record.CHROM == 'chrM':
+        return None
+    # Immediately return variants that were not annotated
+    if filter_name in record.FILTERS:
+        return record
+    # Annotate
+    return annotate_record(record, pcgr_data)
 
 
 def transfer_annotations_germline(input_fp, normal_name, cpsr_dir, output_dir):
@@ -301,8 +499,8 @@ def transfer_annotations_germline(input_fp, normal_name, cpsr_dir, output_dir):
     # Enforce matching defined and source INFO annotations
     check_annotation_headers(info_field_map, cpsr_vcf_fp)
 
-    # Gather CPSR annotation data for records
-    cpsr_data = collect_cpsr_annotation_data(cpsr_tsv_fp, cpsr_vcf_fp, info_field_map)
+    # Join CPSR annotation data for records while transferring
+    cpsr_data = StreamedAnnotations(cpsr_tsv_fp, cpsr_vcf_fp, info_field_map, TSV_SOURCE_CPSR)
 
     # Open filehandles, set required header entries
     input_fh = cyvcf2.VCF(input_fp)
@@ -316,7 +514,13 @@ def transfer_annotations_germline(input_fp, normal_name, cpsr_dir, output_dir):
     output_fh = cyvcf2.Writer(output_fp, input_fh, 'wz')
 
     # Transfer annotations and write to output
-    for record in input_fh:
+    records = metrics.iter_records(
+        f'{__name__}.transfer_annotations_germline',
+        input_fh,
+        input_fp=input_fp,
+        output_fp=output_fp,
+    )
+    for record in records:
         # Do not process chrM since *snvs_indels.tiers.tsv does not include these annotations
         if record.CHROM == 'chrM':
             continue
@@ -344,104 +548,167 @@ def check_annotation_headers(info_field_map, vcf_fp):
         assert  header_src_description_unquoted == header_dst_entry['Description']
 
 
-def collect_pcgr_annotation_data(tsv_fp, vcf_fp, info_field_map):
-    # Gather all annotations from TSV
-    data_tsv = dict()
-    with open(tsv_fp, 'r') as tsv_fh:
-        for record in csv.DictReader(tsv_fh, delimiter='\t'):
-            key, record_ann = get_annotation_entry_tsv(record, info_field_map)
-            assert key not in data_tsv
+def collect_annotation_table(tsv_fp, vcf_fp, info_field_map, tsv_source):
+    # Gather annotations into an annotation table, reading the VCF on another thread while the TSV
+    # is parsed
+    # NOTE: both readers run Python loops that hold the GIL and so only partly overlap
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+        vcf_entries_future = executor.submit(get_annotation_entries_vcf, vcf_fp, info_field_map)
 
-            # Process PCGR_TIER
-            # TIER_1, TIER_2, TIER_3, TIER_4, NONCODING
-            record_ann[constants.VcfInfo.PCGR_TIER] = record['TIER'].replace(' ', '_')
-
-            # Count COSMIC hits
-            if record['COSMIC_MUTATION_ID'] == 'NA':
-                cosmic_count = 0
-            else:
-                cosmic_count = len(record['COSMIC_MUTATION_ID'].split('&'))
-            record_ann[constants.VcfInfo.PCGR_COSMIC_COUNT] = cosmic_count
-
-            # Count ICGC-PCAWG hits by taking sum of affected donors where the annotation value has
-            # the following format: project_code|tumor_type|affected_donors|tested_donors|frequency
-            icgc_pcawg_count = 0
-            if record['ICGC_PCAWG_OCCURRENCE'] != 'NA':
-                for pcawg_hit_data in record['ICGC_PCAWG_OCCURRENCE'].split(','):
-                    pcawrg_hit_data_fields = pcawg_hit_data.split('|')
-                    affected_donors = int(pcawrg_hit_data_fields[2])
-                    icgc_pcawg_count += affected_donors
-                assert icgc_pcawg_count > 0
-            record_ann[constants.VcfInfo.PCGR_ICGC_PCAWG_COUNT] = icgc_pcawg_count
-
-            # Store annotation data
-            data_tsv[key] = record_ann
+        table = annotation_table.AnnotationTable()
+        columns = read_tsv_columns(tsv_fp, get_tsv_source_columns(tsv_source, info_field_map))
+        for key, record_ann in tsv_source.entries_fn(columns, info_field_map):
+            table.add(key, record_ann)
+        del columns
 
-    # Gather data from VCF
-    data_vcf = get_annotations_vcf(vcf_fp, info_field_map)
-
-    # Compile annotations, prefering TSV source
-    return compile_annotation_data(data_tsv, data_vcf)
-
-
-def collect_cpsr_annotation_data(tsv_fp, vcf_fp, info_field_map):
-    # Gather annotations from TSV
-    data_tsv = dict()
-    gdot_re = re.compile('^(?P<chrom>[\dXYM]+):g\.(?P<pos>\d+)(?P<ref>[A-Z]+)>(?P<alt>[A-Z]+)$')
-    with open(tsv_fp, 'r') as tsv_fh:
-        for record in csv.DictReader(tsv_fh, delimiter='\t'):
-            # Decompose CPSR 'GENOMIC_CHANGE' field into CHROM, POS, REF, and ALT
-            re_result = gdot_re.match(record['GENOMIC_CHANGE'])
-            if not re_result:
-                print(record['GENOMIC_CHANGE'])
-                assert re_result
-            record['CHROM'] = re_result.group('chrom')
-            record['POS'] = re_result.group('pos')
-            record['REF'] = re_result.group('ref')
-            record['ALT'] = re_result.group('alt')
-
-            key, record_ann = get_annotation_entry_tsv(record, info_field_map)
-            assert key not in data_tsv
-            data_tsv[key] = record_ann
+        vcf_entries = vcf_entries_future.result()
+
+    # Add VCF data, prefering TSV source
+    for key, record_ann in vcf_entries:
+        if key in table:
+            table.fill(key, record_ann)
+        else:
+            table.add(key, record_ann)
+
+    return table
+
+
+def get_annotation_entries_vcf(vcf_fp, info_field_map):
+    records = metrics.iter_records(
+        f'{__name__}.get_annotation_entries_vcf',
+        cyvcf2.VCF(vcf_fp),
+        input_fp=vcf_fp,
+    )
+    return [get_annotation_entry_vcf(record, info_field_map) for record in records]
+
+
+# PCGR and CPSR TSV outputs are read by column. Sources define the columns required to set variant
+# keys, a function returning keys from those columns, other required columns, and a function
+# returning (key, annotation) entries from all required columns; INFO source columns given in an
+# info_field_map are also read
+TsvSource = collections.namedtuple('TsvSource', ['key_columns', 'keys_fn', 'columns', 'entries_fn'])
+
+
+def get_tsv_source_columns(tsv_source, info_field_map):
+    return (*tsv_source.key_columns, *tsv_source.columns, *info_field_map.values())
+
+
+def get_annotation_keys_tsv_pcgr(columns):
+    # Set lookup key; PCGR strips leading 'chr' from contig names
+    return list(zip(
+        [f'chr{chrom}' for chrom in columns['CHROM']],
+        [int(pos) for pos in columns['POS']],
+        columns['REF'],
+        columns['ALT'],
+    ))
+
+
+def get_annotation_entries_tsv_pcgr(columns, info_field_map):
+    keys = get_annotation_keys_tsv_pcgr(columns)
+
+    # Process PCGR_TIER
+    # TIER_1, TIER_2, TIER_3, TIER_4, NONCODING
+    tiers = [tier.replace(' ', '_') for tier in columns['TIER']]
+
+    # NOTE: hit counts are taken per value from the projected columns; NumPy string operations were
+    # slower than these str methods when measured, as values must first be copied into NumPy arrays
+
+    # Count COSMIC hits
+    cosmic_counts = [0 if value == 'NA' else value.count('&') + 1 for value in columns['COSMIC_MUTATION_ID']]
+
+    # Count ICGC-PCAWG hits by taking sum of affected donors where the annotation value has
+    # the following format: project_code|tumor_type|affected_donors|tested_donors|frequency
+    icgc_pcawg_counts = list()
+    for value in columns['ICGC_PCAWG_OCCURRENCE']:
+        icgc_pcawg_count = 0
+        if value != 'NA':
+            icgc_pcawg_count = sum(int(hit_data.split('|')[2]) for hit_data in value.split(','))
+            assert icgc_pcawg_count > 0
+        icgc_pcawg_counts.append(icgc_pcawg_count)
+
+    entries = get_annotation_entries_tsv(keys, columns, info_field_map)
+    for (key, record_ann), tier, cosmic_count, icgc_pcawg_count in zip(entries, tiers, cosmic_counts, icgc_pcawg_counts):
+        record_ann[constants.VcfInfo.PCGR_TIER] = tier
+        record_ann[constants.VcfInfo.PCGR_COSMIC_COUNT] = cosmic_count
+        record_ann[constants.VcfInfo.PCGR_ICGC_PCAWG_COUNT] = icgc_pcawg_count
+        yield key, record_ann
+
+
+CPSR_GDOT_RE = re.compile(r'^(?P<chrom>[\dXYM]+):g\.(?P<pos>\d+)(?P<ref>[A-Z]+)>(?P<alt>[A-Z]+)$')
 
-    # Gather annotations from VCF
-    data_vcf = get_annotations_vcf(vcf_fp, info_field_map)
 
-    # Compile annotations, prefering TSV source
-    return compile_annotation_data(data_tsv, data_vcf)
+def get_annotation_keys_tsv_cpsr(columns):
+    keys = list()
+    for genomic_change in columns['GENOMIC_CHANGE']:
+        # Decompose CPSR 'GENOMIC_CHANGE' field into CHROM, POS, REF, and ALT
+        re_result = CPSR_GDOT_RE.match(genomic_change)
+        if not re_result:
+            print(genomic_change)
+            assert re_result
+        chrom, pos, ref, alt = re_result.group('chrom', 'pos', 'ref', 'alt')
+        keys.append((f'chr{chrom}', int(pos), ref, alt))
+    return keys
 
 
-def get_annotations_vcf(vcf_fp, info_field_map):
-    data_vcf = dict()
-    for record in cyvcf2.VCF(vcf_fp):
-        # Set lookup key; PCGR strips leading 'chr' from contig names
-        assert len(record.ALT) == 1
-        [alt] = record.ALT
-        key = (f'chr{record.CHROM}', record.POS, record.REF, alt)
-        assert key not in data_vcf
+def get_annotation_entries_tsv_cpsr(columns, info_field_map):
+    keys = get_annotation_keys_tsv_cpsr(columns)
+    return get_annotation_entries_tsv(keys, columns, info_field_map)
 
-        data_vcf[key] = dict()
-        for info_dst, info_src in info_field_map.items():
-            if (info_val := record.INFO.get(info_src)):
-                data_vcf[key][info_dst] = info_val
 
-    return data_vcf
+def get_annotation_entries_tsv(keys, columns, info_field_map):
+    # Values that are empty or 'NA' are excluded
+    field_columns = [(info_dst, columns[info_src]) for info_dst, info_src in info_field_map.items() if info_src in columns]
+    for i, key in enumerate(keys):
+        record_ann = dict()
+        for info_dst, values in field_columns:
+            if (info_val := values[i]) and info_val != 'NA':
+                record_ann[info_dst] = info_val
+        yield key, record_ann
 
 
-def get_annotation_entry_tsv(record, info_field_map):
-    # Set lookup key; PCGR/CPSR strips leading 'chr' from contig names
-    chrom = f'chr{record["CHROM"]}'
-    pos = int(record['POS'])
-    key = (chrom, pos, record['REF'], record['ALT'])
+TSV_SOURCE_PCGR = TsvSource(
+    key_columns=('CHROM', 'POS', 'REF', 'ALT'),
+    keys_fn=get_annotation_keys_tsv_pcgr,
+    columns=('TIER', 'COSMIC_MUTATION_ID', 'ICGC_PCAWG_OCCURRENCE'),
+    entries_fn=get_annotation_entries_tsv_pcgr,
+)
+
+
+TSV_SOURCE_CPSR = TsvSource(
+    key_columns=('GENOMIC_CHANGE',),
+    keys_fn=get_annotation_keys_tsv_cpsr,
+    columns=(),
+    entries_fn=get_annotation_entries_tsv_cpsr,
+)
+
+
+def read_tsv_columns(tsv_fp, columns):
+    with open(tsv_fp, 'r', newline='') as tsv_fh:
+        reader = csv.reader(tsv_fh, delimiter='\t')
+        header = next(reader)
+        # NOTE: blank lines are skipped as with csv.DictReader
+        return get_tsv_columns(header, (row for row in reader if row), columns)
+
+
+def get_tsv_columns(header, rows, columns):
+    # Returns a list of values for each of the given columns present in the header, keeping only
+    # those columns from each row
+    columns_present = [c for c in dict.fromkeys(columns) if c in header]
+    indices = [header.index(c) for c in columns_present]
+    values = [[row[i] for i in indices] for row in rows]
+    return {c: [row[j] for row in values] for j, c in enumerate(columns_present)}
+
+
+def get_annotation_entry_vcf(record, info_field_map):
+    # Set lookup key; PCGR strips leading 'chr' from contig names
+    assert len(record.ALT) == 1
+    [alt] = record.ALT
+    key = (f'chr{record.CHROM}', record.POS, record.REF, alt)
 
     record_ann = dict()
     for info_dst, info_src in info_field_map.items():
-        if not (info_val := record.get(info_src)):
-            continue
-        elif info_val == 'NA':
-            continue
-
-        record_ann[info_dst] = info_val
+        if (info_val := record.INFO.get(info_src)):
+            record_ann[info_dst] = info_val
 
     return key, record_ann
 
@@ -454,20 +721,182 @@ def compile_annotation_data(data_tsv, data_vcf):
         if key not in annotations:
             annotations[key] = dict()
 
-        for info_name, info_val in data_vcf_record.items():
+        compile_annotation_record(annotations[key], data_vcf_record)
+    return annotations
 
-            if info_name in annotations[key]:
-                continue
 
-            annotations[key][info_name] = info_val
-    return annotations
+def compile_annotation_record(record_ann, data_vcf_record):
+    for info_name, info_val in data_vcf_record.items():
 
+        if info_name in record_ann:
+            continue
 
-def annotate_record(record, annotations, *, allow_missing=False):
-    # Get lookup key
+        record_ann[info_name] = info_val
+    return record_ann
+
+
+class StreamedAnnotations:
+    # Annotations joined from PCGR/CPSR TSV and VCF outputs while walking alongside the input VCF so
+    # that only annotations at the current position are held in memory, with the same lookup
+    # interface and TSV-over-VCF precedence as compile_annotation_data. Lookups must be made in
+    # position order within each contig. The TSV is indexed by coordinate once and rows are read
+    # in position order for each contig; the VCF is queried by contig with its TBI index and read
+    # a batch ahead on another thread.
+    #
+    # NOTE: filehandles and the reader thread are created on first use of a contig so that
+    # instances can be shared with forked processes that each handle different contigs
+
+    def __init__(self, tsv_fp, vcf_fp, info_field_map, tsv_source):
+        self.tsv_fp = tsv_fp
+        self.vcf_fp = vcf_fp
+        self.info_field_map = info_field_map
+        self.tsv_source = tsv_source
+
+        self.tsv_header, self.tsv_index, self.tsv_contig_codes = index_annotations_tsv(tsv_fp, tsv_source)
+
+        self.contig = None
+        self.position = None
+        self.window = dict()
+        self.tsv_entries = None
+        self.vcf_entries = None
+        self.executor = None
+
+    def __contains__(self, key):
+        return key in self.get_window(key)
+
+    def __getitem__(self, key):
+        return self.get_window(key)[key]
+
+    def get_window(self, key):
+        contig, position, *_ = key
+        if contig != self.contig:
+            self.set_contig(contig)
+        if position != self.position:
+            assert self.position is None or position > self.position
+            self.set_position(position)
+        return self.window
+
+    def set_contig(self, contig):
+        self.contig = contig
+        self.position = None
+        if self.executor is None:
+            self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self.tsv_entries = PeekableIterator(self.iter_tsv_entries(contig))
+        self.vcf_entries = PeekableIterator(iter_read_ahead(self.iter_vcf_entries(contig), self.executor))
+
+    def set_position(self, position):
+        self.position = position
+
+        data_tsv = dict()
+        for key, record_ann in self.tsv_entries.take_until(position):
+            assert key not in data_tsv
+            data_tsv[key] = record_ann
+
+        data_vcf = dict()
+        for key, record_ann in self.vcf_entries.take_until(position):
+            assert key not in data_vcf
+            data_vcf[key] = record_ann
+
+        self.window = compile_annotation_data(data_tsv, data_vcf)
+
+    def iter_tsv_entries(self, contig):
+        contig_codes, positions, offsets = self.tsv_index
+        if (contig_code := self.tsv_contig_codes.get(contig)) is None:
+            return
+        contig_rows = np.flatnonzero(contig_codes == contig_code)
+        contig_rows = contig_rows[np.argsort(positions[contig_rows], kind='stable')]
+
+        # Rows are read in batches and only required columns are kept
+        columns = get_tsv_source_columns(self.tsv_source, self.info_field_map)
+        with open(self.tsv_fp, 'rb') as tsv_fh:
+            for offsets_batch in util.get_batches(offsets[contig_rows].tolist(), 1_000):
+                lines = (read_line_at(tsv_fh, offset) for offset in offsets_batch)
+                rows = csv.reader(lines, delimiter='\t')
+                columns_batch = get_tsv_columns(self.tsv_header, rows, columns)
+                yield from self.tsv_source.entries_fn(columns_batch, self.info_field_map)
+
+    def iter_vcf_entries(self, contig):
+        # PCGR/CPSR strips leading 'chr' from contig names
+        vcf_fh = cyvcf2.VCF(self.vcf_fp)
+        vcf_contig = contig.removeprefix('chr')
+        if vcf_contig not in vcf_fh.seqnames:
+            return
+        for record in vcf_fh(vcf_contig):
+            yield get_annotation_entry_vcf(record, self.info_field_map)
+
+
+def iter_read_ahead(iterable, executor, batch_size=1_000):
+    # Read the next batch of items on the executor while the current batch is consumed
+    batches = util.get_batches(iterable, batch_size)
+    future = executor.submit(next, batches, None)
+    while (batch := future.result()) is not None:
+        future = executor.submit(next, batches, None)
+        yield from batch
+
+
+class PeekableIterator:
+
+    def __init__(self, iterator):
+        self.iterator = iterator
+        self.head = next(self.iterator, None)
+
+    def take_until(self, position):
+        # Discard entries before position and return those at position; entries are (key, data)
+        entries = list()
+        while self.head is not None and self.head[0][1] <= position:
+            if self.head[0][1] == position:
+                entries.append(self.head)
+            self.head = next(self.iterator, None)
+        return entries
+
+
+def index_annotations_tsv(tsv_fp, tsv_source):
+    # Returns TSV header and, for each row, a contig code, position, and file offset; only the
+    # columns required for variant keys are parsed
+    with open(tsv_fp, 'rb') as tsv_fh:
+        header_line = tsv_fh.readline()
+        [header] = csv.reader([header_line.decode().rstrip('\r\n')], delimiter='\t')
+
+        offsets = array.array('q')
+        rows = csv.reader(iter_tsv_lines(tsv_fh, len(header_line), offsets), delimiter='\t')
+        keys = tsv_source.keys_fn(get_tsv_columns(header, rows, tsv_source.key_columns))
+
+    contig_codes = dict()
+    codes = array.array('i', (contig_codes.setdefault(contig, len(contig_codes)) for contig, *_ in keys))
+    positions = array.array('q', (position for _, position, *_ in keys))
+
+    index = (
+        np.frombuffer(codes, dtype=np.int32),
+        np.frombuffer(positions, dtype=np.int64),
+        np.frombuffer(offsets, dtype=np.int64),
+    )
+    return header, index, contig_codes
+
+
+def iter_tsv_lines(tsv_fh, offset, offsets):
+    # Decode lines, recording the file offset of each
+    # NOTE: blank lines are skipped as with csv.DictReader
+    for line in tsv_fh:
+        if line.strip():
+            offsets.append(offset)
+            yield line.decode()
+        offset += len(line)
+
+
+def read_line_at(fh, offset):
+    fh.seek(offset)
+    return fh.readline().decode()
+
+
+def get_record_key(record):
     assert len(record.ALT) == 1
     [alt] = record.ALT
-    key = (record.CHROM, record.POS, record.REF, alt)
+    return (record.CHROM, record.POS, record.REF, alt)
+
+
+def annotate_record(record, annotations, *, allow_missing=False):
+    # Get lookup key
+    key = get_record_key(record)
 
     # Handle missing entries
     if key not in annotations:
@@ -0,0 +1,134 @@
+import contextlib
+import hashlib
+import json
+import pathlib
+import sqlite3
+import time
+
+
+from . import constants
+
+
+# Persistent cache of per-variant PCGR annotations, as gathered by collect_annotation_table, in
+# a SQLite database. Entries are keyed by genome assembly, PCGR data version, and variant. Hits
+# update the entry's last use time, and the least recently used entries are evicted once the cache
+# exceeds its maximum number of entries.
+#
+# NOTE: lookups do not hold a transaction open between batches and last use times are set in a
+# single short write transaction, so that other processes are not locked out of the cache
+
+
+ASSEMBLY = 'grch38'
+MAX_ENTRIES = 5_000_000
+
+
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS annotations (
+        assembly TEXT NOT NULL,
+        data_version TEXT NOT NULL,
+        chrom TEXT NOT NULL,
+        pos INTEGER NOT NULL,
+        ref TEXT NOT NULL,
+        alt TEXT NOT NULL,
+        data TEXT NOT NULL,
+        last_used INTEGER NOT NULL,
+        PRIMARY KEY (assembly, data_version, chrom, pos, ref, alt)
+    );
+    CREATE INDEX IF NOT EXISTS annotations_last_used ON annotations (last_used);
+'''
+
+
+@contextlib.contextmanager
+def open_cache(fp):
+    pathlib.Path(fp).parent.mkdir(mode=0o755, parents=True, exist_ok=True)
+    # NOTE: a busy timeout allows concurrent processes to share the cache
+    conn = sqlite3.connect(fp, timeout=600)
+    try:
+        conn.executescript(SCHEMA)
+        yield conn
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def get_data_version(pcgr_refdata_dir):
+    # Release notes of the PCGR data bundle list the version of each resource; where these are not
+    # present, fall back to the resolved data directory path
+    release_notes_fp = pathlib.Path(pcgr_refdata_dir) / 'data' / ASSEMBLY / 'RELEASE_NOTES'
+    if release_notes_fp.exists():
+        return hashlib.sha256(release_notes_fp.read_bytes()).hexdigest()
+    return str(pathlib.Path(pcgr_refdata_dir).resolve())
+
+
+def get_annotations(conn, data_version, keys):
+    # Returns cached annotations for the given (CHROM, POS, REF, ALT) keys; hits must be marked as
+    # used with set_last_used
+    conn.execute('CREATE TEMP TABLE IF NOT EXISTS query (chrom TEXT, pos INTEGER, ref TEXT, alt TEXT)')
+    conn.execute('DELETE FROM query')
+    conn.executemany('INSERT INTO query VALUES (?, ?, ?, ?)', keys)
+
+    rows = conn.execute(
+        '''
+        SELECT a.chrom, a.pos, a.ref, a.alt, a.data
+        FROM query AS q
+        JOIN annotations AS a
+            ON a.assembly = ? AND a.data_version = ? AND
+               a.chrom = q.chrom AND a.pos = q.pos AND a.ref = q.ref AND a.alt = q.alt
+        ''',
+        (ASSEMBLY, data_version),
+    )
+
+    annotations = dict()
+    for chrom, pos, ref, alt, data in rows:
+        annotations[(chrom, pos, ref, alt)] = decode_annotation(data)
+
+    # NOTE: writes to the query table implicitly begin a transaction, which would otherwise hold a
+    # shared lock on the cache until the connection is committed
+    conn.commit()
+    return annotations
+
+
+def set_last_used(conn, data_version, keys):
+    last_used = time.time_ns()
+    with conn:
+        conn.executemany(
+            '''
+            UPDATE annotations SET last_used = ?
+            WHERE assembly = ? AND data_version = ? AND chrom = ? AND pos = ? AND ref = ? AND alt = ?
+            ''',
+            ((last_used, ASSEMBLY, data_version, *key) for key in keys),
+        )
+
+
+def put_annotations(conn, data_version, annotations, max_entries=MAX_ENTRIES):
+    last_used = time.time_ns()
+    conn.executemany(
+        'INSERT OR REPLACE INTO annotations VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+        (
+            (ASSEMBLY, data_version, *key, encode_annotation(annotation), last_used)
+            for key, annotation in annotations.items()
+        ),
+    )
+    evict(conn, max_entries)
+
+
+def evict(conn, max_entries):
+    [entry_count] = conn.execute('SELECT COUNT(*) FROM annotations').fetchone()
+    if entry_count <= max_entries:
+        return
+    conn.execute(
+        'DELETE FROM annotations WHERE rowid IN (SELECT rowid FROM annotations ORDER BY last_used, rowid LIMIT ?)',
+        (entry_count - max_entries,),
+    )
+
+
+def encode_annotation(annotation):
+    return json.dumps({info_enum.value: value for info_enum, value in annotation.items()})
+
+
+def decode_annotation(data):
+    # NOTE: JSON arrays are returned to tuples to match values obtained from cyvcf2
+    return {
+        constants.VcfInfo(name): tuple(value) if isinstance(value, list) else value
+        for name, value in json.loads(data).items()
+    }
@@ -0,0 +1,158 @@
+import array
+import hashlib
+import zlib
+
+
+import cyvcf2
+import numpy as np
+
+
+# Variant-level lookups using packed 64-bit keys: position in the upper 32 bits and a CRC32 of the
+# alleles in the lower 32 bits. A 64-bit check value is kept for each key so that variants with
+# colliding keys are not matched: short alleles are stored in the check exactly and others as an
+# independent hash. Keys and checks are sorted per contig with a parallel array of values. A Bloom
+# filter may be used to skip searches for absent keys.
+#
+# NOTE: variants are matched exactly, as done by vcfanno without -permissive-overlap
+
+
+OPS = {'self', 'first', 'max', 'min'}
+BLOOM_HASH_COUNT = 7
+
+
+def get_key(pos, ref, alt):
+    # Returns (key, check); hashed checks have the top bit set and so never equal an exact check
+    alleles = f'{ref}>{alt}'.encode()
+    if len(alleles) <= 7:
+        check = int.from_bytes(alleles, 'little')
+    else:
+        check = int.from_bytes(hashlib.blake2b(alleles, digest_size=8).digest(), 'little') | 1 << 63
+    return pos << 32 | zlib.crc32(alleles), check
+
+
+def get_record_key(record):
+    # NOTE: only the first ALT allele of multiallelic records is matched
+    alt = record.ALT[0] if record.ALT else '.'
+    return get_key(record.POS, record.REF, alt)
+
+
+def read_variant_values(fp, field, *, op='first'):
+    # Read values of an INFO field for each variant in a VCF as sorted keys, checks, and values per
+    # contig; where a variant occurs more than once, values are combined with op
+    assert op in OPS
+
+    contig_data = dict()
+    for record in cyvcf2.VCF(fp):
+        if (value := record.INFO.get(field)) is None:
+            continue
+
+        if (contig_arrays := contig_data.get(record.CHROM)) is None:
+            contig_arrays = contig_data[record.CHROM] = (array.array('Q'), array.array('Q'), array.array('d'))
+        keys, checks, values = contig_arrays
+
+        for i, alt in enumerate(record.ALT or ['.']):
+            # Number=A fields have a value for each ALT allele
+            allele_value = value[i] if isinstance(value, tuple) else value
+            key, check = get_key(record.POS, record.REF, alt)
+            keys.append(key)
+            checks.append(check)
+            values.append(float(allele_value))
+
+    return {contig: get_unique_sorted(*arrays, op) for contig, arrays in contig_data.items()}
+
+
+def get_unique_sorted(keys, checks, values, op):
+    keys = np.frombuffer(keys, dtype=np.uint64)
+    checks = np.frombuffer(checks, dtype=np.uint64)
+    values = np.frombuffer(values, dtype=np.float64)
+
+    # Stable sort by key then check retains the input order of duplicate variants for the first op
+    order = np.lexsort((checks, keys))
+    keys = keys[order]
+    checks = checks[order]
+    values = values[order]
+
+    # Index of the first of each run of identical variants
+    index = np.flatnonzero(np.concatenate(([True], (keys[1:] != keys[:-1]) | (checks[1:] != checks[:-1]))))
+    keys_unique = keys[index]
+    checks_unique = checks[index]
+    if op in {'self', 'first'}:
+        values_unique = values[index]
+    elif op == 'max':
+        values_unique = np.maximum.reduceat(values, index)
+    elif op == 'min':
+        values_unique = np.minimum.reduceat(values, index)
+    return keys_unique, checks_unique, values_unique
+
+
+def lookup(keys, checks, values, query_keys, query_checks, bloom=None):
+    # Returns a mask of query variants found and their values
+    query_keys = np.asarray(query_keys, dtype=np.uint64)
+    query_checks = np.asarray(query_checks, dtype=np.uint64)
+    found = np.zeros(len(query_keys), dtype=bool)
+    query_values = np.full(len(query_keys), np.nan)
+
+    candidates = np.arange(len(query_keys))
+    if bloom is not None and len(bloom):
+        candidates = candidates[bloom_contains(bloom, query_keys)]
+    if not len(candidates) or not len(keys):
+        return found, query_values
+
+    i = np.searchsorted(keys, query_keys[candidates])
+    i_valid = i < len(keys)
+    candidates = candidates[i_valid]
+    i = i[i_valid]
+
+    key_matched = keys[i] == query_keys[candidates]
+    candidates = candidates[key_matched]
+    i = i[key_matched]
+
+    # Search forward among any other variants with the same key where checks differ
+    check_matched = checks[i] == query_checks[candidates]
+    for j in np.flatnonzero(~check_matched):
+        i[j] = find_check(keys, checks, i[j], query_checks[candidates[j]])
+    check_matched = i >= 0
+
+    found[candidates[check_matched]] = True
+    query_values[candidates[check_matched]] = values[i[check_matched]]
+    return found, query_values
+
+
+def find_check(keys, checks, i, check):
+    # Returns the index of the variant with the key at i and the given check, otherwise -1
+    key = keys[i]
+    while i < len(keys) and keys[i] == key:
+        if checks[i] == check:
+            return i
+        i += 1
+    return -1
+
+
+def build_bloom(keys, bits_per_key=10):
+    bit_count = max(len(keys) * bits_per_key, 64)
+    bloom = np.zeros(-(-bit_count // 8), dtype=np.uint8)
+    for bit_index in get_bloom_indices(np.asarray(keys, dtype=np.uint64), len(bloom) * 8):
+        np.bitwise_or.at(bloom, bit_index >> 3, np.left_shift(1, bit_index & 7).astype(np.uint8))
+    return bloom
+
+
+def bloom_contains(bloom, keys):
+    contains = np.ones(len(keys), dtype=bool)
+    for bit_index in get_bloom_indices(keys, len(bloom) * 8):
+        contains &= ((bloom[bit_index >> 3] >> (bit_index & 7)) & 1).astype(bool)
+    return contains
+
+
+def get_bloom_indices(keys, bit_count):
+    # Double hashing with two splitmix64 mixes of each key
+    hash_a = mix64(keys)
+    hash_b = mix64(keys ^ np.uint64(0x9E3779B97F4A7C15)) | np.uint64(1)
+    for i in range(BLOOM_HASH_COUNT):
+        yield ((hash_a + np.uint64(i) * hash_b) % np.uint64(bit_count)).astype(np.int64)
+
+
+def mix64(values):
+    values = values + np.uint64(0x9E3779B97F4A7C15)
+    values = (values ^ (values >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    values = (values ^ (values >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return values ^ (values >> np.uint64(31))
@@ -0,0 +1,107 @@
+import json
+
+
+try:
+    import tomllib
+except ImportError:
+    import tomli as tomllib
+
+
+# Read, split, and write vcfanno TOML configuration. Only the structure used by vcfanno is supported
+# when writing: top-level keys and arrays of tables (i.e. [[annotation]] and [[postannotation]]) with
+# string, integer, boolean, and array values.
+
+
+def read_config(fp):
+    with open(fp, 'rb') as fh:
+        return tomllib.load(fh)
+
+
+def write_config(config, fp):
+    with open(fp, 'w') as fh:
+        for key, value in config.items():
+            if not is_table_array(value):
+                print(f'{key} = {json.dumps(value)}', file=fh)
+        for key, value in config.items():
+            if not is_table_array(value):
+                continue
+            for table in value:
+                print(f'\n[[{key}]]', file=fh)
+                for table_key, table_value in table.items():
+                    print(f'{table_key} = {json.dumps(table_value)}', file=fh)
+    return fp
+
+
+def is_table_array(value):
+    return isinstance(value, list) and value and all(isinstance(e, dict) for e in value)
+
+
+def split_region_flags(config, names):
+    # Separate annotations that set one of the given INFO flags from overlapping BED regions,
+    # returning these as (name, BED filepath) and the remaining configuration
+    region_flags = list()
+    annotations = list()
+    for annotation in config.get('annotation', list()):
+        if is_region_flag(annotation, names):
+            [name] = annotation['names']
+            region_flags.append((name, annotation['file']))
+        else:
+            annotations.append(annotation)
+
+    config_remaining = {k: v for k, v in config.items() if k != 'annotation'}
+    if annotations:
+        config_remaining['annotation'] = annotations
+    return region_flags, config_remaining
+
+
+def is_region_flag(annotation, names):
+    return (
+        annotation.get('ops') == ['flag'] and
+        len(annotation.get('names', list())) == 1 and
+        annotation['names'][0] in names and
+        annotation.get('file', '').endswith(('.bed', '.bed.gz'))
+    )
+
+
+def select_annotations(config, names):
+    # Returns annotations that set any of the given INFO fields
+    return [
+        annotation
+        for annotation in config.get('annotation', list())
+        if any(name in names for name in annotation.get('names', list()))
+    ]
+
+
+def split_variant_lookups(config, names, ops):
+    # Separate annotations that set one of the given INFO fields from a single field of matching VCF
+    # records, returning these as (name, VCF filepath, source field, op) and the remaining configuration
+    variant_lookups = list()
+    annotations = list()
+    for annotation in config.get('annotation', list()):
+        if is_variant_lookup(annotation, names, ops):
+            [name] = annotation['names']
+            [field] = annotation['fields']
+            [op] = annotation['ops']
+            variant_lookups.append((name, annotation['file'], field, op))
+        else:
+            annotations.append(annotation)
+
+    config_remaining = {k: v for k, v in config.items() if k != 'annotation'}
+    if annotations:
+        config_remaining['annotation'] = annotations
+    return variant_lookups, config_remaining
+
+
+def is_variant_lookup(annotation, names, ops):
+    return (
+        len(annotation.get('ops', list())) == 1 and
+        annotation['ops'][0] in ops and
+        len(annotation.get('fields', list())) == 1 and
+        len(annotation.get('names', list())) == 1 and
+        annotation['names'][0] in names and
+        annotation.get('file', '').endswith(('.vcf', '.vcf.gz', '.bcf'))
+    )
+
+
+def has_annotations(config):
+    return bool(config.get('annotation') or config.get('postannotation'))
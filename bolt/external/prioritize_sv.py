@@ -47,6 +47,9 @@ import sys
 import cyvcf2
 
 
+from ..common import metrics
+
+
 def run(
     sv_vcf,
     known_fusion_pairs,
@@ -96,7 +99,13 @@ def run(
     tsgenes = _read_list(key_tsgenes)
 
     # Read in gene lists
-    for rec in vcf:
+    records = metrics.iter_records(
+        f'{__name__}.run',
+        vcf,
+        input_fp=sv_vcf,
+        output_fp=output_fp,
+    )
+    for rec in records:
         rec = process_record(
             rec,
             princ_trs,
@@ -1,10 +1,22 @@
+import concurrent.futures
+import contextlib
+import gzip
+import itertools
+import multiprocessing
 import pathlib
+import struct
 import subprocess
 import sys
+import tempfile
 import textwrap
 
 
+import cyvcf2
+
+
+from .common import bgzf
 from .common import constants
+from .common import metrics
 
 
 # TODO(SW): create note that number this assumes location of `<root>/<package>/<file>`
@@ -20,13 +32,17 @@ def execute_command(command):
 
     print(command_prepared)
 
-    process = subprocess.run(
-        command_prepared,
-        shell=True,
-        executable='/bin/bash',
-        capture_output=True,
-        encoding='utf-8',
-    )
+    with metrics.record_command(command_prepared) as command_metrics:
+        process = subprocess.run(
+            command_prepared,
+            shell=True,
+            executable='/bin/bash',
+            capture_output=True,
+            encoding='utf-8',
+        )
+        if command_metrics is not None:
+            command_metrics['returncode'] = process.returncode
+            command_metrics['stdout_bytes'] = len(process.stdout)
 
     if process.returncode != 0:
         print(process)
@@ -36,6 +52,60 @@ def execute_command(command):
     return process
 
 
+@contextlib.contextmanager
+def execute_command_stdin(command):
+    # Execute command while streaming text to its stdin, which is closed on exit. Output is written
+    # to temporary files so that the process cannot block on full stdout or stderr pipes
+    command_prepared = command_prepare(command)
+
+    print(command_prepared)
+
+    with contextlib.ExitStack() as stack:
+        command_metrics = stack.enter_context(metrics.record_command(command_prepared))
+        stdout_fh = stack.enter_context(tempfile.TemporaryFile(mode='w+', encoding='utf-8'))
+        stderr_fh = stack.enter_context(tempfile.TemporaryFile(mode='w+', encoding='utf-8'))
+
+        process = subprocess.Popen(
+            command_prepared,
+            shell=True,
+            executable='/bin/bash',
+            stdin=subprocess.PIPE,
+            stdout=stdout_fh,
+            stderr=stderr_fh,
+            encoding='utf-8',
+        )
+
+        input_truncated = False
+        try:
+            yield process.stdin
+            process.stdin.close()
+        except BrokenPipeError:
+            # NOTE: the command exited before reading all input, which is reported below as a failure
+            # regardless of exit status since output would otherwise be silently truncated
+            input_truncated = True
+            with contextlib.suppress(BrokenPipeError):
+                process.stdin.close()
+        except BaseException:
+            process.kill()
+            process.wait()
+            raise
+        process.wait()
+
+        stdout_fh.seek(0)
+        stderr_fh.seek(0)
+        stdout = stdout_fh.read()
+        stderr = stderr_fh.read()
+
+        if command_metrics is not None:
+            command_metrics['returncode'] = process.returncode
+            command_metrics['stdout_bytes'] = len(stdout)
+
+    if process.returncode != 0 or input_truncated:
+        print(process)
+        print(stderr)
+        sys.exit(1)
+
+
 def command_prepare(command):
     return f'set -o pipefail; {textwrap.dedent(command)}'
 
@@ -53,8 +123,306 @@ def command_prepare(command):
 
 
 def count_vcf_records(fp):
-    result = execute_command(f'bcftools view -H {fp} | wc -l')
-    return int(result.stdout)
+    # Use record counts stored in the TBI or CSI index where available and current, otherwise
+    # count lines of the VCF
+    if (count := get_vcf_index_record_count(fp)) is not None:
+        return count
+    return count_vcf_lines(fp)
+
+
+def get_vcf_index_contigs(fp):
+    # Contig names are stored in the TBI index in the order in which they first appear in the VCF;
+    # returns None when no index is present
+    index_fp = pathlib.Path(f'{fp}.tbi')
+    if not index_fp.exists():
+        return None
+
+    with gzip.open(index_fp, 'rb') as fh:
+        magic, _n_ref = struct.unpack('<4si', fh.read(8))
+        assert magic == b'TBI\x01'
+        # format, col_seq, col_beg, col_end, meta, skip, l_nm
+        *_, l_nm = struct.unpack('<7i', fh.read(28))
+        names = fh.read(l_nm).split(b'\0')[:-1]
+
+    return [e.decode() for e in names]
+
+
+# Tabix pseudo-bin number, see SAMv1 specification section 5.2
+TBI_META_BIN = 37450
+
+
+def get_vcf_index_record_count(fp):
+    # Sum record counts from the pseudo-bin of each reference, see SAMv1 specification section 5.2
+    # and the CSIv1 specification; returns None where there is no index, the index is older than
+    # the VCF, or the index lacks record counts
+    for suffix in ('tbi', 'csi'):
+        index_fp = pathlib.Path(f'{fp}.{suffix}')
+        if index_fp.exists():
+            break
+    else:
+        return None
+
+    if index_fp.stat().st_mtime < pathlib.Path(fp).stat().st_mtime:
+        return None
+
+    with gzip.open(index_fp, 'rb') as fh:
+        data = fh.read()
+
+    magic = data[:4]
+    if magic == b'TBI\x01':
+        n_ref, = struct.unpack_from('<i', data, 4)
+        l_nm, = struct.unpack_from('<i', data, 32)
+        offset = 36 + l_nm
+        meta_bin = TBI_META_BIN
+        bin_loffset_size = 0
+    elif magic == b'CSI\x01':
+        _min_shift, depth, l_aux = struct.unpack_from('<3i', data, 4)
+        n_ref, = struct.unpack_from('<i', data, 16 + l_aux)
+        offset = 20 + l_aux
+        meta_bin = ((1 << ((depth + 1) * 3)) - 1) // 7 + 1
+        bin_loffset_size = 8
+    else:
+        return None
+
+    count = 0
+    for _ in range(n_ref):
+        n_bin, = struct.unpack_from('<i', data, offset)
+        offset += 4
+        n_mapped = None
+        for _ in range(n_bin):
+            bin_number, = struct.unpack_from('<I', data, offset)
+            offset += 4 + bin_loffset_size
+            n_chunk, = struct.unpack_from('<i', data, offset)
+            offset += 4
+            if bin_number == meta_bin:
+                # Pseudo-bin chunks hold the offset range and then mapped, unmapped record counts
+                n_mapped, _n_unmapped = struct.unpack_from('<QQ', data, offset + 16)
+            offset += n_chunk * 16
+        if n_mapped is None:
+            return None
+        count += n_mapped
+
+        # Bins are followed by the linear index in TBI
+        if magic == b'TBI\x01':
+            n_intv, = struct.unpack_from('<i', data, offset)
+            offset += 4 + n_intv * 8
+
+    # Optional count of records without coordinates
+    if offset + 8 <= len(data):
+        n_no_coor, = struct.unpack_from('<Q', data, offset)
+        count += n_no_coor
+
+    return count
+
+
+def count_vcf_lines(fp, chunk_size=1 << 20):
+    # Count non-header lines of a bgzip compressed or uncompressed VCF in-process; equivalent to
+    # bcftools view -H | wc -l for a well-formed VCF
+    with open(fp, 'rb') as fh:
+        is_gzip = fh.read(2) == b'\x1f\x8b'
+
+    count = 0
+    header = bytearray()
+    in_header = True
+    last_byte = b'\n'
+    with (gzip.open(fp, 'rb') if is_gzip else open(fp, 'rb')) as fh:
+        while (data := fh.read(chunk_size)):
+            if in_header:
+                header += data
+                if (header_end := get_vcf_header_end(header)) is None:
+                    continue
+                data = bytes(header[header_end:])
+                in_header = False
+                if not data:
+                    continue
+            count += data.count(b'\n')
+            last_byte = data[-1:]
+
+    # Final record may lack a trailing newline
+    if not in_header and last_byte != b'\n':
+        count += 1
+    return count
+
+
+def get_vcf_header_end(data):
+    # Offset of the first line not beginning with '#', or None if the header may continue beyond
+    # the given data
+    offset = 0
+    while offset < len(data):
+        if data[offset:offset+1] != b'#':
+            return offset
+        if (line_end := data.find(b'\n', offset)) == -1:
+            return None
+        offset = line_end + 1
+    return None
+
+
+def process_vcf_records(
+    input_fp,
+    output_fp,
+    record_fn,
+    *,
+    header_fn=None,
+    threads=1,
+    batch_size=None,
+    extra_outputs=None,
+    collect_fn=None,
+    **kwargs,
+):
+    # Apply record_fn to every record of the input VCF and write the returned records (None drops
+    # the record) to a bgzip compressed and indexed output VCF. The header_fn is applied to the
+    # input filehandle prior to processing so that any required header entries can be added.
+    #
+    # When batch_size is set, record_fn is instead given a list of up to batch_size records and
+    # must return an iterable of records to write.
+    #
+    # Additional outputs can be written in the same pass by providing extra_outputs, a mapping of
+    # filepath to a predicate; records are written to an additional output where the predicate
+    # returns True for the processed record. All outputs are indexed once written. Where
+    # given, collect_fn is called with each processed record in output order e.g. to gather summary
+    # data without reading the output again.
+    #
+    # Where more than one thread is requested and the input has a TBI index, records are processed
+    # by contig in a process pool and the shards are then concatenated in index order. Shards are
+    # written as uncompressed BCF and re-encoded by the same writer used for serial processing,
+    # hence output is byte-identical regardless of the number of threads.
+    outputs = {pathlib.Path(output_fp): None}
+    if extra_outputs:
+        outputs.update({pathlib.Path(fp): select_fn for fp, select_fn in extra_outputs.items()})
+
+    input_fh, records = get_processed_vcf_records(
+        input_fp,
+        record_fn,
+        header_fn=header_fn,
+        threads=threads,
+        batch_size=batch_size,
+        shard_parent_dir=pathlib.Path(output_fp).parent,
+        **kwargs,
+    )
+
+    output_fhs = [(bgzf.VcfIndexedWriter(fp, input_fh), select_fn) for fp, select_fn in outputs.items()]
+
+    loop_name = f'{record_fn.__module__}.{record_fn.__name__}'
+    records = metrics.iter_records(
+        loop_name,
+        records,
+        input_fp=input_fp,
+        output_fp=output_fp,
+    )
+    for record in records:
+        for output_fh, select_fn in output_fhs:
+            if select_fn is None or select_fn(record):
+                output_fh.write_record(record)
+        if collect_fn:
+            collect_fn(record)
+
+    for output_fh, _ in output_fhs:
+        output_fh.close()
+
+    return pathlib.Path(output_fp)
+
+
+def get_processed_vcf_records(
+    input_fp,
+    record_fn,
+    *,
+    header_fn=None,
+    threads=1,
+    batch_size=None,
+    shard_parent_dir=None,
+    **kwargs,
+):
+    # Returns the input filehandle with header_fn applied and an iterator of processed records in
+    # input order, as written by process_vcf_records. Shards are written to a temporary directory
+    # within shard_parent_dir
+    input_fh = cyvcf2.VCF(input_fp)
+    if header_fn:
+        header_fn(input_fh)
+
+    contigs = get_vcf_index_contigs(input_fp) if threads > 1 else None
+    if contigs:
+        records = process_vcf_records_sharded(
+            input_fp, contigs, record_fn, header_fn, threads, batch_size, kwargs, shard_parent_dir,
+        )
+    else:
+        records = process_vcf_region(input_fh, None, record_fn, batch_size, kwargs)
+
+    return input_fh, records
+
+
+def split_threads(threads, count):
+    # Divide threads between concurrent stages as evenly as possible, with at least one for each
+    quot, rem = divmod(threads, count)
+    return [max(quot + (i < rem), 1) for i in range(count)]
+
+
+def process_vcf_records_sharded(input_fp, contigs, record_fn, header_fn, threads, batch_size, kwargs, shard_parent_dir):
+    # NOTE: processes are forked so that record_fn, header_fn, and kwargs (which may hold large
+    # annotation data) are inherited by workers rather than pickled for each task
+    mp_context = multiprocessing.get_context('fork')
+    initargs = (record_fn, header_fn, batch_size, kwargs)
+
+    with (
+        tempfile.TemporaryDirectory(prefix='bolt_shards.', dir=shard_parent_dir) as shard_dir,
+        concurrent.futures.ProcessPoolExecutor(
+            max_workers=threads,
+            mp_context=mp_context,
+            initializer=set_vcf_shard_task,
+            initargs=initargs,
+        ) as executor,
+    ):
+
+        futures = list()
+        for i, contig in enumerate(contigs):
+            shard_fp = pathlib.Path(shard_dir) / f'{i:05}.bcf'
+            futures.append(executor.submit(process_vcf_shard, input_fp, contig, shard_fp))
+
+        # Yield shard records in order as they become available
+        for future in futures:
+            shard_fp = future.result()
+            yield from cyvcf2.VCF(shard_fp)
+            shard_fp.unlink()
+
+
+# Worker state for sharded processing, set once per process by the pool initialiser
+VCF_SHARD_TASK = None
+
+
+def set_vcf_shard_task(record_fn, header_fn, batch_size, kwargs):
+    global VCF_SHARD_TASK
+    VCF_SHARD_TASK = (record_fn, header_fn, batch_size, kwargs)
+
+
+def process_vcf_shard(input_fp, contig, shard_fp):
+    record_fn, header_fn, batch_size, kwargs = VCF_SHARD_TASK
+
+    input_fh = cyvcf2.VCF(input_fp)
+    if header_fn:
+        header_fn(input_fh)
+
+    shard_fh = cyvcf2.Writer(shard_fp, input_fh, 'wbu')
+    for record in process_vcf_region(input_fh, contig, record_fn, batch_size, kwargs):
+        shard_fh.write_record(record)
+    shard_fh.close()
+
+    return shard_fp
+
+
+def process_vcf_region(input_fh, region, record_fn, batch_size, kwargs):
+    records = input_fh(region) if region else input_fh
+    if batch_size:
+        for batch in get_batches(records, batch_size):
+            yield from record_fn(batch, **kwargs)
+    else:
+        for record in records:
+            if (record := record_fn(record, **kwargs)) is not None:
+                yield record
+
+
+def get_batches(iterable, size):
+    iterator = iter(iterable)
+    while (batch := list(itertools.islice(iterator, size))):
+        yield batch
 
 
 def add_vcf_header_entry(fh, anno_enum):
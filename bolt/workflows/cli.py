@@ -1,11 +1,14 @@
+import functools
 import importlib
 import pathlib
+import time
 
 
 import click
 
 
 from .. import util
+from ..common import metrics
 
 
 # Desired sort oder of CLI groups; any group not present in this list will be placed equal last
@@ -53,12 +56,37 @@ def create_clis():
             pass
 
         for module in get_command_modules(fp):
+            add_metrics_output(module.entry, workflow_name)
             cli_group.add_command(module.entry)
         clis.append(cli_group)
 
     return clis
 
 
+def add_metrics_output(command, group_name):
+    # Write collected metrics to <name>.<group>_<command>.metrics.json in the output directory once
+    # the command completes, including on failure; see common/metrics.py
+    callback = command.callback
+
+    @functools.wraps(callback)
+    def callback_metrics(*args, **kwargs):
+        if not metrics.is_enabled():
+            return callback(*args, **kwargs)
+
+        time_start = time.perf_counter()
+        try:
+            return callback(*args, **kwargs)
+        finally:
+            output_dir = pathlib.Path(kwargs.get('output_dir') or '.')
+            output_dir.mkdir(mode=0o755, parents=True, exist_ok=True)
+
+            name = kwargs.get('tumor_name') or kwargs.get('normal_name') or 'bolt'
+            output_fp = output_dir / f'{name}.{group_name}_{command.name}.metrics.json'
+            metrics.write(output_fp, f'{group_name} {command.name}', time.perf_counter() - time_start)
+
+    command.callback = callback_metrics
+
+
 class ClickCustomGroupOrder(click.Group):
 
     def __init__(self, *args, name=None, commands=None, **kwargs):
@@ -1,13 +1,22 @@
+import functools
+import itertools
 import pathlib
 
 
 import click
 import cyvcf2
+import numpy as np
 
 
 from ... import util
+from ...common import annotation_cache
+from ...common import bgzf
 from ...common import constants
+from ...common import intervals
+from ...common import metrics
 from ...common import pcgr
+from ...common import variant_keys
+from ...common import vcfanno
 
 
 @click.command(name='annotate')
@@ -27,6 +36,12 @@ from ...common import pcgr
 @click.option('--pcgr_conda', required=False, type=str)
 @click.option('--pcgrr_conda', required=False, type=str)
 
+@click.option('--cache_dir', required=False, type=click.Path())
+
+@click.option('--pcgr_chunked', is_flag=True)
+@click.option('--pcgr_workers', required=False, default=2, type=int)
+@click.option('--pcgr_cache_fp', required=False, type=click.Path())
+
 @click.option('--threads', required=False, default=4, type=int)
 
 @click.option('--output_dir', required=True, type=click.Path())
@@ -38,38 +53,35 @@ def entry(ctx, **kwargs):
     2. Annotate with hotspot regions, high confidence regions, exclude regions, gnomAD, etc
     3. Annotate with panel of normal counts
     4. Prepare VCF for PCGR then annotate with clinical information using PCGR
+
+    With --pcgr_chunked, no variants are excluded from PCGR annotation. Instead PCGR is run
+    concurrently on chunks of the input, each below the PCGR variant limit. As each PCGR instance
+    requires substantial memory, at most --pcgr_workers instances are run at once.
+
+    With --pcgr_cache_fp, PCGR annotations are read from and added to a persistent per-variant cache.
+    PCGR is then only run for variants that are not cached.
     '''
 
     # Create output directory
     output_dir = pathlib.Path(kwargs['output_dir'])
     output_dir.mkdir(mode=0o755, parents=True, exist_ok=True)
 
-    # Set all FILTER="." to FILTER="PASS" as required by PURPLE
-    filter_pass_fp = set_filter_pass(kwargs['vcf_fp'], kwargs['tumor_name'], output_dir)
-
-    # Annotate with:
+    # Set all FILTER="." to FILTER="PASS" as required by PURPLE, then annotate with:
     #   - gnomAD [INFO/gnomAD_AF]
     #   - Hartwig hotspots [INFO/HMF_HOTSPOT]
     #   - ENCODE blocklist [INFO/ENCODE]
     #   - GIAB high confidence regions [INFO/GIAB_CONF]
     #   - Selected GA4GH/GIAB problem region stratifications [INFO/DIFFICULT_*]
-    vcfanno_fp = general_annotations(
-        filter_pass_fp,
+    #   - UMCCR panel of normals [INFO/PON_COUNT]
+    # Records are streamed through each step with pipes and only the final output is written
+    pon_fp = set_filter_pass_and_annotate(
+        kwargs['vcf_fp'],
         kwargs['tumor_name'],
         kwargs['threads'],
         kwargs['annotations_dir'],
-        output_dir,
-    )
-
-    # Annotate with UMCCR panel of normals [INFO/PON_COUNT]
-    # NOTE(SW): done separately from above as the variant identity for the INDEL PON operates only
-    # on position rather than position /and/ reference + allele
-    pon_fp = panel_of_normal_annotations(
-        vcfanno_fp,
-        kwargs['tumor_name'],
-        kwargs['threads'],
         kwargs['pon_dir'],
         output_dir,
+        cache_dir=kwargs['cache_dir'],
     )
 
     # Annotate with cancer-related and functional information from a range of sources using PCGR
@@ -85,214 +97,455 @@ def entry(ctx, **kwargs):
     #       - Hits in TCGA [INFO/PCGR_TCGA_PANCANCER_COUNT]
     #       - Hits in PCAWG [INFO/PCGR_ICGC_PCAWG_COUNT]
     # Set selected data or full input
-    selection_data = select_variants(
-        pon_fp,
-        kwargs['tumor_name'],
-        kwargs['cancer_genes_fp'],
-        output_dir,
-    )
+    if kwargs['pcgr_chunked']:
+        selection_data = {'selected': pon_fp}
+    else:
+        selection_data = select_variants(
+            pon_fp,
+            kwargs['tumor_name'],
+            kwargs['cancer_genes_fp'],
+            output_dir,
+            cache_dir=kwargs['cache_dir'],
+            normal_name=kwargs['normal_name'],
+        )
 
     if not (pcgr_prep_input_fp := selection_data.get('filtered')):
         pcgr_prep_input_fp = selection_data['selected']
 
-    # Prepare VCF for PCGR annotation
-    pcgr_prep_fp = pcgr.prepare_vcf_somatic(
-        pcgr_prep_input_fp,
-        kwargs['tumor_name'],
-        kwargs['normal_name'],
-        output_dir,
-    )
-
-    # Run PCGR
-    pcgr_dir = pcgr.run_somatic(
-        pcgr_prep_fp,
-        kwargs['pcgr_data_dir'],
-        output_dir,
-        threads=kwargs['threads'],
-        pcgr_conda=kwargs['pcgr_conda'],
-        pcgrr_conda=kwargs['pcgrr_conda'],
-    )
+    # Prepare VCF for PCGR annotation where this was not already done during variant selection
+    if not (pcgr_prep_fp := selection_data.get('pcgr_prep')):
+        pcgr_prep_fp = pcgr.prepare_vcf_somatic(
+            pcgr_prep_input_fp,
+            kwargs['tumor_name'],
+            kwargs['normal_name'],
+            output_dir,
+        )
+
+    # Run PCGR, only for uncached variants where a cache is provided
+    pcgr_run_kwargs = {
+        'threads': kwargs['threads'],
+        'pcgr_conda': kwargs['pcgr_conda'],
+        'pcgrr_conda': kwargs['pcgrr_conda'],
+        'chunk_size': constants.MAX_SOMATIC_VARIANTS if kwargs['pcgr_chunked'] else None,
+        'workers': kwargs['pcgr_workers'],
+    }
+
+    if kwargs['pcgr_cache_fp']:
+        pcgr_data = pcgr.run_somatic_cached(
+            pcgr_prep_fp,
+            kwargs['tumor_name'],
+            kwargs['pcgr_data_dir'],
+            kwargs['pcgr_cache_fp'],
+            output_dir,
+            **pcgr_run_kwargs,
+        )
+    else:
+        pcgr_dir = pcgr.run_somatic(
+            pcgr_prep_fp,
+            kwargs['pcgr_data_dir'],
+            output_dir,
+            **pcgr_run_kwargs,
+        )
+        pcgr_data = pcgr.stream_somatic_annotation_data(pcgr_dir)
 
     # Transfer PCGR annotations to full set of variants
     pcgr.transfer_annotations_somatic(
         selection_data['selected'],
         kwargs['tumor_name'],
         selection_data.get('filter_name'),
-        pcgr_dir,
+        pcgr_data,
         output_dir,
+        threads=kwargs['threads'],
     )
 
 
-def set_filter_pass(input_fp, tumor_name, output_dir):
-    output_fp = output_dir / f'{tumor_name}.set_filter_pass.vcf.gz'
+# INFO flags set from overlapping regions here rather than with vcfanno
+REGION_FLAG_ANNOTATIONS = {
+    constants.VcfInfo.HMF_HOTSPOT.value,
+    constants.VcfInfo.GIAB_CONF.value,
+    constants.VcfInfo.ENCODE.value,
+    *(e.value for e in constants.VcfInfo if e.value.startswith('DIFFICULT_')),
+}
 
-    input_fh = cyvcf2.VCF(input_fp)
-    output_fh = cyvcf2.Writer(output_fp, input_fh, 'wz')
 
-    for record in input_fh:
-        if record.FILTER is None:
-            record.FILTER = 'PASS'
-        output_fh.write_record(record)
+# INFO fields set from matching variants here rather than with vcfanno where a cache is provided
+VARIANT_LOOKUP_ANNOTATIONS = {
+    constants.VcfInfo.GNOMAD_AF.value,
+    constants.VcfInfo.PON_COUNT.value,
+}
 
-    return output_fp
 
+# NOTE(SW): PON annotation is done separately from general annotation as the variant identity
+# for the INDEL PON operates only on position rather than position /and/ reference + allele
+PON_ANNOTATION_CONFIGS = (
+    ('snps', False),
+    ('indels', True),
+)
 
-def general_annotations(input_fp, tumor_name, threads, annotations_dir, output_dir):
-    toml_fp = pathlib.Path(annotations_dir) / 'vcfanno_annotations.toml'
 
-    output_fp = output_dir / f'{tumor_name}.general_annotations.vcf.gz'
+def set_filter_pass_and_annotate(input_fp, tumor_name, threads, annotations_dir, pon_dir, output_dir, cache_dir=None):
+    output_fp = output_dir / f'{tumor_name}.pon.vcf.gz'
+
+    # Region flag annotations with BED sources are set directly, as are gnomAD and PON annotations
+    # with VCF sources when using the annotation cache; all others remain with vcfanno
+    region_flags, region_flag_annotations, vcfanno_config = get_region_flag_annotations(annotations_dir)
+
+    variant_lookups = list()
+    if cache_dir is not None:
+        variant_lookups, vcfanno_config = get_variant_lookup_annotations(vcfanno_config)
+
+    command_fns = list()
+    if vcfanno.has_annotations(vcfanno_config):
+        vcfanno_toml_fp = vcfanno.write_config(vcfanno_config, output_dir / f'{tumor_name}.vcfanno_annotations.toml')
+        command_fns.append(functools.partial(get_general_annotations_command, '/dev/stdin', toml_fp=vcfanno_toml_fp))
+
+    for pon_name, permissive_overlap in PON_ANNOTATION_CONFIGS:
+        pon_toml_fp = pathlib.Path(pon_dir) / f'vcfanno_{pon_name}.toml'
+        if cache_dir is not None:
+            pon_config = vcfanno.read_config(pon_toml_fp)
+            pon_lookups, pon_config = get_pon_lookup_annotations(pon_config, permissive_overlap)
+            if not vcfanno.has_annotations(pon_config):
+                pon_toml_fp = None
+            elif pon_lookups:
+                pon_toml_fp = vcfanno.write_config(pon_config, output_dir / f'{tumor_name}.vcfanno_pon_{pon_name}.toml')
+            variant_lookups.extend(pon_lookups)
+        if pon_toml_fp is not None:
+            command_fns.append(functools.partial(
+                get_panel_of_normal_annotations_command,
+                '/dev/stdin',
+                toml_fp=pon_toml_fp,
+                permissive_overlap=permissive_overlap,
+            ))
+
+    # Record processing and each vcfanno stage run concurrently and so share the available threads
+    records_threads, *commands_threads = util.split_threads(threads, len(command_fns) + 1)
+    commands = [command_fn(command_threads) for command_fn, command_threads in zip(command_fns, commands_threads)]
 
     command = fr'''
-        vcfanno -p {threads} -base-path $(pwd) {toml_fp} {input_fp} | bcftools view -o {output_fp} && \
+        {' | '.join(commands) or 'cat'} | \
+            bcftools view -o {output_fp} && \
             bcftools index -t {output_fp}
     '''
 
-    util.execute_command(command)
+    # Header entries are set here and then applied to the input of each record processing worker
+    header_fh = cyvcf2.VCF(input_fp)
+    header_annotations = [*region_flag_annotations, *get_variant_lookup_configs(variant_lookups)]
+    if header_annotations:
+        header_fp = output_dir / f'{tumor_name}.vcfanno_header.vcf'
+        add_vcfanno_header_entries(header_fh, header_annotations, header_fp)
+    flag_regions = read_region_flags(region_flags, cache_dir=cache_dir)
+    variant_values = read_variant_lookups(header_fh, variant_lookups, cache_dir)
+    header_lines = get_added_header_lines(input_fp, header_fh)
+
+    input_fh, records = util.get_processed_vcf_records(
+        input_fp,
+        set_filter_pass_and_annotate_records,
+        header_fn=functools.partial(add_header_lines, header_lines=header_lines),
+        threads=records_threads,
+        batch_size=10_000,
+        shard_parent_dir=output_dir,
+        flag_regions=flag_regions,
+        variant_values=variant_values,
+    )
+    records = metrics.iter_records(
+        f'{__name__}.set_filter_pass',
+        records,
+        input_fp=input_fp,
+        output_fp=output_fp,
+    )
+    with util.execute_command_stdin(command) as command_fh:
+        command_fh.write(input_fh.raw_header)
+        for record in records:
+            command_fh.write(str(record))
+
     return output_fp
 
 
-def panel_of_normal_annotations(input_fp, tumor_name, threads, pon_dir, output_dir):
-    toml_snp_fp = pathlib.Path(pon_dir) / 'vcfanno_snps.toml'
-    toml_indel_fp = pathlib.Path(pon_dir) / 'vcfanno_indels.toml'
+def get_region_flag_annotations(annotations_dir):
+    # Returns (name, BED filepath), the vcfanno annotations setting these, and the remaining configuration
+    toml_fp = pathlib.Path(annotations_dir) / 'vcfanno_annotations.toml'
+    config = vcfanno.read_config(toml_fp)
+    region_flags, config_remaining = vcfanno.split_region_flags(config, REGION_FLAG_ANNOTATIONS)
+    region_flag_annotations = vcfanno.select_annotations(config, [name for name, _ in region_flags])
+    return region_flags, region_flag_annotations, config_remaining
+
+
+def get_regions_read_fn(cache_dir):
+    # Read regions through the annotation cache where provided
+    if cache_dir is None:
+        return intervals.read_regions_arrays
+    return functools.partial(annotation_cache.load_regions, cache_dir)
+
+
+def read_region_flags(region_flags, cache_dir=None):
+    # Load regions for each flag; header entries are set with add_vcfanno_header_entries
+    read_regions_fn = get_regions_read_fn(cache_dir)
+    return [(name, read_regions_fn(bed_fp)) for name, bed_fp in region_flags]
 
-    output_fp = output_dir / f'{tumor_name}.pon.vcf.gz'
 
-    threads_quot, threads_rem = divmod(threads, 2)
+def set_region_flags(records, flag_regions):
+    # Records are position sorted and so each contig forms a contiguous group
+    for contig, contig_records in itertools.groupby(records, key=lambda r: r.CHROM):
+        contig_records = list(contig_records)
+        starts = np.fromiter((r.start for r in contig_records), dtype=np.int64, count=len(contig_records))
+        ends = np.fromiter((r.end for r in contig_records), dtype=np.int64, count=len(contig_records))
+        for name, regions in flag_regions:
+            for j in np.flatnonzero(intervals.overlaps_array(regions, contig, starts, ends)):
+                contig_records[j].INFO[name] = True
 
-    command = fr'''
-        vcfanno -p {threads_quot+threads_rem} -base-path $(pwd) {toml_snp_fp} {input_fp} | \
-            vcfanno -permissive-overlap -p {threads_quot} -base-path $(pwd) {toml_indel_fp} /dev/stdin | \
-            bcftools view -o {output_fp} && \
-            bcftools index -t {output_fp}
-    '''
 
-    util.execute_command(command)
-    return output_fp
+def get_variant_lookup_annotations(config):
+    # Returns (name, VCF filepath, source field, op) and the remaining configuration
+    return vcfanno.split_variant_lookups(config, VARIANT_LOOKUP_ANNOTATIONS, variant_keys.OPS)
+
+
+def get_pon_lookup_annotations(config, permissive_overlap):
+    # Lookups match variants exactly and so PON annotations with permissive overlap, which match any
+    # overlapping variant, remain with vcfanno
+    if permissive_overlap:
+        return list(), config
+    return get_variant_lookup_annotations(config)
+
 
+def get_variant_lookup_configs(variant_lookups):
+    return [
+        {'file': vcf_fp, 'fields': [field], 'names': [name], 'ops': [op]}
+        for name, vcf_fp, field, op in variant_lookups
+    ]
 
-def select_variants(input_fp, tumor_name, cancer_genes_fp, output_dir):
+
+def add_vcfanno_header_entries(input_fh, annotations, header_fp):
+    # Take INFO header entries from vcfanno run on the input header alone so that the output header
+    # is the same as when the given annotations are set by vcfanno
+    toml_fp = vcfanno.write_config({'annotation': annotations}, header_fp.with_suffix('.toml'))
+    header_fp.write_text(input_fh.raw_header)
+
+    result = util.execute_command(f'vcfanno -base-path $(pwd) {toml_fp} {header_fp}')
+    header_lines = {
+        line.split(',', 1)[0].removeprefix('##INFO=<ID='): line
+        for line in result.stdout.splitlines()
+        if line.startswith('##INFO=<ID=')
+    }
+    for annotation in annotations:
+        for name in annotation['names']:
+            input_fh.add_to_header(header_lines[name])
+
+
+def read_variant_lookups(input_fh, variant_lookups, cache_dir):
+    # Load variant values for each annotation from the cache; header entries must already be present
+    variant_values = list()
+    for name, vcf_fp, field, op in variant_lookups:
+        value_type = input_fh.get_header_type(name)['Type']
+        store = annotation_cache.load_variants(cache_dir, vcf_fp, field, op=op)
+        variant_values.append((name, value_type, store))
+    return variant_values
+
+
+def set_variant_lookups(records, variant_values):
+    # Lookups are applied in order such that later annotations replace earlier ones, as with vcfanno
+    for contig, contig_records in itertools.groupby(records, key=lambda r: r.CHROM):
+        contig_records = list(contig_records)
+        query_keys, query_checks = np.array(
+            [variant_keys.get_record_key(r) for r in contig_records],
+            dtype=np.uint64,
+        ).reshape(-1, 2).T
+        for name, value_type, store in variant_values:
+            if (contig_store := store.get(contig)) is None:
+                continue
+            keys, checks, values, bloom = contig_store
+            found, query_values = variant_keys.lookup(keys, checks, values, query_keys, query_checks, bloom=bloom)
+            for j in np.flatnonzero(found):
+                value = query_values[j]
+                contig_records[j].INFO[name] = int(value) if value_type == 'Integer' else float(value)
+
+
+def set_filter_pass_and_annotate_records(records, flag_regions, variant_values):
+    set_region_flags(records, flag_regions)
+    set_variant_lookups(records, variant_values)
+    return [set_filter_pass_record(record) for record in records]
+
+
+def get_added_header_lines(input_fp, fh):
+    header_lines_input = set(cyvcf2.VCF(input_fp).raw_header.splitlines())
+    return [line for line in fh.raw_header.splitlines() if line not in header_lines_input]
+
+
+def add_header_lines(fh, header_lines):
+    for line in header_lines:
+        fh.add_to_header(line)
+
+
+def set_filter_pass_record(record):
+    if record.FILTER is None:
+        record.FILTER = 'PASS'
+    return record
+
+
+def get_general_annotations_command(input_fp, threads, toml_fp):
+    return f'vcfanno -p {threads} -base-path $(pwd) {toml_fp} {input_fp}'
+
+
+def get_panel_of_normal_annotations_command(input_fp, threads, toml_fp, permissive_overlap):
+    permissive_overlap_arg = '-permissive-overlap ' if permissive_overlap else ''
+    return f'vcfanno {permissive_overlap_arg}-p {threads} -base-path $(pwd) {toml_fp} {input_fp}'
+
+
+def select_variants(input_fp, tumor_name, cancer_genes_fp, output_dir, cache_dir=None, normal_name=None):
     # Exclude variants until we hopefully move the needle below the threshold
 
 
     # TODO(SW): make clear logs of this data and process
-    # TODO(SW): generate in tempdir and keep only the one that passes; probably avoid doing this
-    # right now
 
 
     if util.count_vcf_records(input_fp) <= constants.MAX_SOMATIC_VARIANTS:
         return {'selected': input_fp}
 
-    pass_fps = exclude_nonpass(input_fp, tumor_name, output_dir)
-    if util.count_vcf_records(pass_fps.get('filtered')) <= constants.MAX_SOMATIC_VARIANTS:
-        return pass_fps
+    gene_regions = read_cancer_gene_regions(cancer_genes_fp, cache_dir=cache_dir)
 
-    pop_fps = exclude_population_variants(input_fp, tumor_name, output_dir)
-    if util.count_vcf_records(pop_fps.get('filtered')) <= constants.MAX_SOMATIC_VARIANTS:
-        return pop_fps
+    # Classify all records against each tier in a single pass then write only the first tier that
+    # retains few enough variants
+    tier_bits, tier_counts = classify_selection_tiers(input_fp, gene_regions)
 
-    genes_fps = exclude_non_cancer_genes(input_fp, tumor_name, cancer_genes_fp, output_dir)
-    if util.count_vcf_records(genes_fps.get('filtered')) <= constants.MAX_SOMATIC_VARIANTS:
+    tier_index = next((i for i, c in enumerate(tier_counts) if c <= constants.MAX_SOMATIC_VARIANTS), None)
+    if tier_index is None:
 
         # TODO(SW): log warning
 
-        pass
+        tier_index = len(SELECTION_TIERS) - 1
 
-    return genes_fps
+    # Where normal_name is given, the PCGR input is also prepared from retained variants in the
+    # same pass
+    return write_selection_tier(input_fp, tumor_name, tier_index, tier_bits, output_dir, normal_name=normal_name)
 
 
-def generic_exclude(input_fp, tumor_name, label, header_enum, process_fn, output_dir, **kwargs):
-    selected_fp = output_dir / f'{tumor_name}.{label}.vcf.gz'
-    filtered_fp = output_dir / f'{tumor_name}.{label}.filtered.vcf.gz'
+def read_cancer_gene_regions(cancer_genes_fp, cache_dir=None):
+    # Apply 1,000 bp padding to gene boundaries
+    # NOTE: gene coordinates are taken as one-based to match selection previously done with
+    # bcftools view --regions-file
+    return get_regions_read_fn(cache_dir)(cancer_genes_fp, padding=1000, one_based=True)
+
+
+# Variant selection tiers, each applied independently to the input VCF. For each tier, variants that
+# are in a hotspot or meet the tier criteria are retained in the filtered VCF while all others have
+# FILTER set in the selected VCF:
+#   - pass_select:        FILTER=PASS
+#   - common_population:  not a common population variant [INFO/gnomAD_AF]
+#   - cancer_genes:       within 1,000 bp of a cancer gene
+SELECTION_TIERS = (
+    ('pass_select', constants.VcfFilter.MAX_VARIANTS_NON_PASS),
+    ('common_population', constants.VcfFilter.MAX_VARIANTS_GNOMAD),
+    ('cancer_genes', constants.VcfFilter.MAX_VARIANTS_NON_CANCER_GENES),
+)
+
+
+def classify_selection_tiers(input_fp, gene_regions):
+    # Returns a bitmask for each record of the tiers in which it is retained, and retained counts for
+    # each tier
+    tier_bits = bytearray()
+    tier_counts = [0] * len(SELECTION_TIERS)
 
     input_fh = cyvcf2.VCF(input_fp)
-    util.add_vcf_header_entry(input_fh, header_enum)
+    records = metrics.iter_records(
+        f'{__name__}.classify_selection_tiers',
+        input_fh,
+        input_fp=input_fp,
+    )
+    for records_batch in util.get_batches(records, 10_000):
+        cancer_gene_mask = get_cancer_gene_mask(records_batch, gene_regions)
+        for record, cancer_gene in zip(records_batch, cancer_gene_mask):
+            bits = classify_selection_record(record, cancer_gene)
+            tier_bits.append(bits)
+            for i in range(len(SELECTION_TIERS)):
+                tier_counts[i] += bits >> i & 1
 
-    selected_fh = cyvcf2.Writer(selected_fp, input_fh, 'wz')
-    filtered_fh = cyvcf2.Writer(filtered_fp, input_fh, 'wz')
+    return tier_bits, tier_counts
 
-    for record in input_fh:
-        process_fn(record, selected_fh=selected_fh, filtered_fh=filtered_fh, **kwargs)
 
-    return {'selected': selected_fp, 'filtered': filtered_fp, 'filter_name': header_enum.value}
+def get_cancer_gene_mask(records, gene_regions):
+    # Test records against the padded cancer gene interval index in contig groups
+    cancer_gene_mask = list()
+    for contig, contig_records in itertools.groupby(records, key=lambda r: r.CHROM):
+        contig_records = list(contig_records)
+        starts = np.fromiter((r.start for r in contig_records), dtype=np.int64, count=len(contig_records))
+        ends = np.fromiter((r.end for r in contig_records), dtype=np.int64, count=len(contig_records))
+        cancer_gene_mask.extend(intervals.overlaps_array(gene_regions, contig, starts, ends))
+    return cancer_gene_mask
 
 
-def exclude_nonpass(input_fp, tumor_name, output_dir):
-    # Exclude variants that don't have FILTER=PASS and are not in a hotspot
+def classify_selection_record(record, cancer_gene):
+    # NOTE(SW): variants in a hotspot are retained for all tiers
+    if record.INFO.get(constants.VcfInfo.HMF_HOTSPOT.value) is not None:
+        return (1 << len(SELECTION_TIERS)) - 1
 
-    header_enum = constants.VcfFilter.MAX_VARIANTS_NON_PASS
+    bits = 0
 
-    def process_fn(record, selected_fh, filtered_fh):
-        # NOTES(SW): sanity check to ensure that if INFO/SAGE_HOTSPOT is present that FILTER=PASS
-        if record.INFO.get(constants.VcfInfo.SAGE_HOTSPOT.value) is not None:
-            assert not record.FILTER
-        # Write to filtered_fp if passes criteria: in a hotspot or FILTER=PASS
-        # Otherwise update FILTER appropriately then write to selected_fp
-        if record.INFO.get(constants.VcfInfo.HMF_HOTSPOT.value) is not None or not record.FILTER:
-            filtered_fh.write_record(record)
-        else:
-            assert 'PASS' not in record.FILTERS
-            record.FILTER = ';'.join([*record.FILTERS, header_enum.value])
-        selected_fh.write_record(record)
+    # Non-PASS variants
+    # NOTES(SW): sanity check to ensure that if INFO/SAGE_HOTSPOT is present that FILTER=PASS
+    if record.INFO.get(constants.VcfInfo.SAGE_HOTSPOT.value) is not None:
+        assert not record.FILTER
+    if not record.FILTER:
+        bits |= 1
 
-    return generic_exclude(input_fp, tumor_name, 'pass_select', header_enum, process_fn, output_dir)
+    # Common population variants
+    # NOTE(SW): for cases where gnomAD AF is not available we consider that the variant is not common
+    gnomad_af = record.INFO.get(constants.VcfInfo.GNOMAD_AF.value, 0)
+    if float(gnomad_af) < constants.MAX_SOMATIC_VARIANTS_GNOMAD_FILTER:
+        bits |= 2
 
+    # Variants associated with a cancer gene
+    if cancer_gene:
+        bits |= 4
 
-def exclude_population_variants(input_fp, tumor_name, output_dir):
-    # Set FILTER to MAX_VARIANTS_GNOMAD where INFO/gnomAD_AF is greater than 0.01 and variant is
-    # not annotated as a hotspot
+    return bits
 
-    header_enum = constants.VcfFilter.MAX_VARIANTS_GNOMAD
 
-    def process_fn(record, selected_fh, filtered_fh):
-        # NOTE(SW): for cases where gnomAD AF is not available we consider that the variant is not common
-        gnomad_af = record.INFO.get(constants.VcfInfo.GNOMAD_AF.value, 0)
-        is_population_common = float(gnomad_af) >= constants.MAX_SOMATIC_VARIANTS_GNOMAD_FILTER
-        # Write to filtered_fp if passes criteria: in a hotspot or not a common population variant
-        # Otherwise update FILTER appropriately then write to selected_fp
-        if record.INFO.get(constants.VcfInfo.HMF_HOTSPOT.value) is not None or not is_population_common:
-            filtered_fh.write_record(record)
-        else:
-            existing_filters = [e for e in record.FILTERS if e != 'PASS']
-            record.FILTER = ';'.join([*existing_filters, header_enum.value])
-        selected_fh.write_record(record)
+def write_selection_tier(input_fp, tumor_name, tier_index, tier_bits, output_dir, normal_name=None):
+    label, header_enum = SELECTION_TIERS[tier_index]
 
-    return generic_exclude(input_fp, tumor_name, 'common_population', header_enum, process_fn, output_dir)
+    selected_fp = output_dir / f'{tumor_name}.{label}.vcf.gz'
+    filtered_fp = output_dir / f'{tumor_name}.{label}.filtered.vcf.gz'
+    pcgr_prep_fp = output_dir / f'{tumor_name}.pcgr_prep.vcf.gz'
 
+    input_fh = cyvcf2.VCF(input_fp)
+    util.add_vcf_header_entry(input_fh, header_enum)
 
-def exclude_non_cancer_genes(input_fp, tumor_name, bed_fp, output_dir):
-    # Set FILTER to MAX_VARIANTS_KEY_GENES where variant is not in a key cancer gene or annotated
-    # as a hotspot
+    selected_fh = bgzf.VcfIndexedWriter(selected_fp, input_fh)
+    filtered_fh = bgzf.VcfIndexedWriter(filtered_fp, input_fh)
 
-    header_enum = constants.VcfFilter.MAX_VARIANTS_NON_CANCER_GENES
-    gene_variants = get_cancer_gene_variants(input_fp, bed_fp, output_dir)
+    pcgr_prep_fh = None
+    if normal_name is not None:
+        pcgr_sample_indices = pcgr.get_sample_indices_somatic(input_fh, tumor_name, normal_name)
+        pcgr_prep_fh = bgzf.VcfIndexedLineWriter(pcgr_prep_fp, pcgr.get_minimal_header(input_fh))
+    pcgr_prep_records = list()
 
-    def process_fn(record, selected_fh, filtered_fh, *, gene_variants):
-        # Write to filtered_fp if passes criteria: in a hotspot or associated with a cancer gene
-        # Otherwise update FILTER appropriately then write to selected_fp
-        key = (record.CHROM, record.POS, record.REF, tuple(record.ALT))
-        if record.INFO.get(constants.VcfInfo.HMF_HOTSPOT.value) is not None or key in gene_variants:
+    records = metrics.iter_records(
+        f'{__name__}.write_selection_tier',
+        input_fh,
+        input_fp=input_fp,
+        output_fp=selected_fp,
+    )
+    for record, bits in zip(records, tier_bits, strict=True):
+        # Write to filtered_fp if retained by this tier otherwise update FILTER appropriately; all
+        # records are written to selected_fp
+        if bits >> tier_index & 1:
             filtered_fh.write_record(record)
+            if pcgr_prep_fh is not None:
+                pcgr_prep_records.append(record)
         else:
             existing_filters = [e for e in record.FILTERS if e != 'PASS']
             record.FILTER = ';'.join([*existing_filters, header_enum.value])
         selected_fh.write_record(record)
 
-    return generic_exclude(input_fp, tumor_name, 'cancer_genes', header_enum, process_fn,
-            output_dir, gene_variants=gene_variants)
+        if len(pcgr_prep_records) >= 10_000:
+            pcgr.write_prepared_records_somatic(pcgr_prep_fh, pcgr_prep_records, pcgr_sample_indices)
+            pcgr_prep_records = list()
 
+    selected_fh.close()
+    filtered_fh.close()
 
-def get_cancer_gene_variants(input_fp, bed_fp, output_dir):
-    # Apply 1,000 bp padding to gene boundaries
-    genes_variants_fp = output_dir / 'genes_variants.vcf.gz'
-    util.execute_command(fr'''
-        bcftools view \
-            --regions-file <(awk 'BEGIN {{ OFS="\t" }} {{ $2-=1000; $3+=1000; print $0 }}' {bed_fp}) \
-            --output {genes_variants_fp} \
-            {input_fp}
-    ''')
-
-    gene_variants = set()
-    for record in cyvcf2.VCF(genes_variants_fp):
-        key = (record.CHROM, record.POS, record.REF, tuple(record.ALT))
-        gene_variants.add(key)
-    return gene_variants
+    selection_data = {'selected': selected_fp, 'filtered': filtered_fp, 'filter_name': header_enum.value}
+    if pcgr_prep_fh is not None:
+        pcgr.write_prepared_records_somatic(pcgr_prep_fh, pcgr_prep_records, pcgr_sample_indices)
+        pcgr_prep_fh.close()
+        selection_data['pcgr_prep'] = pcgr_prep_fp
+    return selection_data
@@ -0,0 +1,52 @@
+import pathlib
+
+
+import click
+
+
+from ...common import annotation_cache
+from ...common import vcfanno
+from . import annotate
+
+
+@click.command(name='cache_annotations')
+@click.pass_context
+
+@click.option('--annotations_dir', required=True, type=click.Path(exists=True))
+@click.option('--pon_dir', required=False, type=click.Path(exists=True))
+@click.option('--cancer_genes_fp', required=True, type=click.Path(exists=True))
+
+@click.option('--cache_dir', required=True, type=click.Path())
+
+def entry(ctx, **kwargs):
+    '''Compile annotation resources into a memory-mapped cache\f
+
+    1. Compile BED regions for INFO flags set during annotation
+    2. Compile gnomAD and panel of normal variant lookups
+    3. Compile padded cancer gene regions used for variant selection
+
+    The cache can then be provided to `bolt smlv_somatic annotate` with --cache_dir. Entries are
+    keyed by source file checksum and are otherwise built automatically by annotate when missing or
+    when a source changes.
+    '''
+
+    cache_dir = pathlib.Path(kwargs['cache_dir'])
+
+    region_flags, _, vcfanno_config = annotate.get_region_flag_annotations(kwargs['annotations_dir'])
+    for name, bed_fp in region_flags:
+        print(f'Caching {name} regions from {bed_fp}')
+        annotation_cache.load_regions(cache_dir, bed_fp)
+
+    variant_lookups, _ = annotate.get_variant_lookup_annotations(vcfanno_config)
+    if kwargs['pon_dir']:
+        for pon_name, permissive_overlap in annotate.PON_ANNOTATION_CONFIGS:
+            pon_config = vcfanno.read_config(pathlib.Path(kwargs['pon_dir']) / f'vcfanno_{pon_name}.toml')
+            pon_lookups, _ = annotate.get_pon_lookup_annotations(pon_config, permissive_overlap)
+            variant_lookups.extend(pon_lookups)
+
+    for name, vcf_fp, field, op in variant_lookups:
+        print(f'Caching {name} variants from {vcf_fp}')
+        annotation_cache.load_variants(cache_dir, vcf_fp, field, op=op)
+
+    print(f'Caching cancer gene regions from {kwargs["cancer_genes_fp"]}')
+    annotate.read_cancer_gene_regions(kwargs['cancer_genes_fp'], cache_dir=cache_dir)
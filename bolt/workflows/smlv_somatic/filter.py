@@ -1,12 +1,16 @@
 import click
+import collections
+import functools
 import pathlib
 
 
 import cyvcf2
+import numpy as np
 
 
 from ... import util
 from ...common import constants
+from ...common import filter_decisions
 
 
 @click.command(name='filter')
@@ -16,6 +20,9 @@ from ...common import constants
 
 @click.option('--vcf_fp', required=True, type=click.Path(exists=True))
 
+@click.option('--threads', required=False, default=1, type=int)
+@click.option('--batch_size', required=False, default=10_000, type=int)
+
 @click.option('--output_dir', required=True, type=click.Path())
 
 def entry(ctx, **kwargs):
@@ -26,8 +33,36 @@ def entry(ctx, **kwargs):
     output_dir = pathlib.Path(kwargs['output_dir'])
     output_dir.mkdir(mode=0o755, parents=True, exist_ok=True)
 
-    # Open input VCF and set required header entries for output
-    in_fh = cyvcf2.VCF(kwargs['vcf_fp'])
+    # Apply FILTERs and annotate with other INFO data, simultaneously writing PASS variants and
+    # collecting filter decisions for report
+    filters_fp = output_dir / f'{kwargs["tumor_name"]}.filters_set.vcf.gz'
+    set_fp = output_dir / f'{kwargs["tumor_name"]}.pass.vcf.gz'
+    decisions_fp = output_dir / f'{kwargs["tumor_name"]}.filter_decisions.npz'
+
+    # NOTE: a batch size of zero selects the per-record reference implementation
+    if kwargs['batch_size'] > 0:
+        process_fn = process_records_batch
+    else:
+        process_fn = process_record
+
+    tumor_index = cyvcf2.VCF(kwargs['vcf_fp']).samples.index(kwargs['tumor_name'])
+    decisions = filter_decisions.FilterDecisionCollector()
+    util.process_vcf_records(
+        kwargs['vcf_fp'],
+        filters_fp,
+        process_fn,
+        header_fn=add_header_entries,
+        threads=kwargs['threads'],
+        batch_size=kwargs['batch_size'] or None,
+        extra_outputs={set_fp: is_pass},
+        collect_fn=decisions.add,
+        tumor_index=tumor_index,
+    )
+    decisions.write(decisions_fp)
+
+
+def add_header_entries(fh):
+    # Set required header entries for output
     header_filters = (
         constants.VcfFilter.MIN_AF,
         constants.VcfFilter.MIN_AD,
@@ -43,31 +78,142 @@ def entry(ctx, **kwargs):
         constants.VcfInfo.RESCUED_FILTERS_PENDING,
     )
     for header_enum in header_filters:
-        util.add_vcf_header_entry(in_fh, header_enum)
+        util.add_vcf_header_entry(fh, header_enum)
+
+
+def is_pass(record):
+    # Equivalent to bcftools view -f PASS,.
+    return record.FILTER is None
+
+
+def process_record(record, tumor_index):
+    set_filter_data(record, tumor_index)
+    return record
+
+
+def process_records_batch(records, tumor_index):
+    set_filter_data_batch(records, tumor_index)
+    return records
+
+
+# Filter and rescue rules with INFO IDs, thresholds, and tag sets resolved from constants; compiled
+# once and then used directly when evaluating each record
+FilterRulePlan = collections.namedtuple('FilterRulePlan', [
+    # Filter thresholds: (MIN_AF, MIN_AD, MIN_AD_DIFFICULT_REGIONS, PON_HIT_THRESHOLD, MAX_GNOMAD_AF)
+    'filter_thresholds',
+    # Rescue thresholds: (COSMIC, TCGA PanCancer, ICGC PCAWG) minimum counts
+    'rescue_thresholds',
+    # FILTER IDs in order of evaluation
+    'filter_min_af',
+    'filter_min_ad',
+    'filter_min_ad_difficult',
+    'filter_min_ad_non_giab',
+    'filter_pon',
+    'filter_encode',
+    'filter_gnomad_common',
+    # INFO IDs
+    'info_difficult_tags',
+    'info_giab_conf',
+    'info_pon_count',
+    'info_encode',
+    'info_gnomad_af',
+    'info_pcgr_tier',
+    'info_sage_hotspot',
+    'info_hmf_hotspot',
+    'info_pcgr_mutation_hotspot',
+    'info_pcgr_clinvar_clinsig',
+    'info_pcgr_cosmic_count',
+    'info_pcgr_tcga_pancancer_count',
+    'info_pcgr_icgc_pcawg_count',
+    'info_pcgr_tier_rescue',
+    'info_sage_hotspot_rescue',
+    'info_clinical_potential_rescue',
+    'info_rescued_filters_existing',
+    'info_rescued_filters_pending',
+    # Rescue criteria
+    'pcgr_tiers_rescue',
+    'clinvar_clinsigs_rescue',
+    'is_clinvar_rescue',
+])
+
+
+def compile_rule_plan():
+    difficult_region_tags_enums = (
+        constants.VcfInfo.DIFFICULT_BAD_PROMOTER,
+        constants.VcfInfo.DIFFICULT_GC15,
+        constants.VcfInfo.DIFFICULT_GC70TO75,
+        constants.VcfInfo.DIFFICULT_GC75TO80,
+        constants.VcfInfo.DIFFICULT_GC80TO85,
+        constants.VcfInfo.DIFFICULT_GC80,
+        constants.VcfInfo.DIFFICULT_LOW_COMPLEXITY_DITR,
+        constants.VcfInfo.DIFFICULT_LOW_COMPLEXITY_QUADTR,
+        constants.VcfInfo.DIFFICULT_LOW_COMPLEXITY_TANDEMREPEATS,
+        constants.VcfInfo.DIFFICULT_LOW_COMPLEXITY_TRITR,
+        constants.VcfInfo.DIFFICULT_MAPPABILITY_NONUNIQUE,
+        constants.VcfInfo.DIFFICULT_SEGDUP,
+    )
 
-    # Apply FILTERs and annotate with other INFO data
-    filters_fp = output_dir / f'{kwargs["tumor_name"]}.filters_set.vcf.gz'
-    filters_fh = cyvcf2.Writer(filters_fp, in_fh, 'wz')
+    clinvar_clinsigs_rescue = frozenset(constants.CLINVAR_CLINSIGS_RESCUE)
+
+    # ClinVar clinical significance values are highly repetitive so the split and test is cached
+    @functools.lru_cache(maxsize=4096)
+    def is_clinvar_rescue(clinvar_clinsig):
+        return not clinvar_clinsigs_rescue.isdisjoint(clinvar_clinsig.split(','))
+
+    return FilterRulePlan(
+        filter_thresholds=(
+            constants.MIN_AF,
+            constants.MIN_AD,
+            constants.MIN_AD_DIFFICULT_REGIONS,
+            constants.PON_HIT_THRESHOLD,
+            constants.MAX_GNOMAD_AF,
+        ),
+        rescue_thresholds=(
+            constants.MIN_COSMIC_COUNT_RESCUE,
+            constants.MIN_TCGA_PANCANCER_COUNT_RESCUE,
+            constants.MIN_ICGC_PCAWG_COUNT_RESCUE,
+        ),
+        filter_min_af=constants.VcfFilter.MIN_AF.value,
+        filter_min_ad=constants.VcfFilter.MIN_AD.value,
+        filter_min_ad_difficult=constants.VcfFilter.MIN_AD_DIFFICULT.value,
+        filter_min_ad_non_giab=constants.VcfFilter.MIN_AD_NON_GIAB.value,
+        filter_pon=constants.VcfFilter.PON.value,
+        filter_encode=constants.VcfFilter.ENCODE.value,
+        filter_gnomad_common=constants.VcfFilter.GNOMAD_COMMON.value,
+        info_difficult_tags=tuple(e.value for e in difficult_region_tags_enums),
+        info_giab_conf=constants.VcfInfo.GIAB_CONF.value,
+        info_pon_count=constants.VcfInfo.PON_COUNT.value,
+        info_encode=constants.VcfInfo.ENCODE.value,
+        info_gnomad_af=constants.VcfInfo.GNOMAD_AF.value,
+        info_pcgr_tier=constants.VcfInfo.PCGR_TIER.value,
+        info_sage_hotspot=constants.VcfInfo.SAGE_HOTSPOT.value,
+        info_hmf_hotspot=constants.VcfInfo.HMF_HOTSPOT.value,
+        info_pcgr_mutation_hotspot=constants.VcfInfo.PCGR_MUTATION_HOTSPOT.value,
+        info_pcgr_clinvar_clinsig=constants.VcfInfo.PCGR_CLINVAR_CLNSIG.value,
+        info_pcgr_cosmic_count=constants.VcfInfo.PCGR_COSMIC_COUNT.value,
+        info_pcgr_tcga_pancancer_count=constants.VcfInfo.PCGR_TCGA_PANCANCER_COUNT.value,
+        info_pcgr_icgc_pcawg_count=constants.VcfInfo.PCGR_ICGC_PCAWG_COUNT.value,
+        info_pcgr_tier_rescue=constants.VcfInfo.PCGR_TIER_RESCUE.value,
+        info_sage_hotspot_rescue=constants.VcfInfo.SAGE_HOTSPOT_RESCUE.value,
+        info_clinical_potential_rescue=constants.VcfInfo.CLINICAL_POTENTIAL_RESCUE.value,
+        info_rescued_filters_existing=constants.VcfInfo.RESCUED_FILTERS_EXISTING.value,
+        info_rescued_filters_pending=constants.VcfInfo.RESCUED_FILTERS_PENDING.value,
+        pcgr_tiers_rescue=frozenset(constants.PCGR_TIERS_RESCUE),
+        clinvar_clinsigs_rescue=clinvar_clinsigs_rescue,
+        is_clinvar_rescue=is_clinvar_rescue,
+    )
 
-    tumor_index = in_fh.samples.index(kwargs['tumor_name'])
-    for record in in_fh:
-        set_filter_data(record, tumor_index)
-        filters_fh.write_record(record)
-    filters_fh.close()
 
-    # Apply set FILTERs
-    set_fp = output_dir / f'{kwargs["tumor_name"]}.pass.vcf.gz'
-    command = fr'''
-        bcftools view -f PASS,. -o {set_fp} {filters_fp}
-        bcftools index -t {set_fp}
-    '''
-    util.execute_command(command)
+RULE_PLAN = compile_rule_plan()
 
 
-def set_filter_data(record, tumor_index):
+def set_filter_data(record, tumor_index, rule_plan=RULE_PLAN):
     # NOTE(SW): given the importance of the filtering and rescue logic I've decided to keep it all
     # inline under a single function to avoid complicating abstractions
 
+    min_af, min_ad, min_ad_difficult, pon_hit_threshold, max_gnomad_af = rule_plan.filter_thresholds
+    min_cosmic_count, min_tcga_pancancer_count, min_icgc_pcawg_count = rule_plan.rescue_thresholds
+
 
     ########################
     ## Variant filtering  ##
@@ -80,14 +226,14 @@ def set_filter_data(record, tumor_index):
     ##
     # AF filter
     ##
-    if tumor_af < constants.MIN_AF:
-        filters.append(constants.VcfFilter.MIN_AF)
+    if tumor_af < min_af:
+        filters.append(rule_plan.filter_min_af)
 
     ##
     # AD filter (general)
     ##
-    if tumor_ad < constants.MIN_AD:
-        filters.append(constants.VcfFilter.MIN_AD)
+    if tumor_ad < min_ad:
+        filters.append(rule_plan.filter_min_ad)
 
     ##
     # AD filter (degraded mappability)
@@ -95,29 +241,13 @@ def set_filter_data(record, tumor_index):
     # If a variant falls within difficult to call regions (low sequence complexity, poor
     # mappability, segemental duplications, etc), increase required minimum allele depth in anticipation of
     # elevated alignment error rate
-    difficult_region_tags_enums = (
-        constants.VcfInfo.DIFFICULT_BAD_PROMOTER,
-        constants.VcfInfo.DIFFICULT_GC15,
-        constants.VcfInfo.DIFFICULT_GC70TO75,
-        constants.VcfInfo.DIFFICULT_GC75TO80,
-        constants.VcfInfo.DIFFICULT_GC80TO85,
-        constants.VcfInfo.DIFFICULT_GC80,
-        constants.VcfInfo.DIFFICULT_LOW_COMPLEXITY_DITR,
-        constants.VcfInfo.DIFFICULT_LOW_COMPLEXITY_QUADTR,
-        constants.VcfInfo.DIFFICULT_LOW_COMPLEXITY_TANDEMREPEATS,
-        constants.VcfInfo.DIFFICULT_LOW_COMPLEXITY_TRITR,
-        constants.VcfInfo.DIFFICULT_MAPPABILITY_NONUNIQUE,
-        constants.VcfInfo.DIFFICULT_SEGDUP,
-    )
-    difficult_region_tags = {e.value for e in difficult_region_tags_enums}
+    if tumor_ad < min_ad_difficult:
 
-    if tumor_ad < constants.MIN_AD_DIFFICULT_REGIONS:
+        if any(record.INFO.get(e) is not None for e in rule_plan.info_difficult_tags):
+            filters.append(rule_plan.filter_min_ad_difficult)
 
-        if any(record.INFO.get(e) is not None for e in difficult_region_tags):
-            filters.append(constants.VcfFilter.MIN_AD_DIFFICULT)
-
-        if record.INFO.get(constants.VcfInfo.GIAB_CONF.value) is None:
-            filters.append(constants.VcfFilter.MIN_AD_NON_GIAB)
+        if record.INFO.get(rule_plan.info_giab_conf) is None:
+            filters.append(rule_plan.filter_min_ad_non_giab)
 
     # NOTE(SW): filter_somatic_vcf from umccr/vcf_stuff includes a mappability filter but the INFO
     # field used to evaluate does not exist in the input annotated VCF, so is not included
@@ -126,24 +256,24 @@ def set_filter_data(record, tumor_index):
     # PON filter
     ##
     # NOTE(SW): 'max' is inclusive - keeps variants with 0 to n-1 PON hits; preserved from Umccrise
-    pon_count = record.INFO.get(constants.VcfInfo.PON_COUNT.value, 0)
-    if pon_count >= constants.PON_HIT_THRESHOLD:
-        filters.append(constants.VcfFilter.PON)
+    pon_count = record.INFO.get(rule_plan.info_pon_count, 0)
+    if pon_count >= pon_hit_threshold:
+        filters.append(rule_plan.filter_pon)
 
     ##
     # ENCODE blocklist filter
     ##
-    if record.INFO.get(constants.VcfInfo.ENCODE.value) is not None:
-        filters.append(constants.VcfFilter.ENCODE)
+    if record.INFO.get(rule_plan.info_encode) is not None:
+        filters.append(rule_plan.filter_encode)
 
     ##
     # Common population variant filter
     ##
     # NOTE(SW): rounding is essential here for accurate comparison; cyvcf2 floating-point error
     # means INFO/gnomAD_AF=0.01 can be represented as 0.009999999776482582
-    gnomad_af = round(record.INFO.get(constants.VcfInfo.GNOMAD_AF.value, 0), 3)
-    if gnomad_af >= constants.MAX_GNOMAD_AF:
-        filters.append(constants.VcfFilter.GNOMAD_COMMON)
+    gnomad_af = round(record.INFO.get(rule_plan.info_gnomad_af, 0), 3)
+    if gnomad_af >= max_gnomad_af:
+        filters.append(rule_plan.filter_gnomad_common)
 
 
     ######################
@@ -162,16 +292,16 @@ def set_filter_data(record, tumor_index):
     ##
     # PCGR tier rescue
     ##
-    pcgr_tier = record.INFO.get(constants.VcfInfo.PCGR_TIER.value)
-    if pcgr_tier in constants.PCGR_TIERS_RESCUE:
-        info_rescue.append(constants.VcfInfo.PCGR_TIER_RESCUE)
+    pcgr_tier = record.INFO.get(rule_plan.info_pcgr_tier)
+    if pcgr_tier in rule_plan.pcgr_tiers_rescue:
+        info_rescue.append(rule_plan.info_pcgr_tier_rescue)
 
     ##
     # SAGE hotspot rescue
     ##
     # NOTE(SW): effectively reverts any FILTERs that may have been applied above
-    if record.INFO.get(constants.VcfInfo.SAGE_HOTSPOT.value) is not None:
-        info_rescue.append(constants.VcfInfo.SAGE_HOTSPOT_RESCUE)
+    if record.INFO.get(rule_plan.info_sage_hotspot) is not None:
+        info_rescue.append(rule_plan.info_sage_hotspot_rescue)
 
     ##
     # Clinical potential rescue; hotspot, driver, otherwise known
@@ -181,21 +311,20 @@ def set_filter_data(record, tumor_index):
     # single CLINICAL_POTENTIAL_RESCUE flag
 
     # Get ClinVar clinical significance entries
-    clinvar_clinsig = record.INFO.get(constants.VcfInfo.PCGR_CLINVAR_CLNSIG.value, '')
-    clinvar_clinsigs = clinvar_clinsig.split(',')
+    clinvar_clinsig = record.INFO.get(rule_plan.info_pcgr_clinvar_clinsig, '')
     # Hit counts in relevant reference somatic mutation databases
-    cosmic_count = record.INFO.get(constants.VcfInfo.PCGR_COSMIC_COUNT.value, 0)
-    tcga_pancancer_count = record.INFO.get(constants.VcfInfo.PCGR_TCGA_PANCANCER_COUNT.value, 0)
-    icgc_pcawg_count = record.INFO.get(constants.VcfInfo.PCGR_ICGC_PCAWG_COUNT.value, 0)
+    cosmic_count = record.INFO.get(rule_plan.info_pcgr_cosmic_count, 0)
+    tcga_pancancer_count = record.INFO.get(rule_plan.info_pcgr_tcga_pancancer_count, 0)
+    icgc_pcawg_count = record.INFO.get(rule_plan.info_pcgr_icgc_pcawg_count, 0)
     if (
-        record.INFO.get(constants.VcfInfo.HMF_HOTSPOT.value) is not None or
-        record.INFO.get(constants.VcfInfo.PCGR_MUTATION_HOTSPOT.value) is not None or
-        any(e in clinvar_clinsigs for e in constants.CLINVAR_CLINSIGS_RESCUE) or
-        cosmic_count >= constants.MIN_COSMIC_COUNT_RESCUE or
-        tcga_pancancer_count >= constants.MIN_TCGA_PANCANCER_COUNT_RESCUE or
-        icgc_pcawg_count >= constants.MIN_ICGC_PCAWG_COUNT_RESCUE
+        record.INFO.get(rule_plan.info_hmf_hotspot) is not None or
+        record.INFO.get(rule_plan.info_pcgr_mutation_hotspot) is not None or
+        rule_plan.is_clinvar_rescue(clinvar_clinsig) or
+        cosmic_count >= min_cosmic_count or
+        tcga_pancancer_count >= min_tcga_pancancer_count or
+        icgc_pcawg_count >= min_icgc_pcawg_count
     ):
-        info_rescue.append(constants.VcfInfo.CLINICAL_POTENTIAL_RESCUE)
+        info_rescue.append(rule_plan.info_clinical_potential_rescue)
 
     ##
     # Apply valid rescues
@@ -207,14 +336,14 @@ def set_filter_data(record, tumor_index):
     rescued_variant = bool(info_rescue)
     if rescue_candidate and rescued_variant:
         # Set rescue info
-        for info_enum in info_rescue:
-            assert record.INFO.get(info_enum.value) is None
-            record.INFO[info_enum.value] = True
+        for info_name in info_rescue:
+            assert record.INFO.get(info_name) is None
+            record.INFO[info_name] = True
         # Add rescued filters
         if record.FILTER:
-            record.INFO['RESCUED_FILTERS_EXISTING'] = record.FILTER.replace(';', ',')
+            record.INFO[rule_plan.info_rescued_filters_existing] = record.FILTER.replace(';', ',')
         if filters:
-            record.INFO['RESCUED_FILTERS_PENDING'] = ','.join(sorted(f.value for f in filters))
+            record.INFO[rule_plan.info_rescued_filters_pending] = ','.join(sorted(filters))
         # Clear filters
         record.FILTER = 'PASS'
         filters = list()
@@ -224,7 +353,161 @@ def set_filter_data(record, tumor_index):
     ## Apply new filters ##
     #######################
     if filters:
-        filters_value = {e.value for e in filters}
+        filters_value = set(filters)
         filters_existing = [e for e in record.FILTERS if e != 'PASS']
         assert all(e not in filters_existing for e in filters_value)
         record.FILTER = ';'.join([*filters_existing, *filters_value])
+
+
+def set_filter_data_batch(records, tumor_index, rule_plan=RULE_PLAN):
+    # Batch equivalent of set_filter_data; this must produce exactly the same output and
+    # set_filter_data should be considered the reference implementation. Required values are
+    # first collected into NumPy columns with a single INFO decode per record, FILTER and rescue
+    # decisions are evaluated as array operations, then only records requiring changes are updated.
+
+    min_af, min_ad, min_ad_difficult, pon_hit_threshold, max_gnomad_af = rule_plan.filter_thresholds
+    min_cosmic_count, min_tcga_pancancer_count, min_icgc_pcawg_count = rule_plan.rescue_thresholds
+
+    # Bits for presence of INFO flags
+    flag_difficult = 1
+    flag_giab = 2
+    flag_encode = 4
+    flag_sage_hotspot = 8
+    flag_hotspot = 16
+    flag_bits = {
+        **{e: flag_difficult for e in rule_plan.info_difficult_tags},
+        rule_plan.info_giab_conf: flag_giab,
+        rule_plan.info_encode: flag_encode,
+        rule_plan.info_sage_hotspot: flag_sage_hotspot,
+        rule_plan.info_hmf_hotspot: flag_hotspot,
+        rule_plan.info_pcgr_mutation_hotspot: flag_hotspot,
+    }
+
+
+    ######################
+    ##  Collect values  ##
+    ######################
+    n = len(records)
+    tumor_af = np.empty(n, dtype=np.float32)
+    tumor_ad = np.empty(n, dtype=np.int64)
+    pon_count = np.empty(n, dtype=np.int64)
+    gnomad_af = np.empty(n, dtype=np.float64)
+    cosmic_count = np.empty(n, dtype=np.int64)
+    tcga_pancancer_count = np.empty(n, dtype=np.int64)
+    icgc_pcawg_count = np.empty(n, dtype=np.int64)
+    flags = np.zeros(n, dtype=np.uint8)
+    pcgr_tier_rescue = np.zeros(n, dtype=bool)
+    clinvar_rescue = np.zeros(n, dtype=bool)
+    has_filter = np.zeros(n, dtype=bool)
+
+    for i, record in enumerate(records):
+        tumor_af[i] = record.format('AF')[tumor_index,0]
+        tumor_ad[i] = record.format('AD')[tumor_index,1]
+
+        info = dict(record.INFO)
+
+        record_flags = 0
+        for key in flag_bits.keys() & info.keys():
+            if info[key] is not None:
+                record_flags |= flag_bits[key]
+        flags[i] = record_flags
+
+        pon_count[i] = info.get(rule_plan.info_pon_count, 0)
+        # NOTE: rounding done here with round() to exactly match set_filter_data
+        gnomad_af[i] = round(info.get(rule_plan.info_gnomad_af, 0), 3)
+        cosmic_count[i] = info.get(rule_plan.info_pcgr_cosmic_count, 0)
+        tcga_pancancer_count[i] = info.get(rule_plan.info_pcgr_tcga_pancancer_count, 0)
+        icgc_pcawg_count[i] = info.get(rule_plan.info_pcgr_icgc_pcawg_count, 0)
+
+        pcgr_tier_rescue[i] = info.get(rule_plan.info_pcgr_tier) in rule_plan.pcgr_tiers_rescue
+        clinvar_rescue[i] = rule_plan.is_clinvar_rescue(info.get(rule_plan.info_pcgr_clinvar_clinsig, ''))
+
+        has_filter[i] = bool(record.FILTER)
+
+
+    ########################
+    ## Variant filtering  ##
+    ########################
+    # FILTER IDs and masks in order of evaluation, as in set_filter_data
+    ad_difficult = tumor_ad < min_ad_difficult
+    filter_ids, filter_masks = zip(
+        (rule_plan.filter_min_af, tumor_af < min_af),
+        (rule_plan.filter_min_ad, tumor_ad < min_ad),
+        (rule_plan.filter_min_ad_difficult, ad_difficult & ((flags & flag_difficult) != 0)),
+        (rule_plan.filter_min_ad_non_giab, ad_difficult & ((flags & flag_giab) == 0)),
+        (rule_plan.filter_pon, pon_count >= pon_hit_threshold),
+        (rule_plan.filter_encode, (flags & flag_encode) != 0),
+        (rule_plan.filter_gnomad_common, gnomad_af >= max_gnomad_af),
+    )
+    filter_bits = np.zeros(n, dtype=np.uint8)
+    for i, mask in enumerate(filter_masks):
+        filter_bits |= mask.astype(np.uint8) << i
+
+
+    ######################
+    ##  Variant rescue  ##
+    ######################
+    # INFO IDs and masks in order of evaluation, as in set_filter_data
+    clinical_potential_rescue = (
+        ((flags & flag_hotspot) != 0) |
+        clinvar_rescue |
+        (cosmic_count >= min_cosmic_count) |
+        (tcga_pancancer_count >= min_tcga_pancancer_count) |
+        (icgc_pcawg_count >= min_icgc_pcawg_count)
+    )
+    rescue_ids, rescue_masks = zip(
+        (rule_plan.info_pcgr_tier_rescue, pcgr_tier_rescue),
+        (rule_plan.info_sage_hotspot_rescue, (flags & flag_sage_hotspot) != 0),
+        (rule_plan.info_clinical_potential_rescue, clinical_potential_rescue),
+    )
+    rescue_bits = np.zeros(n, dtype=np.uint8)
+    for i, mask in enumerate(rescue_masks):
+        rescue_bits |= mask.astype(np.uint8) << i
+
+    rescued = ((filter_bits != 0) | has_filter) & (rescue_bits != 0)
+    filtered = (filter_bits != 0) & ~rescued
+
+
+    ###################
+    ## Apply results ##
+    ###################
+    # Records share a small number of distinct filter and rescue bit combinations, so resolve each
+    # combination once
+    filters_cache = dict()
+    rescues_cache = dict()
+
+    def get_filters(bits):
+        if bits not in filters_cache:
+            filters = [e for i, e in enumerate(filter_ids) if bits >> i & 1]
+            # NOTE: set ordering must be preserved as constructed in set_filter_data
+            filters_cache[bits] = (set(filters), ','.join(sorted(filters)))
+        return filters_cache[bits]
+
+    def get_rescues(bits):
+        if bits not in rescues_cache:
+            rescues_cache[bits] = [e for i, e in enumerate(rescue_ids) if bits >> i & 1]
+        return rescues_cache[bits]
+
+    filter_bits = filter_bits.tolist()
+    rescue_bits = rescue_bits.tolist()
+
+    for i in np.flatnonzero(rescued).tolist():
+        record = records[i]
+        # Set rescue info
+        for info_name in get_rescues(rescue_bits[i]):
+            assert record.INFO.get(info_name) is None
+            record.INFO[info_name] = True
+        # Add rescued filters
+        if record.FILTER:
+            record.INFO[rule_plan.info_rescued_filters_existing] = record.FILTER.replace(';', ',')
+        if filter_bits[i]:
+            record.INFO[rule_plan.info_rescued_filters_pending] = get_filters(filter_bits[i])[1]
+        # Clear filters
+        record.FILTER = 'PASS'
+
+    for i in np.flatnonzero(filtered).tolist():
+        record = records[i]
+        filters, _ = get_filters(filter_bits[i])
+        filters_existing = [e for e in record.FILTERS if e != 'PASS']
+        assert all(e not in filters_existing for e in filters)
+        record.FILTER = ';'.join([*filters_existing, *filters])
@@ -5,11 +5,14 @@ import pathlib
 
 import click
 import cyvcf2
+import numpy as np
 import yaml
 
 
 from ... import util
 from ...common import constants
+from ...common import filter_decisions
+from ...common import metrics
 from ...common import pcgr
 
 
@@ -22,6 +25,7 @@ from ...common import pcgr
 @click.option('--vcf_fp', required=True, type=click.Path(exists=True))
 @click.option('--vcf_filters_fp', required=True, type=click.Path(exists=True))
 @click.option('--vcf_dragen_fp', required=True, type=click.Path(exists=True))
+@click.option('--filter_decisions_fp', required=False, type=click.Path(exists=True))
 
 @click.option('--pcgr_conda', required=False, type=str)
 @click.option('--pcgrr_conda', required=False, type=str)
@@ -59,10 +63,20 @@ def entry(ctx, **kwargs):
         output_dir,
     )
 
+    # NOTE: filter decisions written by smlv_somatic filter are used for counts where provided,
+    # which avoids reading the filters set and PASS VCFs again
+    if kwargs['filter_decisions_fp']:
+        decisions = filter_decisions.read(kwargs['filter_decisions_fp'])
+    else:
+        decisions = None
+
     # Variant type counts
     # NOTE(SW): this is intended to preserve counts in the MultiQC report
     variant_counts_types_dragen = count_variant_types(kwargs['vcf_dragen_fp'])
-    variant_counts_types_bolt= count_variant_types(kwargs['vcf_fp'])
+    if decisions is not None:
+        variant_counts_types_bolt = count_variant_types_decisions(decisions)
+    else:
+        variant_counts_types_bolt = count_variant_types(kwargs['vcf_fp'])
 
     # NOTE(SW): using pass variants only for now
 
@@ -97,7 +111,10 @@ def entry(ctx, **kwargs):
 
     # Variant process counts
     # NOTE(SW): this is intended to preserve counts in the Cancer Report
-    variant_counts_process = count_variant_process(kwargs['vcf_filters_fp'])
+    if decisions is not None:
+        variant_counts_process = count_variant_process_decisions(decisions)
+    else:
+        variant_counts_process = count_variant_process(kwargs['vcf_filters_fp'])
     variant_counts_process_fn = f'{kwargs["tumor_name"]}.somatic.variant_counts_process.json'
     variant_counts_process_fp = output_dir / variant_counts_process_fn
     with variant_counts_process_fp.open('w') as fh:
@@ -134,7 +151,13 @@ def bcftools_stats_prepare(input_fp, tumor_name, output_dir):
     output_fh = cyvcf2.Writer(output_fp, input_fh, 'wz')
 
     tumor_index = input_fh.samples.index(tumor_name)
-    for record in input_fh:
+    records = metrics.iter_records(
+        f'{__name__}.bcftools_stats_prepare',
+        input_fh,
+        input_fp=input_fp,
+        output_fp=output_fp,
+    )
+    for record in records:
         # NOTE(SW): SAGE and DRAGEN quality scores are not comparable; we only get stats of DRAGEN
         # FORMAT/SQ
         if (tumor_sq_value := record.format('SQ')) is not None:
@@ -192,7 +215,12 @@ def count_variant_types(vcf_fp):
         'nonpass': counts_templ.copy(),
     }
 
-    for record in cyvcf2.VCF(vcf_fp):
+    records = metrics.iter_records(
+        f'{__name__}.count_variant_types',
+        cyvcf2.VCF(vcf_fp),
+        input_fp=vcf_fp,
+    )
+    for record in records:
 
         variant_filter = str()
         if record.FILTER is None:
@@ -214,6 +242,30 @@ def count_variant_types(vcf_fp):
     return counts
 
 
+def count_variant_types_decisions(decisions):
+    # Equivalent to count_variant_types for the PASS VCF written by smlv_somatic filter
+    counts_templ = {'snps': 0, 'indels': 0, 'others': 0, 'total_incl_unfiltered': 0}
+
+    counts = {
+        'pass': counts_templ.copy(),
+        'nonpass': counts_templ.copy(),
+    }
+
+    pass_mask = filter_decisions.get_pass_mask(decisions)
+    class_counts = np.bincount(
+        decisions['variant_class'][pass_mask],
+        minlength=len(filter_decisions.VARIANT_CLASSES),
+    )
+    for variant_class, count in zip(filter_decisions.VARIANT_CLASSES, class_counts.tolist()):
+        counts['pass'][variant_class] = count
+
+    for variant_filter, data in counts.items():
+        total = sum(v for v in data.values())
+        counts[variant_filter]['total'] = total
+
+    return counts
+
+
 def count_variant_process(vcf_fp):
     # Set filter groups
     sage_add_info = {
@@ -238,7 +290,12 @@ def count_variant_process(vcf_fp):
         'filter_pass': 0,
     }
 
-    for record in cyvcf2.VCF(vcf_fp):
+    records = metrics.iter_records(
+        f'{__name__}.count_variant_process',
+        cyvcf2.VCF(vcf_fp),
+        input_fp=vcf_fp,
+    )
+    for record in records:
 
         # Restore existing filters to get accurate DRAGEN counts with rescued variants
         rescued_filters = record.INFO.get(constants.VcfInfo.RESCUED_FILTERS_EXISTING.value)
@@ -284,6 +341,18 @@ def count_variant_process(vcf_fp):
     return counts
 
 
+def count_variant_process_decisions(decisions):
+    # Equivalent to count_variant_process for the filters set VCF written by smlv_somatic filter
+    annotated = (decisions['filters'] & filter_decisions.FILTER_ANNOTATION_MASK) == 0
+    counts = {
+        'dragen': int(np.count_nonzero(~decisions['sage_novel'])),
+        'sage': len(decisions['filters']),
+        'annotated': int(np.count_nonzero(annotated)),
+        'filter_pass': int(np.count_nonzero(filter_decisions.get_pass_mask(decisions))),
+    }
+    return counts
+
+
 def parse_purple_purity_file(fp):
     with open(fp, 'r') as fh:
         entries = list(csv.DictReader(fh, delimiter='\t'))
@@ -2,7 +2,10 @@
 # assembly calls only i.e. chr1-22, chrXYM; expected to be done externally for now
 
 
+import heapq
+import itertools
 import pathlib
+import sys
 
 
 import click
@@ -10,7 +13,10 @@ import cyvcf2
 
 
 from ... import util
+from ...common import bgzf
 from ...common import constants
+from ...common import intervals
+from ...common import metrics
 
 
 @click.command(name='rescue')
@@ -25,50 +31,61 @@ from ...common import constants
 
 @click.option('--output_dir', required=True, type=click.Path())
 
+@click.option('--fused', is_flag=True)
+
 def entry(ctx, **kwargs):
     '''Rescue variants using SAGE calls\f
 
     1. Identify existing and novel SAGE calls in hotspots
     2. Rescue/annotate passing variants otherwise update FILTER accordingly with existing SAGE calls
     3. Add new SAGE variants to input VCF
+
+    With --fused, all steps are done in a single streaming pass that writes only the final VCF
     '''
 
     # Create output directory
     output_dir = pathlib.Path(kwargs['output_dir'])
     output_dir.mkdir(mode=0o755, parents=True, exist_ok=True)
 
-    # Select PASS SAGE variants in hotspots and then split into existing and novel calls
-    sage_pass_vcf_fp = select_sage_pass_hotspot(
-        kwargs['sage_vcf_fp'],
+    rescue_fn = rescue_fused if kwargs['fused'] else rescue_staged
+    rescue_fn(
+        kwargs['vcf_fp'],
         kwargs['tumor_name'],
+        kwargs['sage_vcf_fp'],
         kwargs['hotspots_fp'],
         output_dir,
     )
 
-    sage_existing_vcf_fp, sage_novel_vcf_fp = get_sage_existing_and_novel(
-        kwargs['vcf_fp'],
-        sage_pass_vcf_fp,
+
+def rescue_staged(input_fp, tumor_name, sage_vcf_fp, hotspots_fp, output_dir):
+    # Select PASS SAGE variants in hotspots
+    sage_pass_vcf_fp = select_sage_pass_hotspot(
+        sage_vcf_fp,
+        tumor_name,
+        hotspots_fp,
         output_dir,
     )
 
-    # Perform the following for variants re-called by SAGE:
+    # SAGE calls are split into existing and novel calls while streaming the input VCF, then
+    # perform the following for variants re-called by SAGE:
     #  - SAGE FILTER=PASS, input FILTER=PASS:  set INFO/SAGE_HOTSPOT [annotate]
     #  - SAGE FILTER=PASS, input FILTER!=PASS: set INFO/SAGE_HOTSPOT, INFO/SAGE_RESCUE, FILTER=PASS [rescue]
     #  - SAGE FILTER!=PASS:                    append SAGE_lowconf to FILTER [exclude]
     # Additionally transfer SAGE FORMAT/AD, FORMAT/AF, FORMAT/DP, FORMAT/SB with the 'SAGE_' prefix for all
     # re-called variants regardless of FILTER
-    vcf_anno_vcf_fp = annotate_existing_sage_calls(
-        kwargs['vcf_fp'],
-        kwargs['tumor_name'],
-        sage_existing_vcf_fp,
+    vcf_anno_vcf_fp, sage_novel_records = annotate_existing_sage_calls(
+        input_fp,
+        tumor_name,
+        sage_pass_vcf_fp,
         output_dir,
     )
 
     # Combine annotated, existing calls with SAGE novel calls
-    combined_vcf_fp = combine_sage_novel(
-        sage_novel_vcf_fp,
+    return combine_sage_novel(
+        sage_novel_records,
+        sage_pass_vcf_fp,
         vcf_anno_vcf_fp,
-        kwargs['tumor_name'],
+        tumor_name,
         output_dir,
     )
 
@@ -85,28 +102,52 @@ def select_sage_pass_hotspot(input_fp, tumor_name, hotspots_fp, output_dir):
     return output_fp
 
 
-def get_sage_existing_and_novel(input_fp, sage_vcf_fp, output_dir):
-    isec_output_dir = output_dir / 'sage_existing_and_novel_isec/'
+def annotate_existing_sage_calls(input_fp, tumor_name, sage_vcf_fp, output_dir):
+    # Get input file handle
+    input_fh = cyvcf2.VCF(input_fp)
+
+    # Add header entries so that they are included in the output file via templating done below
+    add_sage_header_entries(input_fh)
 
-    util.execute_command(f'bcftools isec -p {isec_output_dir} {input_fp} {sage_vcf_fp}')
+    # Open output file and use header from input file
+    output_fp = output_dir / f'{tumor_name}.anno.vcf.gz'
+    output_fh = bgzf.VcfIndexedWriter(output_fp, input_fh)
+
+    # Both inputs are position sorted so SAGE calls are merge-joined while streaming the input VCF,
+    # holding only SAGE calls at the current position in memory. SAGE calls without a matching input
+    # record are novel and collected for combining with the annotated VCF
+    # NOTE: novel calls are limited to PASS hotspot calls and so are few in number
+    sage_novel_records = list()
+
+    contig_ranks = {contig: i for i, contig in enumerate(input_fh.seqnames)}
+    records = metrics.iter_records(
+        f'{__name__}.annotate_existing_sage_calls',
+        input_fh,
+        input_fp=input_fp,
+        output_fp=output_fp,
+    )
+    sage_records = metrics.iter_records(
+        f'{__name__}.read_sage_calls',
+        cyvcf2.VCF(sage_vcf_fp),
+        input_fp=sage_vcf_fp,
+    )
+    for record, sage_record in iter_sage_existing_and_novel(records, sage_records, contig_ranks):
+        if record is None:
+            sage_novel_records.append(sage_record)
+            continue
 
-    sage_existing_fp = isec_output_dir / '0003.vcf'  # records from sage_fp shared by vcf_fp
-    sage_novel_fp = isec_output_dir / '0001.vcf'  # records private to sage_fp
-    return sage_existing_fp, sage_novel_fp
+        # Annotate records re-called by SAGE, all other records are written unmodified
+        if sage_record is not None:
+            annotate_sage_call(record, sage_record)
+        output_fh.write_record(record)
 
+    # Explicitly close to flush buffer and index output file
+    output_fh.close()
 
-def annotate_existing_sage_calls(input_fp, tumor_name, sage_vcf_fp, output_dir):
-    # Read all SAGE calls into memory
-    sage_calls = dict()
-    for record in cyvcf2.VCF(sage_vcf_fp):
-        key = (record.CHROM, record.POS, record.REF, tuple(record.ALT))
-        assert key not in sage_calls
-        sage_calls[key] = record
+    return output_fp, sage_novel_records
 
-    # Get input file handle
-    input_fh = cyvcf2.VCF(input_fp)
 
-    # Add header entries so that they are included in the output file via templating done below
+def add_sage_header_entries(input_fh):
     util.add_vcf_header_entry(input_fh, constants.VcfFilter.SAGE_LOWCONF)
 
     util.add_vcf_header_entry(input_fh, constants.VcfInfo.SAGE_HOTSPOT)
@@ -120,146 +161,302 @@ def annotate_existing_sage_calls(input_fp, tumor_name, sage_vcf_fp, output_dir):
     util.add_vcf_header_entry(input_fh, constants.VcfFormat.SAGE_DP)
     util.add_vcf_header_entry(input_fh, constants.VcfFormat.SAGE_SB)
 
-    # Open output file and use header from input file
-    output_fp = output_dir / f'{tumor_name}.anno.vcf.gz'
-    output_fh = cyvcf2.Writer(output_fp, input_fh, 'wz')
-
-    # Annotate SAGE recalls
-    for record in input_fh:
-        # Write unmodified records that were not re-called by SAGE
-        key = (record.CHROM, record.POS, record.REF, tuple(record.ALT))
-        if not (sage_record := sage_calls.get(key)):
-            output_fh.write_record(record)
-            continue
 
-        # Perform the following for records re-called by SAGE:
-        #  - SAGE FILTER=PASS, input FILTER=PASS:  set INFO/SAGE_HOTSPOT [annotate]
-        #  - SAGE FILTER=PASS, input FILTER!=PASS: set INFO/SAGE_HOTSPOT, INFO/SAGE_RESCUE, FILTER=PASS [rescue]
-        #  - SAGE FILTER!=PASS:                    append SAGE_lowconf to FILTER [exclude]
-        if sage_record.FILTER is None:
-            record.INFO[constants.VcfInfo.SAGE_HOTSPOT.value] = True
-            if record.FILTER is not None:
-                record.FILTER = 'PASS'
-                record.INFO[constants.VcfInfo.SAGE_RESCUE.value] = True
-        else:
-            record.FILTER = ';'.join([*record.FILTERS, constants.VcfFilter.SAGE_LOWCONF.value])
-
-        # NOTE(SW): previously in Umccrise, the FORMAT/AD and FORMAT/DP from SAGE calls were just used
-        # to overwrite bcbio/DRAGEN equivalents but other data such as FORMAT/AF were not updated.
-        # Here I instead retain these (and other) data by moving them into a new variables with the
-        # form 'FORMAT/SAGE_<name>'.
-
-        # Transfer some SAGE data to the output VCF
-        record.set_format(constants.VcfFormat.SAGE_AD.value, sage_record.format('AD'))
-        record.set_format(constants.VcfFormat.SAGE_AF.value, sage_record.format('AF'))
-        record.set_format(constants.VcfFormat.SAGE_DP.value, sage_record.format('DP'))
-        record.set_format(constants.VcfFormat.SAGE_SB.value, sage_record.format('SB'))
+def annotate_sage_call(record, sage_record):
+    # Perform the following for records re-called by SAGE:
+    #  - SAGE FILTER=PASS, input FILTER=PASS:  set INFO/SAGE_HOTSPOT [annotate]
+    #  - SAGE FILTER=PASS, input FILTER!=PASS: set INFO/SAGE_HOTSPOT, INFO/SAGE_RESCUE, FILTER=PASS [rescue]
+    #  - SAGE FILTER!=PASS:                    append SAGE_lowconf to FILTER [exclude]
+    if sage_record.FILTER is None:
+        record.INFO[constants.VcfInfo.SAGE_HOTSPOT.value] = True
+        if record.FILTER is not None:
+            record.FILTER = 'PASS'
+            record.INFO[constants.VcfInfo.SAGE_RESCUE.value] = True
+    else:
+        record.FILTER = ';'.join([*record.FILTERS, constants.VcfFilter.SAGE_LOWCONF.value])
+
+    # NOTE(SW): previously in Umccrise, the FORMAT/AD and FORMAT/DP from SAGE calls were just used
+    # to overwrite bcbio/DRAGEN equivalents but other data such as FORMAT/AF were not updated.
+    # Here I instead retain these (and other) data by moving them into a new variables with the
+    # form 'FORMAT/SAGE_<name>'.
+
+    # Transfer some SAGE data to the output VCF
+    record.set_format(constants.VcfFormat.SAGE_AD.value, sage_record.format('AD'))
+    record.set_format(constants.VcfFormat.SAGE_AF.value, sage_record.format('AF'))
+    record.set_format(constants.VcfFormat.SAGE_DP.value, sage_record.format('DP'))
+    record.set_format(constants.VcfFormat.SAGE_SB.value, sage_record.format('SB'))
+
+
+def iter_sage_existing_and_novel(records, sage_records, contig_ranks):
+    # Yield (record, sage_record) for each input record where sage_record is the matching SAGE call
+    # if any, and (None, sage_record) for each novel SAGE call. SAGE calls match on position, REF,
+    # and ALT as done by bcftools isec
+    sage_positions = iter_sage_call_positions(sage_records, contig_ranks)
+    sage_position, sage_calls = next(sage_positions, (None, None))
+    sage_existing = set()
+
+    position_last = None
+    for record in records:
+        position = get_record_position(record, contig_ranks)
+        # NOTE: the merge-join requires input records to be sorted in the same contig order
+        assert position_last is None or position >= position_last
+        position_last = position
+        while sage_position is not None and sage_position < position:
+            yield from ((None, r) for k, r in sage_calls.items() if k not in sage_existing)
+            sage_position, sage_calls = next(sage_positions, (None, None))
+            sage_existing = set()
+
+        sage_record = None
+        if sage_position == position:
+            key = (record.REF, tuple(record.ALT))
+            if (sage_record := sage_calls.get(key)) is not None:
+                sage_existing.add(key)
+
+        yield record, sage_record
+
+    while sage_position is not None:
+        yield from ((None, r) for k, r in sage_calls.items() if k not in sage_existing)
+        sage_position, sage_calls = next(sage_positions, (None, None))
+        sage_existing = set()
+
+
+def iter_sage_call_positions(sage_records, contig_ranks):
+    # Yield SAGE calls grouped by position as ((contig rank, position), {(REF, ALT): record})
+    position_last = None
+    sage_calls = dict()
+    for record in sage_records:
+        position = get_record_position(record, contig_ranks)
+        if position != position_last:
+            # NOTE: the merge-join requires SAGE calls to be sorted in the same contig order as the input VCF
+            assert position_last is None or position > position_last
+            if sage_calls:
+                yield position_last, sage_calls
+            position_last = position
+            sage_calls = dict()
+
+        key = (record.REF, tuple(record.ALT))
+        assert key not in sage_calls
+        sage_calls[key] = record
 
-        output_fh.write_record(record)
+    if sage_calls:
+        yield position_last, sage_calls
+
+
+def get_record_position(record, contig_ranks):
+    if (contig_rank := contig_ranks.get(record.CHROM)) is None:
+        message = f'contig {record.CHROM} of record at {record.CHROM}:{record.POS} is not defined in the VCF header'
+        print(f'error: {message}', file=sys.stderr)
+        sys.exit(1)
+    return contig_rank, record.POS
+
+
+def rescue_fused(input_fp, tumor_name, sage_vcf_fp, hotspots_fp, output_dir):
+    # Select PASS SAGE calls in hotspots, split into existing and novel calls, annotate existing
+    # calls, prepare novel calls, and combine in a single pass; output is equivalent to rescue_staged
+    input_fh = cyvcf2.VCF(input_fp)
+    sage_fh = cyvcf2.VCF(sage_vcf_fp)
+    assert input_fh.samples == sage_fh.samples
+
+    add_sage_header_entries(input_fh)
+    header = get_combined_header(input_fh.raw_header, get_sage_novel_header(sage_fh.raw_header))
+
+    contigs = dict.fromkeys([*input_fh.seqnames, *sage_fh.seqnames])
+    contig_ranks = {contig: i for i, contig in enumerate(contigs)}
+
+    # NOTE: bcftools reads BED-like regions files as one-based unless named with a .bed extension;
+    # VCF regions files are detected by content and used as is
+    hotspots_one_based = not str(hotspots_fp).endswith(('.bed', '.bed.gz'))
+    hotspot_regions = intervals.read_regions(hotspots_fp, one_based=hotspots_one_based)
+
+    output_fp = output_dir / f'{tumor_name}.rescued.vcf.gz'
+    output_fh = bgzf.VcfIndexedLineWriter(output_fp, header)
+
+    records = metrics.iter_records(
+        f'{__name__}.rescue_fused',
+        input_fh,
+        input_fp=input_fp,
+        output_fp=output_fp,
+    )
+    sage_records = metrics.iter_records(
+        f'{__name__}.read_sage_calls',
+        sage_fh,
+        input_fp=sage_vcf_fp,
+    )
+    sage_records = select_sage_pass_hotspot_records(sage_records, hotspot_regions)
+
+    def get_position(entry):
+        record = entry[0] if entry[0] is not None else entry[1]
+        return get_record_position(record, contig_ranks)
+
+    # Records at each position are ordered by alleles as done by combine_sage_novel
+    entries = iter_sage_existing_and_novel(records, sage_records, contig_ranks)
+    for _, position_entries in itertools.groupby(entries, key=get_position):
+        position_records = list()
+        for record, sage_record in position_entries:
+            if record is None:
+                position_records.append((sage_record, get_sage_novel_record_str(sage_record)))
+                continue
+            if sage_record is not None:
+                annotate_sage_call(record, sage_record)
+            position_records.append((record, str(record)))
+
+        position_records.sort(key=lambda e: get_alleles_key(e[0]))
+        for record, record_str in position_records:
+            output_fh.write_line(record_str)
 
-    # Explicitly close to flush buffer then index output file
     output_fh.close()
-    util.execute_command(f'bcftools index -t {output_fp}')
 
     return output_fp
 
 
-def combine_sage_novel(sage_novel_fp, anno_fp, tumor_name, output_dir):
+def select_sage_pass_hotspot_records(sage_records, hotspot_regions):
+    # Equivalent to bcftools view -f PASS,. -R <hotspots> with default record overlap
+    for record in sage_records:
+        if record.FILTER is None and intervals.overlaps(hotspot_regions, record.CHROM, record.start, record.end):
+            yield record
+
+
+def combine_sage_novel(sage_novel_records, sage_vcf_fp, anno_fp, tumor_name, output_dir):
 
     # TODO(SW): check whether we need to reorder samples
 
     output_fp = output_dir / f'{tumor_name}.rescued.vcf.gz'
 
-    # We must rename some FORMAT fields to avoid namespace collision between the SAGE and DRAGEN
-    # VCF; the input for the concat operation must also be bgzip compressed and have an index
-    sage_novel_prep_fp = prepare_sage_novel(sage_novel_fp, tumor_name, output_dir)
+    # We must rename some FORMAT fields to avoid namespace collision between the SAGE and DRAGEN VCF
+    sage_novel_prep_fp = prepare_sage_novel(sage_novel_records, sage_vcf_fp, tumor_name, output_dir)
+
+    anno_fh = cyvcf2.VCF(anno_fp)
+    sage_novel_fh = cyvcf2.VCF(sage_novel_prep_fp)
+    assert anno_fh.samples == sage_novel_fh.samples
 
     # Add novel SAGE calls to annotated, existing calls
-    command = fr'''
-        bcftools concat -a {anno_fp} {sage_novel_prep_fp} | \
-          bcftools sort -T $(pwd -P)/bcftools.XXXXXX -m 1G -o {output_fp}
-    '''
-    util.execute_command(command)
+    # NOTE: both inputs are already sorted and so are merged while streaming rather than sorted
+    header = get_combined_header(anno_fh.raw_header, sage_novel_fh.raw_header)
+    contigs = dict.fromkeys([*anno_fh.seqnames, *sage_novel_fh.seqnames])
+    contig_ranks = {contig: i for i, contig in enumerate(contigs)}
+
+    # NOTE: records come from inputs with differing headers and so are written as text
+    output_fh = bgzf.VcfIndexedLineWriter(output_fp, header)
+    records = merge_sorted_records((anno_fh, sage_novel_fh), contig_ranks)
+    records = metrics.iter_records(
+        f'{__name__}.combine_sage_novel',
+        records,
+        input_fp=anno_fp,
+        output_fp=output_fp,
+    )
+    for record in records:
+        output_fh.write_line(str(record))
+    output_fh.close()
 
+    return output_fp
 
-def prepare_sage_novel(input_fp, tumor_name, output_dir):
-    # Annotations to rename
-    # NOTE(SW): here I only rename FORMAT/SB since SAGE measures this differently while others
-    # should be sufficiently interchangeable
-    annotations_rename = (
-        #('FORMAT/AD', constants.VcfFormat.SAGE_AD.value),
-        #('FORMAT/AF', constants.VcfFormat.SAGE_AF.value),
-        #('FORMAT/DP', constants.VcfFormat.SAGE_DP.value),
-        ('FORMAT/SB', constants.VcfFormat.SAGE_SB.value),
-    )
-    # Annotations to retain, all other SAGE annotations will be excluded
-    annotations_retain_info = (
-        util.get_qualified_vcf_annotation(constants.VcfInfo.SAGE_HOTSPOT),
-        util.get_qualified_vcf_annotation(constants.VcfInfo.SAGE_NOVEL),
-    )
-    annotations_retain_format = (
-        util.get_qualified_vcf_annotation(constants.VcfFormat.SAGE_SB),
-        'FORMAT/AD',
-        'FORMAT/AF',
-        'FORMAT/DP',
-    )
 
-    # Write file rename annotations
-    rename_anno_fp = output_dir / 'rename_annotations.tsv'
-    with rename_anno_fp.open('w') as fh:
-        for ann, ann_new in annotations_rename:
-            print(ann, ann_new, sep='\t', file=fh)
-
-    # Get and write required header entries to file
-    header_entries_fp = output_dir / 'header_entries.tsv'
-    with header_entries_fp.open('w') as fh:
-        print(util.get_vcf_header_line(constants.VcfInfo.SAGE_HOTSPOT), file=fh)
-        print(util.get_vcf_header_line(constants.VcfInfo.SAGE_NOVEL), file=fh)
-
-    # NOTE(SW): the fill-tags BCFtools plugin would have been useful here instead of iterating with
-    # awk but unforunately it doesn't seem to support anything other than integer and float INFO
-    # types:
-    #   * https://github.com/samtools/bcftools/blob/1.16/plugins/fill-tags.c#L423-L424
-
-    sage_info_annotations = [constants.VcfInfo.SAGE_HOTSPOT.value, constants.VcfInfo.SAGE_NOVEL.value]
-    sage_info_annotations_str = ';'.join(sage_info_annotations)
-
-    # Build exclude spec: '^{comma delimited INFO},^{comma delimited FORMAT}'
-    annotations_retain_info_str = '^' + ','.join(annotations_retain_info)
-    annotations_retain_format_str = '^' + ','.join(annotations_retain_format)
-    annotations_retain_str = f'{annotations_retain_info_str},{annotations_retain_format_str}'
-
-    # NOTE(SW): the annotate commands must be split so that header lines for INFO/SAGE_HOTSPOT and
-    # INFO/SAGE_NOVEL exist before applying the remove operation; doing in a single annotate
-    # command fails for this reason
-
-    # I prepare the novel SAGE calls as follows:
-    #   1. rename existing SAGE annotations and add required header entries new SAGE annotations
-    #   2. add new SAGE annotations to each call
-    #   3. retrain only target annotations
-    #   4. index output VCF
-    output_fp = f'{tumor_name}.sage.novel.vcf.gz'
-    command = fr'''
-        bcftools annotate \
-            --rename-annots {rename_anno_fp} \
-            --header-lines {header_entries_fp} \
-            {input_fp} | \
-            awk '
-                BEGIN {{ OFS="\t" }}
-                $1 ~ /^#/ {{ print }}
-                $1 !~ /^#/ {{
-                    if (length($8) > 1 ) {{
-                        $8=$8";{sage_info_annotations_str}";
-                    }} else {{
-                        $8="{sage_info_annotations_str}";
-                    }}
-                    print
-                }}
-            ' | \
-            bcftools annotate --remove '{annotations_retain_str}' | \
-            bcftools view -o {output_fp} && \
-            bcftools index -t {output_fp}
-    '''
-    util.execute_command(command)
+def get_combined_header(header, header_other):
+    # Add FILTER, INFO, FORMAT, and contig entries present only in the other header
+    header_lines = header.rstrip('\n').split('\n')
+    header_ids = {get_header_line_id(line) for line in header_lines}
+
+    header_lines_other = list()
+    for line in header_other.rstrip('\n').split('\n'):
+        if (header_id := get_header_line_id(line)) is None or header_id in header_ids:
+            continue
+        header_lines_other.append(line)
+
+    return '\n'.join([*header_lines[:-1], *header_lines_other, header_lines[-1]]) + '\n'
+
+
+def get_header_line_id(line):
+    for line_type in ('FILTER', 'INFO', 'FORMAT', 'contig'):
+        if line.startswith(prefix := f'##{line_type}=<ID='):
+            return line_type, line[len(prefix):].split(',', 1)[0].rstrip('>')
+    return None
+
+
+def merge_sorted_records(input_fhs, contig_ranks):
+    # Merge position sorted records from each input, ordering records at the same position by
+    # alleles to match bcftools sort
+    def get_position(record):
+        return get_record_position(record, contig_ranks)
+
+    records = heapq.merge(*input_fhs, key=get_position)
+    for _, position_records in itertools.groupby(records, key=get_position):
+        yield from sorted(position_records, key=get_alleles_key)
+
+
+def get_alleles_key(record):
+    # NOTE: bcftools sort compares alleles case-insensitively
+    return [allele.lower() for allele in (record.REF, *record.ALT)]
+
+
+# Annotations to rename for novel SAGE calls
+# NOTE(SW): here I only rename FORMAT/SB since SAGE measures this differently while others
+# should be sufficiently interchangeable
+SAGE_NOVEL_FORMAT_RENAME = {
+    'SB': constants.VcfFormat.SAGE_SB.value,
+}
+# Annotations to add and retain for novel SAGE calls, all other SAGE annotations will be excluded
+SAGE_NOVEL_INFO_ADD = (
+    constants.VcfInfo.SAGE_HOTSPOT,
+    constants.VcfInfo.SAGE_NOVEL,
+)
+# NOTE: as with the bcftools '^FORMAT/...' remove spec previously used, FORMAT/GT is not retained
+SAGE_NOVEL_FORMAT_RETAIN = (
+    'AD',
+    'AF',
+    'DP',
+    constants.VcfFormat.SAGE_SB.value,
+)
+
+
+def prepare_sage_novel(sage_novel_records, sage_vcf_fp, tumor_name, output_dir):
+    # I prepare the novel SAGE calls in a single pass as follows:
+    #   1. rename SAGE annotations and add header entries for new SAGE annotations
+    #   2. set new SAGE annotations as the only INFO annotations of each call
+    #   3. retain only target FORMAT annotations
+    #   4. write and index output VCF
+    header = get_sage_novel_header(cyvcf2.VCF(sage_vcf_fp).raw_header)
+
+    output_fp = output_dir / f'{tumor_name}.sage.novel.vcf.gz'
+    output_fh = bgzf.VcfIndexedLineWriter(output_fp, header)
+    for record in sage_novel_records:
+        output_fh.write_line(get_sage_novel_record_str(record))
+    output_fh.close()
 
     return output_fp
+
+
+def get_sage_novel_header(sage_header):
+    header_lines = list()
+    for line in sage_header.rstrip('\n').split('\n'):
+        if line.startswith('##INFO=<'):
+            continue
+        elif line.startswith('##FORMAT=<'):
+            format_id = line[len('##FORMAT=<ID='):].split(',', 1)[0]
+            if (format_id_new := SAGE_NOVEL_FORMAT_RENAME.get(format_id)):
+                line = line.replace(f'ID={format_id},', f'ID={format_id_new},', 1)
+                format_id = format_id_new
+            if format_id not in SAGE_NOVEL_FORMAT_RETAIN:
+                continue
+        elif line.startswith('#CHROM'):
+            header_lines.extend(util.get_vcf_header_line(e) for e in SAGE_NOVEL_INFO_ADD)
+        header_lines.append(line)
+    return '\n'.join(header_lines) + '\n'
+
+
+def get_sage_novel_record_str(record):
+    # CHROM, POS, ID, REF, ALT, QUAL, FILTER, INFO, FORMAT, <samples>
+    tokens = str(record).rstrip('\n').split('\t')
+
+    format_keys = [SAGE_NOVEL_FORMAT_RENAME.get(k, k) for k in tokens[8].split(':')]
+    format_indices = [i for i, k in enumerate(format_keys) if k in SAGE_NOVEL_FORMAT_RETAIN]
+
+    samples = list()
+    for sample_str in tokens[9:]:
+        # NOTE: trailing sample fields may be omitted
+        sample_values = sample_str.split(':')
+        sample_values += ['.'] * (len(format_keys) - len(sample_values))
+        samples.append(':'.join(sample_values[i] for i in format_indices))
+
+    info = ';'.join(e.value for e in SAGE_NOVEL_INFO_ADD)
+    format_str = ':'.join(format_keys[i] for i in format_indices)
+    return '\t'.join([*tokens[:7], info, format_str, *samples]) + '\n'
@@ -8,6 +8,7 @@ import pysam
 
 
 from ... import util
+from ...common import metrics
 
 
 @click.command(name='annotate')
@@ -75,7 +76,13 @@ def compile_variants(sv_fp, cnv_fp, tumor_name, ref_fp, output_dir):
     output_fh = cyvcf2.Writer(output_fp, sv_fh, 'wz')
 
     # SVs
-    for record in sv_fh:
+    records = metrics.iter_records(
+        f'{__name__}.compile_variants',
+        sv_fh,
+        input_fp=sv_fp,
+        output_fp=output_fp,
+    )
+    for record in records:
         record.INFO['SOURCE'] = 'sv_gridss'
         output_fh.write_record(record)
 
@@ -4,6 +4,7 @@ import click
 import cyvcf2
 
 from ... import util
+from ...common import metrics
 from ...external import prioritize_sv
 
 
@@ -86,7 +87,12 @@ def create_sv_tsv(input_fp, tumor_name, output_dir):
 
     print(*header, sep='\t', file=output_fh)
 
-    for record in input_fh:
+    records = metrics.iter_records(
+        f'{__name__}.create_sv_tsv',
+        input_fh,
+        input_fp=input_fp,
+    )
+    for record in records:
 
         if record.FILTER and 'INFERRED' in record.FILTER:
             purple_status = 'INFERRED'
@@ -156,7 +162,12 @@ def create_cnv_tsv(input_fp, tumor_name, output_dir):
 
     print(*header, sep='\t', file=output_fh)
 
-    for record in input_fh:
+    records = metrics.iter_records(
+        f'{__name__}.create_cnv_tsv',
+        input_fh,
+        input_fp=input_fp,
+    )
+    for record in records:
 
         purple_fields_data = list()
         for purple_field in purple_fields:
@@ -0,0 +1,33 @@
+import pathlib
+import shutil
+import tempfile
+import unittest
+
+
+import bolt.common.bgzf as bgzf
+
+
+# Skip tests of code paths that call out to vcfanno where it is not installed
+requires_vcfanno = unittest.skipUnless(shutil.which('vcfanno'), 'vcfanno is not available')
+
+
+class TemporaryDirectoryTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.dirpath = pathlib.Path(self.tmp_dir.name)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+
+def write_vcf(fp, header, lines):
+    # Write a bgzip compressed and indexed VCF; lines are given either as strings or as sequences
+    # of column values and must be position sorted
+    output_fh = bgzf.VcfIndexedLineWriter(fp, header)
+    for line in lines:
+        if not isinstance(line, str):
+            line = '\t'.join(str(e) for e in line)
+        output_fh.write_line(f'{line}\n')
+    output_fh.close()
+    return fp
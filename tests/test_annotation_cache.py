@@ -0,0 +1,112 @@
+import array
+
+
+import numpy as np
+
+
+import bolt.common.annotation_cache as annotation_cache
+import bolt.common.intervals as intervals
+import bolt.common.variant_keys as variant_keys
+
+
+from . import helpers
+
+
+class TestAnnotationCache(helpers.TemporaryDirectoryTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.cache_dir = self.dirpath / 'cache'
+
+        self.bed_fp = self.dirpath / 'regions.bed'
+        self.bed_fp.write_text('chr1\t100\t200\nchr1\t150\t300\nchr2\t0\t50\nchr1\t1000\t1100\n')
+
+    def get_entry_dirs(self):
+        return sorted(fp for fp in self.cache_dir.iterdir() if fp.is_dir())
+
+    def assert_regions_equal(self, regions_a, regions_b):
+        assert regions_a.keys() == regions_b.keys()
+        for contig, (starts, ends) in regions_a.items():
+            assert np.array_equal(starts, regions_b[contig][0])
+            assert np.array_equal(ends, regions_b[contig][1])
+
+
+    def test_load_regions(self):
+        regions = annotation_cache.load_regions(self.cache_dir, self.bed_fp, padding=10)
+        self.assert_regions_equal(regions, intervals.read_regions_arrays(self.bed_fp, padding=10))
+        assert isinstance(regions['chr1'][0], np.memmap)
+
+        # Entries are reused and separate for each set of parameters
+        [entry_dir] = self.get_entry_dirs()
+        annotation_cache.load_regions(self.cache_dir, self.bed_fp, padding=10)
+        assert self.get_entry_dirs() == [entry_dir]
+        annotation_cache.load_regions(self.cache_dir, self.bed_fp)
+        assert len(self.get_entry_dirs()) == 2
+
+    def test_rebuild_on_change(self):
+        annotation_cache.load_regions(self.cache_dir, self.bed_fp)
+
+        self.bed_fp.write_text('chr3\t0\t10\n')
+        regions = annotation_cache.load_regions(self.cache_dir, self.bed_fp)
+        self.assert_regions_equal(regions, intervals.read_regions_arrays(self.bed_fp))
+        assert len(self.get_entry_dirs()) == 2
+
+    def test_variant_lookup(self):
+        keys, checks = np.array([variant_keys.get_key(pos, 'A', 'T') for pos in range(1, 10_000, 7)], dtype=np.uint64).T
+        values = np.arange(len(keys), dtype=np.float64)
+        bloom = variant_keys.build_bloom(keys)
+
+        query_keys, query_checks = np.array(
+            [variant_keys.get_key(pos, 'A', 'T') for pos in range(1, 10_000)],
+            dtype=np.uint64,
+        ).T
+        found, query_values = variant_keys.lookup(keys, checks, values, query_keys, query_checks)
+        found_bloom, query_values_bloom = variant_keys.lookup(keys, checks, values, query_keys, query_checks, bloom=bloom)
+
+        assert found.sum() == len(keys)
+        assert np.array_equal(found, found_bloom)
+        assert np.array_equal(query_values[found], values)
+        assert np.array_equal(query_values_bloom[found], values)
+
+        # No false negatives and a low false positive rate
+        assert variant_keys.bloom_contains(bloom, keys).all()
+        assert variant_keys.bloom_contains(bloom, query_keys[~found]).mean() < 0.05
+
+    def test_variant_lookup_key_collision(self):
+        # Variants sharing a key are distinguished by their checks
+        keys = array.array('Q', [100, 100, 100, 200])
+        checks = array.array('Q', [3, 1, 3, 1])
+        values = array.array('d', [1, 2, 4, 8])
+        keys, checks, values = variant_keys.get_unique_sorted(keys, checks, values, 'max')
+        assert keys.tolist() == [100, 100, 200]
+        assert checks.tolist() == [1, 3, 1]
+        assert values.tolist() == [2, 4, 8]
+
+        found, query_values = variant_keys.lookup(keys, checks, values, [100, 100, 100, 200], [3, 1, 2, 3])
+        assert found.tolist() == [True, True, False, False]
+        assert query_values[found].tolist() == [4, 2]
+
+    def test_variant_lookup_crc32_collision(self):
+        # These alleles have the same CRC32 and so the same key
+        alts = ('ATCAAGCTCAGAATTATTCGTAGA', 'AAGCCCAACAGATGATGATGTTGGAC')
+        [key_a, key_b] = [variant_keys.get_key(100, 'A', alt)[0] for alt in alts]
+        assert key_a == key_b
+
+        header = (
+            '##fileformat=VCFv4.2\n'
+            '##INFO=<ID=PON_COUNT,Number=1,Type=Integer,Description="">\n'
+            '##contig=<ID=chr1,length=248956422>\n'
+            '#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\n'
+        )
+        lines = [('chr1', 100, '.', 'A', alt, '.', '.', f'PON_COUNT={i + 1}') for i, alt in enumerate(alts)]
+        vcf_fp = helpers.write_vcf(self.dirpath / 'pon.vcf.gz', header, lines)
+        keys, checks, values = annotation_cache.load_variants(self.cache_dir, vcf_fp, 'PON_COUNT', op='max')['chr1'][:3]
+        assert len(keys) == 2
+
+        query_keys, query_checks = np.array(
+            [variant_keys.get_key(100, 'A', alt) for alt in (*alts, 'AAAAAAAAAAAAAAAAAAAAAAAAAA')],
+            dtype=np.uint64,
+        ).T
+        found, query_values = variant_keys.lookup(keys, checks, values, query_keys, query_checks)
+        assert found.tolist() == [True, True, False]
+        assert query_values[found].tolist() == [1, 2]
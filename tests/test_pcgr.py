@@ -0,0 +1,309 @@
+import gzip
+import sqlite3
+import sys
+import unittest.mock
+
+
+import cyvcf2
+
+
+import bolt.common.constants as bolt_constants
+import bolt.common.pcgr as pcgr
+import bolt.common.pcgr_cache as pcgr_cache
+import bolt.workflows.smlv_somatic.annotate as smlv_somatic_annotate
+
+
+from . import helpers
+
+
+HEADER_STR = (
+    '##fileformat=VCFv4.2\n'
+    '##contig=<ID=chr1,length=248956422>\n'
+    '##contig=<ID=chr2,length=242193529>\n'
+    '#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\n'
+)
+
+
+class TestPcgrChunks(helpers.TemporaryDirectoryTestCase):
+
+    def setUp(self):
+        super().setUp()
+
+        self.positions = [('chr1', pos) for pos in range(100, 1100, 100)] + [('chr2', 50), ('chr2', 60)]
+        self.input_fp = self.dirpath / 'input.vcf.gz'
+        lines = [(contig, pos, '.', 'A', 'T', '.', 'PASS', '.') for contig, pos in self.positions]
+        helpers.write_vcf(self.input_fp, HEADER_STR, lines)
+
+    def test_write_chunks(self):
+        chunk_fps = pcgr.write_chunks(self.input_fp, len(self.positions), 5, self.dirpath)
+
+        chunk_positions = [[(r.CHROM, r.POS) for r in cyvcf2.VCF(fp)] for fp in chunk_fps]
+        assert [len(p) for p in chunk_positions] == [3, 3, 2, 2, 2]
+        assert [e for p in chunk_positions for e in p] == self.positions
+        assert all(fp.with_suffix('.gz.tbi').exists() for fp in chunk_fps)
+
+    def test_chunk_failure(self):
+        # Chunks pending when another fails are not run
+        chunk_fps_run = list()
+
+        def run_somatic_pcgr(chunk_fp, *args, **kwargs):
+            chunk_fps_run.append(chunk_fp)
+            sys.exit(1)
+
+        with unittest.mock.patch.object(pcgr, 'run_somatic_pcgr', run_somatic_pcgr):
+            with self.assertRaises(SystemExit):
+                pcgr.run_somatic(self.input_fp, self.dirpath, self.dirpath, threads=4, chunk_size=2, workers=1)
+        assert len(chunk_fps_run) == 1
+
+
+class TestPcgrCache(helpers.TemporaryDirectoryTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.cache_fp = self.dirpath / 'cache' / 'pcgr.sqlite'
+
+        self.annotations = {
+            ('chr1', 100, 'A', 'T'): {
+                bolt_constants.VcfInfo.PCGR_TIER: 'TIER_1',
+                bolt_constants.VcfInfo.PCGR_COSMIC_COUNT: 3,
+            },
+            ('chr1', 200, 'AC', 'A'): {
+                bolt_constants.VcfInfo.PCGR_TIER: 'NONCODING',
+                bolt_constants.VcfInfo.PCGR_CSQ: ('T|intron_variant', 'T|upstream_gene_variant'),
+            },
+            ('chr2', 300, 'G', 'C'): dict(),
+        }
+
+    def test_get_annotations(self):
+        with pcgr_cache.open_cache(self.cache_fp) as conn:
+            pcgr_cache.put_annotations(conn, 'v1', self.annotations)
+
+        keys = [*self.annotations, ('chr3', 1, 'A', 'T')]
+        with pcgr_cache.open_cache(self.cache_fp) as conn:
+            assert pcgr_cache.get_annotations(conn, 'v1', keys) == self.annotations
+            # Entries are separate for each PCGR data version
+            assert pcgr_cache.get_annotations(conn, 'v2', keys) == dict()
+
+    def test_evict_least_recently_used(self):
+        keys = list(self.annotations)
+        with pcgr_cache.open_cache(self.cache_fp) as conn:
+            pcgr_cache.put_annotations(conn, 'v1', self.annotations)
+            pcgr_cache.set_last_used(conn, 'v1', keys[:1])
+            pcgr_cache.put_annotations(conn, 'v1', {('chr3', 1, 'A', 'T'): dict()}, max_entries=3)
+            assert pcgr_cache.get_annotations(conn, 'v1', keys).keys() == {keys[0], keys[2]}
+
+
+    def test_lookup_releases_lock(self):
+        with pcgr_cache.open_cache(self.cache_fp) as conn:
+            pcgr_cache.put_annotations(conn, 'v1', self.annotations)
+
+        # Another process can write to the cache between lookups
+        with pcgr_cache.open_cache(self.cache_fp) as conn:
+            pcgr_cache.get_annotations(conn, 'v1', list(self.annotations))
+            assert not conn.in_transaction
+            conn_other = sqlite3.connect(self.cache_fp, timeout=0)
+            pcgr_cache.put_annotations(conn_other, 'v1', {('chr3', 1, 'A', 'T'): dict()})
+            conn_other.commit()
+            conn_other.close()
+
+
+SAMPLES_HEADER_STR = (
+    '##fileformat=VCFv4.2\n'
+    '##FILTER=<ID=PASS,Description="All filters passed">\n'
+    '##FORMAT=<ID=GT,Number=1,Type=String,Description="">\n'
+    '##FORMAT=<ID=DP,Number=1,Type=Integer,Description="">\n'
+    '##FORMAT=<ID=AF,Number=1,Type=Float,Description="">\n'
+    '##contig=<ID=chr1,length=248956422>\n'
+    '#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\tnormal\ttumor\n'
+)
+
+
+class TestPcgrPrepare(helpers.TemporaryDirectoryTestCase):
+
+    def setUp(self):
+        super().setUp()
+
+        self.input_fp = self.dirpath / 'input.vcf.gz'
+        lines = list()
+        for pos, qual, normal_af, tumor_af in ((100, '233.0625', 0, 1), (200, '.', 0.01234, 0.33333), (300, '30', 0.5, 0.25)):
+            lines.append(f'chr1\t{pos}\trs{pos}\tA\tT\t{qual}\tPASS\t.\tGT:DP:AF\t0/0:20:{normal_af}\t0/1:40:{tumor_af}')
+        helpers.write_vcf(self.input_fp, SAMPLES_HEADER_STR, lines)
+
+    def read_records(self, fp):
+        return [line for line in gzip.open(fp, 'rt') if not line.startswith('#')]
+
+    def test_prepare_vcf_somatic(self):
+        output_fp = pcgr.prepare_vcf_somatic(self.input_fp, 'tumor', 'normal', self.dirpath)
+        assert self.read_records(output_fp) == [
+            'chr1\t100\trs100\tA\tT\t233.063\tPASS\tTUMOR_AF=1;TUMOR_DP=40;NORMAL_AF=0;NORMAL_DP=20\n',
+            'chr1\t200\trs200\tA\tT\t.\tPASS\tTUMOR_AF=0.333;TUMOR_DP=40;NORMAL_AF=0.0123;NORMAL_DP=20\n',
+            'chr1\t300\trs300\tA\tT\t30\tPASS\tTUMOR_AF=0.25;TUMOR_DP=40;NORMAL_AF=0.5;NORMAL_DP=20\n',
+        ]
+        assert output_fp.with_suffix('.gz.tbi').exists()
+
+    def test_prepare_during_selection(self):
+        selection_data = smlv_somatic_annotate.write_selection_tier(
+            self.input_fp, 'tumor', 0, bytearray([1, 0, 1]), self.dirpath, normal_name='normal',
+        )
+
+        prepare_dir = self.dirpath / 'prepare'
+        prepare_dir.mkdir()
+        prepare_fp = pcgr.prepare_vcf_somatic(selection_data['filtered'], 'tumor', 'normal', prepare_dir)
+        assert len(self.read_records(selection_data['pcgr_prep'])) == 2
+        assert gzip.open(selection_data['pcgr_prep']).read() == gzip.open(prepare_fp).read()
+
+
+PCGR_VCF_HEADER_STR = (
+    '##fileformat=VCFv4.2\n'
+    '##INFO=<ID=MUTATION_HOTSPOT,Number=.,Type=String,Description="">\n'
+    '##INFO=<ID=TCGA_PANCANCER_COUNT,Number=1,Type=Integer,Description="">\n'
+    '##INFO=<ID=CSQ,Number=.,Type=String,Description="">\n'
+    '##contig=<ID=1,length=248956422>\n'
+    '##contig=<ID=2,length=242193529>\n'
+    '#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\n'
+)
+
+
+PCGR_TSV_COLUMNS = (
+    'CHROM', 'POS', 'REF', 'ALT', 'TIER', 'COSMIC_MUTATION_ID', 'ICGC_PCAWG_OCCURRENCE', 'CSQ', 'TCGA_PANCANCER_COUNT',
+)
+
+
+# Unsorted as with PCGR output
+PCGR_TSV_ROWS = (
+    ('2', '500', 'A', 'T', 'TIER 1', 'COSV1&COSV2', 'BRCA|x|3|10|0.3,LUAD|y|2|5|0.4', 'T|missense', '4'),
+    ('1', '100', 'A', 'T', 'NONCODING', 'NA', 'NA', 'T|intron', 'NA'),
+    ('1', '300', 'G', 'C', 'TIER 4', 'COSV3', 'NA', 'C|synonymous', 'NA'),
+    ('1', '300', 'G', 'A', 'TIER 3', 'NA', 'NA', 'NA', '1'),
+)
+
+
+PCGR_VCF_VARIANTS = (
+    ('1', 100, 'A', 'T', 'TCGA_PANCANCER_COUNT=2;CSQ=T|vcf'),
+    ('1', 200, 'C', 'G', 'MUTATION_HOTSPOT=hs1'),
+    ('1', 300, 'G', 'A', 'CSQ=A|vcf'),
+    ('1', 300, 'G', 'C', '.'),
+    ('2', 500, 'A', 'T', 'MUTATION_HOTSPOT=hs2;TCGA_PANCANCER_COUNT=9'),
+)
+
+
+# Annotations in transfer order, with TSV values taking precedence over VCF values
+PCGR_ANNOTATIONS = {
+    ('chr1', 100, 'A', 'T'): [
+        ('PCGR_CSQ', 'T|intron'),
+        ('PCGR_TIER', 'NONCODING'),
+        ('PCGR_COSMIC_COUNT', 0),
+        ('PCGR_ICGC_PCAWG_COUNT', 0),
+        ('PCGR_TCGA_PANCANCER_COUNT', 2),
+    ],
+    ('chr1', 200, 'C', 'G'): [
+        ('PCGR_MUTATION_HOTSPOT', 'hs1'),
+    ],
+    ('chr1', 300, 'G', 'A'): [
+        ('PCGR_TCGA_PANCANCER_COUNT', '1'),
+        ('PCGR_TIER', 'TIER_3'),
+        ('PCGR_COSMIC_COUNT', 0),
+        ('PCGR_ICGC_PCAWG_COUNT', 0),
+        ('PCGR_CSQ', 'A|vcf'),
+    ],
+    ('chr1', 300, 'G', 'C'): [
+        ('PCGR_CSQ', 'C|synonymous'),
+        ('PCGR_TIER', 'TIER_4'),
+        ('PCGR_COSMIC_COUNT', 1),
+        ('PCGR_ICGC_PCAWG_COUNT', 0),
+    ],
+    ('chr2', 500, 'A', 'T'): [
+        ('PCGR_TCGA_PANCANCER_COUNT', '4'),
+        ('PCGR_CSQ', 'T|missense'),
+        ('PCGR_TIER', 'TIER_1'),
+        ('PCGR_COSMIC_COUNT', 2),
+        ('PCGR_ICGC_PCAWG_COUNT', 5),
+        ('PCGR_MUTATION_HOTSPOT', 'hs2'),
+    ],
+}
+
+
+class TestPcgrAnnotationData(helpers.TemporaryDirectoryTestCase):
+
+    def setUp(self):
+        super().setUp()
+
+        self.tsv_fp = self.dirpath / 'pcgr.tsv'
+        with self.tsv_fp.open('w') as fh:
+            for row in (PCGR_TSV_COLUMNS, *PCGR_TSV_ROWS):
+                print(*row, sep='\t', file=fh)
+
+        self.vcf_fp = self.dirpath / 'pcgr.vcf.gz'
+        lines = [(contig, pos, '.', ref, alt, '.', 'PASS', info) for contig, pos, ref, alt, info in PCGR_VCF_VARIANTS]
+        helpers.write_vcf(self.vcf_fp, PCGR_VCF_HEADER_STR, lines)
+
+        self.info_field_map = {
+            bolt_constants.VcfInfo.PCGR_MUTATION_HOTSPOT: 'MUTATION_HOTSPOT',
+            bolt_constants.VcfInfo.PCGR_TCGA_PANCANCER_COUNT: 'TCGA_PANCANCER_COUNT',
+            bolt_constants.VcfInfo.PCGR_CSQ: 'CSQ',
+        }
+
+    def test_table_entries(self):
+        table = pcgr.collect_annotation_table(
+            self.tsv_fp,
+            self.vcf_fp,
+            self.info_field_map,
+            pcgr.TSV_SOURCE_PCGR,
+        )
+
+        assert len(table) == len(PCGR_ANNOTATIONS)
+        for key, record_ann in PCGR_ANNOTATIONS.items():
+            # Annotation order determines INFO order on transfer
+            assert [(k.value, v) for k, v in table[key].items()] == record_ann
+        assert ('chr2', 500, 'A', 'C') not in table
+        assert type(table[('chr1', 100, 'A', 'T')][bolt_constants.VcfInfo.PCGR_COSMIC_COUNT]) is int
+
+    def test_streamed_matches_table(self):
+        table = pcgr.collect_annotation_table(
+            self.tsv_fp,
+            self.vcf_fp,
+            self.info_field_map,
+            pcgr.TSV_SOURCE_PCGR,
+        )
+        data_streamed = pcgr.StreamedAnnotations(
+            self.tsv_fp,
+            self.vcf_fp,
+            self.info_field_map,
+            pcgr.TSV_SOURCE_PCGR,
+        )
+
+        keys = sorted(PCGR_ANNOTATIONS, key=lambda k: (k[0], k[1]))
+        for key in keys:
+            assert key in data_streamed
+            assert list(data_streamed[key].items()) == list(table[key].items())
+        assert ('chr2', 500, 'A', 'C') not in data_streamed
+
+    def test_table_value_types(self):
+        table = pcgr.annotation_table.AnnotationTable()
+        table.add(('chr1', 1, 'A', 'T'), {bolt_constants.VcfInfo.PCGR_COSMIC_COUNT: 1})
+        table.add(('chr1', 2, 'A', 'T'), {bolt_constants.VcfInfo.PCGR_COSMIC_COUNT: 1.0})
+        assert type(table[('chr1', 2, 'A', 'T')][bolt_constants.VcfInfo.PCGR_COSMIC_COUNT]) is float
+
+    def test_table_duplicate_key(self):
+        table = pcgr.annotation_table.AnnotationTable()
+        for i in range(100):
+            table.add(('chr1', i, 'A', 'T'), dict())
+        with self.assertRaises(ValueError):
+            table.add(('chr1', 50, 'A', 'T'), {bolt_constants.VcfInfo.PCGR_COSMIC_COUNT: 1})
+        assert len(table) == 100
+        assert all(('chr1', i, 'A', 'T') in table for i in range(100))
+
+    def test_entries_cpsr(self):
+        cpsr_tsv_fp = self.dirpath / 'cpsr.tsv'
+        with cpsr_tsv_fp.open('w') as fh:
+            print('GENOMIC_CHANGE', 'CSQ', 'OTHER', sep='\t', file=fh)
+            print('1:g.100A>T', 'T|intron', 'x', sep='\t', file=fh)
+            print('X:g.200AC>A', 'NA', 'y', sep='\t', file=fh)
+
+        info_field_map = {bolt_constants.VcfInfo.CPSR_CSQ: 'CSQ'}
+        columns = pcgr.read_tsv_columns(cpsr_tsv_fp, pcgr.get_tsv_source_columns(pcgr.TSV_SOURCE_CPSR, info_field_map))
+        entries = list(pcgr.get_annotation_entries_tsv_cpsr(columns, info_field_map))
+        assert entries == [
+            (('chr1', 100, 'A', 'T'), {bolt_constants.VcfInfo.CPSR_CSQ: 'T|intron'}),
+            (('chrX', 200, 'AC', 'A'), dict()),
+        ]
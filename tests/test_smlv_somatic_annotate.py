@@ -0,0 +1,294 @@
+import functools
+import unittest
+import unittest.mock
+
+
+import cyvcf2
+
+
+import bolt.workflows.smlv_somatic.annotate as smlv_somatic_annotate
+import bolt.common.constants as bolt_constants
+import bolt.common.vcfanno as vcfanno
+
+
+from . import helpers
+
+
+HEADER_STR = (
+    '##fileformat=VCFv4.2\n'
+    '##FILTER=<ID=PASS,Description="All filters passed">\n'
+    '##FILTER=<ID=weak_evidence,Description="">\n'
+    '##INFO=<ID=HMF_HOTSPOT,Number=0,Type=Flag,Description="">\n'
+    '##INFO=<ID=SAGE_HOTSPOT,Number=0,Type=Flag,Description="">\n'
+    '##INFO=<ID=gnomAD_AF,Number=1,Type=Float,Description="">\n'
+    '##contig=<ID=chr1,length=248956422>\n'
+    '##contig=<ID=chr2,length=242193529>\n'
+    '#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\n'
+)
+
+
+# Retained by tiers: pass_select, common_population, cancer_genes
+VARIANTS = (
+    ('chr1', 100,  'A',    'PASS',          '.'),                           # pass_select, common_population
+    ('chr1', 3997, 'ACGT', 'weak_evidence', '.'),                           # common_population, cancer_genes
+    ('chr1', 3999, 'A',    'PASS',          'gnomAD_AF=0.02'),              # pass_select
+    ('chr1', 4000, 'A',    'weak_evidence', 'gnomAD_AF=0.05'),              # cancer_genes
+    ('chr1', 5000, 'A',    'weak_evidence', 'HMF_HOTSPOT;gnomAD_AF=0.5'),   # all
+    ('chr1', 7000, 'A',    'weak_evidence', 'gnomAD_AF=0.2'),               # cancer_genes
+    ('chr1', 7001, 'A',    'PASS',          '.'),                           # pass_select, common_population
+    ('chr2', 5000, 'A',    'PASS',          'gnomAD_AF=0.3'),               # pass_select
+)
+
+
+def get_variant_lines():
+    return [(contig, pos, '.', ref, 'T', '.', vfilter, info) for contig, pos, ref, vfilter, info in VARIANTS]
+
+
+class TestSmlvSomaticSelectVariants(helpers.TemporaryDirectoryTestCase):
+
+    def setUp(self):
+        super().setUp()
+
+        self.input_fp = helpers.write_vcf(self.dirpath / 'input.vcf.gz', HEADER_STR, get_variant_lines())
+
+        # NOTE: padded and interpreted as one-based, this is the zero-based interval [3999, 7000)
+        self.genes_fp = self.dirpath / 'genes.tsv'
+        self.genes_fp.write_text('chr1\t5000\t6000\tGENE\n')
+
+    def select_variants(self, max_variants):
+        with unittest.mock.patch.object(bolt_constants, 'MAX_SOMATIC_VARIANTS', max_variants):
+            return smlv_somatic_annotate.select_variants(self.input_fp, 'tumor', self.genes_fp, self.dirpath)
+
+
+    def test_tier_counts(self):
+        gene_regions = smlv_somatic_annotate.intervals.read_regions_arrays(self.genes_fp, padding=1000, one_based=True)
+        tier_bits, tier_counts = smlv_somatic_annotate.classify_selection_tiers(self.input_fp, gene_regions)
+        assert list(tier_bits) == [3, 6, 1, 4, 7, 4, 3, 1]
+        assert tier_counts == [5, 4, 4]
+
+
+    def test_select_tier(self):
+        assert self.select_variants(8) == {'selected': self.input_fp}
+        assert self.select_variants(7)['filter_name'] == bolt_constants.VcfFilter.MAX_VARIANTS_NON_PASS.value
+        assert self.select_variants(4)['filter_name'] == bolt_constants.VcfFilter.MAX_VARIANTS_GNOMAD.value
+
+        # Final tier is used regardless of count
+        selection_data = self.select_variants(3)
+        filter_name = bolt_constants.VcfFilter.MAX_VARIANTS_NON_CANCER_GENES.value
+        assert selection_data['filter_name'] == filter_name
+
+        filtered_positions = [r.POS for r in cyvcf2.VCF(selection_data['filtered'])]
+        assert filtered_positions == [3997, 4000, 5000, 7000]
+
+        selected_filters = [r.FILTER for r in cyvcf2.VCF(selection_data['selected'])]
+        assert selected_filters == [
+            filter_name,
+            'weak_evidence',
+            filter_name,
+            'weak_evidence',
+            'weak_evidence',
+            'weak_evidence',
+            filter_name,
+            filter_name,
+        ]
+
+
+VCFANNO_TOML = '''
+[[annotation]]
+file = "gnomad.vcf.gz"
+fields = ["AF"]
+names = ["gnomAD_AF"]
+ops = ["self"]
+
+[[annotation]]
+file = "{giab_fp}"
+columns = [3]
+names = ["GIAB_CONF"]
+ops = ["flag"]
+
+[[annotation]]
+file = "{segdup_fp}"
+columns = [3]
+names = ["DIFFICULT_segdup"]
+ops = ["flag"]
+'''
+
+
+class TestSmlvSomaticRegionFlags(helpers.TemporaryDirectoryTestCase):
+
+    def setUp(self):
+        super().setUp()
+
+        self.input_fp = helpers.write_vcf(self.dirpath / 'input.vcf.gz', HEADER_STR, get_variant_lines())
+
+        self.giab_fp = self.dirpath / 'giab.bed'
+        self.giab_fp.write_text('chr1\t99\t3998\nchr2\t0\t10000\n')
+        self.segdup_fp = self.dirpath / 'segdup.bed'
+        self.segdup_fp.write_text('chr1\t3996\t3997\nchr1\t7000\t8000\n')
+
+        self.toml_fp = self.dirpath / 'vcfanno_annotations.toml'
+        self.toml_fp.write_text(VCFANNO_TOML.format(giab_fp=self.giab_fp, segdup_fp=self.segdup_fp))
+
+    def get_region_flags(self, input_fh):
+        # NOTE: header entries are otherwise taken from vcfanno
+        region_flags, _ = vcfanno.split_region_flags(
+            vcfanno.read_config(self.toml_fp),
+            smlv_somatic_annotate.REGION_FLAG_ANNOTATIONS,
+        )
+        for name, _ in region_flags:
+            input_fh.add_info_to_header({'ID': name, 'Number': 0, 'Type': 'Flag', 'Description': ''})
+        return smlv_somatic_annotate.read_region_flags(region_flags)
+
+    def test_split_config(self):
+        config = vcfanno.read_config(self.toml_fp)
+        region_flags, config_remaining = vcfanno.split_region_flags(
+            config,
+            smlv_somatic_annotate.REGION_FLAG_ANNOTATIONS,
+        )
+        assert region_flags == [('GIAB_CONF', str(self.giab_fp)), ('DIFFICULT_segdup', str(self.segdup_fp))]
+        assert config_remaining == {'annotation': config['annotation'][:1]}
+
+        annotations = vcfanno.select_annotations(config, [name for name, _ in region_flags])
+        assert annotations == config['annotation'][1:]
+
+        toml_fp = vcfanno.write_config(config_remaining, self.dirpath / 'remaining.toml')
+        assert vcfanno.read_config(toml_fp) == config_remaining
+
+    def test_set_region_flags(self):
+        input_fh = cyvcf2.VCF(self.input_fp)
+        flag_regions = self.get_region_flags(input_fh)
+        records = list(input_fh)
+        smlv_somatic_annotate.set_region_flags(records, flag_regions)
+
+        giab_conf = [(r.CHROM, r.POS) for r in records if r.INFO.get('GIAB_CONF') is not None]
+        segdup = [(r.CHROM, r.POS) for r in records if r.INFO.get('DIFFICULT_segdup') is not None]
+        assert giab_conf == [('chr1', 100), ('chr1', 3997), ('chr2', 5000)]
+        assert segdup == [('chr1', 3997), ('chr1', 7001)]
+
+    def test_sharded_records_identical(self):
+        header_fh = cyvcf2.VCF(self.input_fp)
+        flag_regions = self.get_region_flags(header_fh)
+        header_lines = smlv_somatic_annotate.get_added_header_lines(self.input_fp, header_fh)
+        assert [line.split(',')[0] for line in header_lines] == ['##INFO=<ID=GIAB_CONF', '##INFO=<ID=DIFFICULT_segdup']
+
+        records_all = list()
+        for threads in (1, 2):
+            input_fh, records = smlv_somatic_annotate.util.get_processed_vcf_records(
+                self.input_fp,
+                smlv_somatic_annotate.set_filter_pass_and_annotate_records,
+                header_fn=functools.partial(smlv_somatic_annotate.add_header_lines, header_lines=header_lines),
+                threads=threads,
+                batch_size=3,
+                shard_parent_dir=self.dirpath,
+                flag_regions=flag_regions,
+                variant_values=list(),
+            )
+            records_all.append([str(record) for record in records])
+
+        assert records_all[0] == records_all[1]
+        assert len(records_all[0]) == len(VARIANTS)
+        assert all(line.split('\t')[6] in ('PASS', 'weak_evidence') for line in records_all[0])
+
+    @helpers.requires_vcfanno
+    def test_header_matches_vcfanno(self):
+        region_flags, region_flag_annotations, _ = smlv_somatic_annotate.get_region_flag_annotations(self.dirpath)
+
+        input_fh = cyvcf2.VCF(self.input_fp)
+        header_fp = self.dirpath / 'region_flags.header.vcf'
+        smlv_somatic_annotate.add_vcfanno_header_entries(input_fh, region_flag_annotations, header_fp)
+
+        toml_fp = vcfanno.write_config({'annotation': region_flag_annotations}, self.dirpath / 'region_flags.toml')
+        result = smlv_somatic_annotate.util.execute_command(f'vcfanno {toml_fp} {self.input_fp}')
+        vcfanno_fp = self.dirpath / 'vcfanno.vcf'
+        vcfanno_fp.write_text(result.stdout)
+        vcfanno_fh = cyvcf2.VCF(vcfanno_fp)
+        for name, _ in region_flags:
+            assert input_fh.get_header_type(name) == vcfanno_fh.get_header_type(name)
+
+
+PON_HEADER_STR = (
+    '##fileformat=VCFv4.2\n'
+    '##INFO=<ID=PON_COUNT,Number=1,Type=Integer,Description="">\n'
+    '##contig=<ID=chr1,length=248956422>\n'
+    '##contig=<ID=chr2,length=242193529>\n'
+    '#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\n'
+)
+
+
+PON_VARIANTS = (
+    ('chr1', 100,  'A',  'T',   'PON_COUNT=3'),
+    ('chr1', 3997, 'AC', 'A',   'PON_COUNT=7'),
+    ('chr1', 3999, 'A',  'G',   'PON_COUNT=4'),
+    ('chr1', 5000, 'A',  'T,C', 'PON_COUNT=2'),
+    ('chr1', 5000, 'A',  'T',   'PON_COUNT=9'),
+    ('chr2', 5000, 'A',  'T',   'PON_COUNT=1'),
+)
+
+
+PON_TOML = '''
+[[annotation]]
+file = "{pon_fp}"
+fields = ["PON_COUNT"]
+names = ["PON_COUNT"]
+ops = ["max"]
+'''
+
+
+class TestSmlvSomaticVariantLookups(helpers.TemporaryDirectoryTestCase):
+
+    def setUp(self):
+        super().setUp()
+
+        self.input_fp = helpers.write_vcf(self.dirpath / 'input.vcf.gz', HEADER_STR, get_variant_lines())
+
+        self.pon_fp = self.dirpath / 'pon.vcf.gz'
+        lines = [(contig, pos, '.', ref, alt, '.', '.', info) for contig, pos, ref, alt, info in PON_VARIANTS]
+        helpers.write_vcf(self.pon_fp, PON_HEADER_STR, lines)
+
+        self.toml_fp = self.dirpath / 'vcfanno_snps.toml'
+        self.toml_fp.write_text(PON_TOML.format(pon_fp=self.pon_fp))
+
+    def get_pon_counts(self, permissive_overlap=False):
+        config = vcfanno.read_config(self.toml_fp)
+        variant_lookups, config_remaining = smlv_somatic_annotate.get_pon_lookup_annotations(config, permissive_overlap)
+        assert not vcfanno.has_annotations(config_remaining)
+
+        input_fh = cyvcf2.VCF(self.input_fp)
+        input_fh.add_info_to_header({'ID': 'PON_COUNT', 'Number': 1, 'Type': 'Integer', 'Description': ''})
+        variant_values = smlv_somatic_annotate.read_variant_lookups(
+            input_fh,
+            variant_lookups,
+            self.dirpath / 'cache',
+        )
+        records = list(input_fh)
+        smlv_somatic_annotate.set_variant_lookups(records, variant_values)
+        return [(r.CHROM, r.POS, r.INFO['PON_COUNT']) for r in records if r.INFO.get('PON_COUNT') is not None]
+
+    def test_exact_match(self):
+        # Match on position, reference, and allele; values for duplicate variants are combined with op.
+        # The chr1:3999 PON variant overlaps the chr1:3997 deletion but is not matched
+        pon_counts = self.get_pon_counts()
+        assert pon_counts == [('chr1', 100, 3), ('chr1', 5000, 9), ('chr2', 5000, 1)]
+
+    def test_permissive_overlap(self):
+        # PON annotations matching overlapping variants at other positions remain with vcfanno
+        config = vcfanno.read_config(self.toml_fp)
+        variant_lookups, config_remaining = smlv_somatic_annotate.get_pon_lookup_annotations(config, True)
+        assert variant_lookups == list()
+        assert config_remaining == config
+
+    @helpers.requires_vcfanno
+    def test_header_matches_vcfanno(self):
+        config = vcfanno.read_config(self.toml_fp)
+        variant_lookups, _ = smlv_somatic_annotate.get_pon_lookup_annotations(config, False)
+
+        input_fh = cyvcf2.VCF(self.input_fp)
+        header_fp = self.dirpath / 'lookups.header.vcf'
+        annotations = smlv_somatic_annotate.get_variant_lookup_configs(variant_lookups)
+        smlv_somatic_annotate.add_vcfanno_header_entries(input_fh, annotations, header_fp)
+
+        result = smlv_somatic_annotate.util.execute_command(f'vcfanno {self.toml_fp} {self.input_fp}')
+        header_vcfanno_fp = self.dirpath / 'vcfanno.vcf'
+        header_vcfanno_fp.write_text(result.stdout)
+        header_vcfanno = cyvcf2.VCF(header_vcfanno_fp).get_header_type('PON_COUNT')
+        assert input_fh.get_header_type('PON_COUNT') == header_vcfanno
@@ -1,3 +1,4 @@
+import pathlib
 import tempfile
 import unittest
 
@@ -6,13 +7,16 @@ import cyvcf2
 
 
 import bolt.workflows.smlv_somatic.filter as smlv_somatic_filter
+import bolt.workflows.smlv_somatic.report as smlv_somatic_report
 import bolt.common.constants as bolt_constants
+import bolt.common.filter_decisions as filter_decisions
 import bolt.util as bolt_util
 
 
 # TODO(SW): place this helper code to obtain cyvcf2 Variant classes somewhere else
 HEADER_STR = (
     '##fileformat=VCFv4.2\n'
+    '##FILTER=<ID=weak_evidence,Description="">\n'
     '##FORMAT=<ID=AD,Number=.,Type=Integer,Description="">\n'
     '##FORMAT=<ID=AF,Number=A,Type=Float,Description="">\n'
     '##FORMAT=<ID=GT,Number=1,Type=String,Description="">\n'
@@ -35,12 +39,15 @@ def create_vcf(variant_str):
     fh.close()
     return fh.name
 
+def add_header_entries_all(fh):
+    for header_enum in bolt_constants.VCF_HEADER_ENTRIES:
+        bolt_util.add_vcf_header_entry(fh, header_enum)
+
 # Read in as cyvcf2 Variant record; first add all possible header entries
 def get_record_from_str(variant_str):
     fp = create_vcf(variant_str)
     fh = cyvcf2.VCF(fp)
-    for header_enum in bolt_constants.VCF_HEADER_ENTRIES:
-        bolt_util.add_vcf_header_entry(fh, header_enum)
+    add_header_entries_all(fh)
     return next(fh)
 
 
@@ -271,3 +278,83 @@ class TestSmlvSomaticFilter(unittest.TestCase):
         assert not record.FILTER
         assert record.INFO.get(bolt_constants.VcfInfo.RESCUED_FILTERS_PENDING.value) is None
         assert record.INFO.get(rescued_filters_str) == 'DIFFICULT_segdup'
+
+
+
+
+    def test_batch_matches_reference(self):
+        info_data_sets = [
+            {},
+            {'GIAB_CONF': ''},
+            {'DIFFICULT_segdup': '', 'GIAB_CONF': ''},
+            {'DIFFICULT_segdup': '', 'ENCODE': ''},
+            {'PON_COUNT': 4, 'GIAB_CONF': ''},
+            {'PON_COUNT': 5},
+            {'gnomAD_AF': 0.0095},
+            {'gnomAD_AF': 0.0094, 'GIAB_CONF': ''},
+            {'gnomAD_AF': 0.2, 'PON_COUNT': 9, 'ENCODE': ''},
+            {'PCGR_TIER': 'TIER_2'},
+            {'PCGR_TIER': 'TIER_3', 'GIAB_CONF': ''},
+            {'SAGE_HOTSPOT': '', 'GIAB_CONF': ''},
+            {'HMF_HOTSPOT': '', 'PON_COUNT': 6},
+            {'PCGR_CLINVAR_CLNSIG': 'benign,pathogenic'},
+            {'PCGR_CLINVAR_CLNSIG': 'benign'},
+            {'PCGR_COSMIC_COUNT': 10, 'PCGR_ICGC_PCAWG_COUNT': 4},
+            {'PCGR_TCGA_PANCANCER_COUNT': 5, 'SAGE_HOTSPOT': '', 'PCGR_TIER': 'TIER_1'},
+        ]
+
+        records_ref = list()
+        records_batch = list()
+        for record_data in self.records.values():
+            for info_data in info_data_sets:
+                for vfilter in ['.', 'PASS', 'DIFFICULT_segdup']:
+                    records_ref.append(get_record(**record_data, vfilter=vfilter, info_data=info_data))
+                    records_batch.append(get_record(**record_data, vfilter=vfilter, info_data=info_data))
+
+        for record in records_ref:
+            smlv_somatic_filter.set_filter_data(record, 0)
+        smlv_somatic_filter.set_filter_data_batch(records_batch, 0)
+
+        for record_ref, record_batch in zip(records_ref, records_batch):
+            assert str(record_batch) == str(record_ref)
+
+
+    def test_filter_decisions_counts(self):
+        variants = list()
+        for record_data in self.records.values():
+            for info_data in [{}, {'GIAB_CONF': ''}, {'HMF_HOTSPOT': ''}, {'SAGE_NOVEL': ''}, {'PON_COUNT': 6}]:
+                for vfilter in ['.', 'PASS', 'max_variants_gnomad', 'weak_evidence']:
+                    for ref, alt in [('A', 'T'), ('A', 'AT'), ('A', '<DEL>')]:
+                        info_str = ';'.join(f'{k}={v}' if v else k for k, v in info_data.items()) or '.'
+                        format_data = record_data['format_data']
+                        variants.append([
+                            'chr1', str(len(variants) + 1), '.', ref, alt, '.', vfilter, info_str,
+                            ':'.join(format_data.keys()), ':'.join(format_data.values()),
+                        ])
+
+        with tempfile.TemporaryDirectory() as dirpath:
+            input_fp = create_vcf(''.join('\t'.join(e) + '\n' for e in variants))
+            filters_fp = pathlib.Path(dirpath) / 'filters_set.vcf.gz'
+            pass_fp = pathlib.Path(dirpath) / 'pass.vcf.gz'
+            decisions_fp = pathlib.Path(dirpath) / 'filter_decisions.npz'
+
+            collector = filter_decisions.FilterDecisionCollector()
+            bolt_util.process_vcf_records(
+                input_fp,
+                filters_fp,
+                smlv_somatic_filter.process_records_batch,
+                header_fn=add_header_entries_all,
+                batch_size=50,
+                extra_outputs={pass_fp: smlv_somatic_filter.is_pass},
+                collect_fn=collector.add,
+                tumor_index=0,
+            )
+            collector.write(decisions_fp)
+            decisions = filter_decisions.read(decisions_fp)
+
+            counts_process = smlv_somatic_report.count_variant_process(filters_fp)
+            assert smlv_somatic_report.count_variant_process_decisions(decisions) == counts_process
+
+            counts_types = smlv_somatic_report.count_variant_types(pass_fp)
+            assert smlv_somatic_report.count_variant_types_decisions(decisions) == counts_types
+            assert all(counts_types['pass'][k] > 0 for k in ('snps', 'indels', 'others'))
@@ -0,0 +1,293 @@
+import gzip
+import itertools
+import pathlib
+
+
+import cyvcf2
+import pysam.bcftools
+
+
+import bolt.workflows.smlv_somatic.rescue as smlv_somatic_rescue
+import bolt.common.bgzf as bgzf
+import bolt.common.constants as bolt_constants
+import bolt.util as bolt_util
+
+
+from . import helpers
+
+
+HEADER_STR = (
+    '##fileformat=VCFv4.2\n'
+    '##FILTER=<ID=PASS,Description="All filters passed">\n'
+    '##FILTER=<ID=weak_evidence,Description="">\n'
+    '##FILTER=<ID=maxDepth,Description="">\n'
+    '##FORMAT=<ID=GT,Number=1,Type=String,Description="">\n'
+    '##FORMAT=<ID=AD,Number=R,Type=Integer,Description="">\n'
+    '##FORMAT=<ID=AF,Number=1,Type=Float,Description="">\n'
+    '##FORMAT=<ID=DP,Number=1,Type=Integer,Description="">\n'
+    '##FORMAT=<ID=SB,Number=1,Type=Float,Description="">\n'
+    '##FORMAT=<ID=RC_CNT,Number=7,Type=Integer,Description="">\n'
+    '##contig=<ID=chr1,length=248956422>\n'
+    '##contig=<ID=chr2,length=242193529>\n'
+    '##contig=<ID=chr10,length=133797422>\n'
+    '#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\ttumor\n'
+)
+
+
+INPUT_VARIANTS = (
+    ('chr1',  100, 'A', 'T', 'PASS'),
+    ('chr1',  100, 'A', 'G', 'weak_evidence'),
+    ('chr1',  200, 'C', 'T', 'weak_evidence'),
+    ('chr2',  50,  'G', 'A', 'weak_evidence'),
+    ('chr10', 10,  'T', 'C', 'PASS'),
+)
+
+
+SAGE_VARIANTS = (
+    ('chr1',  100, 'A', 'G', 'PASS'),
+    ('chr1',  100, 'A', 'T', 'PASS'),
+    ('chr1',  150, 'G', 'C', 'PASS'),
+    ('chr2',  50,  'G', 'A', 'maxDepth'),
+    ('chr10', 5,   'C', 'A', 'PASS'),
+    ('chr10', 10,  'T', 'C', 'PASS'),
+)
+
+
+def write_vcf(fp, variants):
+    lines = list()
+    for i, (contig, pos, ref, alt, vfilter) in enumerate(variants):
+        lines.append((contig, pos, '.', ref, alt, '.', vfilter, '.', 'GT:AD:AF:DP:SB', f'0/1:10,{i}:0.{i}:{10+i}:0.5'))
+    helpers.write_vcf(fp, HEADER_STR, lines)
+
+
+class TestSmlvSomaticRescue(helpers.TemporaryDirectoryTestCase):
+
+    def setUp(self):
+        super().setUp()
+
+        self.input_fp = self.dirpath / 'input.vcf.gz'
+        self.sage_fp = self.dirpath / 'sage.vcf.gz'
+        write_vcf(self.input_fp, INPUT_VARIANTS)
+        write_vcf(self.sage_fp, SAGE_VARIANTS)
+
+    def test_annotate_existing_sage_calls(self):
+        output_fp, sage_novel_records = smlv_somatic_rescue.annotate_existing_sage_calls(
+            self.input_fp,
+            'tumor',
+            self.sage_fp,
+            self.dirpath,
+        )
+
+        records = list(cyvcf2.VCF(output_fp))
+        assert [(r.CHROM, r.POS, r.ALT[0]) for r in records] == [v[0:2] + v[3:4] for v in INPUT_VARIANTS]
+
+        hotspot = [r.INFO.get(bolt_constants.VcfInfo.SAGE_HOTSPOT.value) for r in records]
+        rescue = [r.INFO.get(bolt_constants.VcfInfo.SAGE_RESCUE.value) for r in records]
+        assert hotspot == [True, True, None, None, True]
+        assert rescue == [None, True, None, None, None]
+
+        assert [r.FILTER for r in records] == [None, None, 'weak_evidence', 'weak_evidence;SAGE_lowconf', None]
+
+        # SAGE data is transferred from the matching call
+        sage_ad = [r.format(bolt_constants.VcfFormat.SAGE_AD.value) for r in records]
+        assert [None if d is None else d[0][1] for d in sage_ad] == [1, 0, None, 3, 5]
+
+        # SAGE calls without a matching input record are novel
+        assert [(r.CHROM, r.POS) for r in sage_novel_records] == [('chr1', 150), ('chr10', 5)]
+
+    def test_prepare_sage_novel(self):
+        _, sage_novel_records = smlv_somatic_rescue.annotate_existing_sage_calls(
+            self.input_fp,
+            'tumor',
+            self.sage_fp,
+            self.dirpath,
+        )
+
+        output_fp = smlv_somatic_rescue.prepare_sage_novel(
+            sage_novel_records,
+            self.sage_fp,
+            'tumor',
+            self.dirpath,
+        )
+        assert output_fp == self.dirpath / 'tumor.sage.novel.vcf.gz'
+
+        output_fh = cyvcf2.VCF(output_fp)
+        header_ids = {(h.type, h.info().get('ID')) for h in output_fh.header_iter()}
+        assert ('INFO', 'SAGE_HOTSPOT') in header_ids
+        assert ('INFO', 'SAGE_NOVEL') in header_ids
+        assert ('FORMAT', 'SAGE_SB') in header_ids
+        assert ('FORMAT', 'GT') not in header_ids
+        assert ('FORMAT', 'SB') not in header_ids
+        assert ('FORMAT', 'RC_CNT') not in header_ids
+
+        records = list(output_fh)
+        assert [(r.CHROM, r.POS) for r in records] == [('chr1', 150), ('chr10', 5)]
+        for record in records:
+            assert str(record).split('\t')[8] == 'AD:AF:DP:SAGE_SB'
+            assert dict(record.INFO) == {'SAGE_HOTSPOT': True, 'SAGE_NOVEL': True}
+        assert records[1].format('SAGE_SB')[0][0] == 0.5
+
+    def test_prepare_sage_novel_matches_bcftools(self):
+        # Novel calls prepared as previously done with bcftools annotate, via pysam
+        sage_novel_records = [r for r in cyvcf2.VCF(self.sage_fp) if r.POS in {5, 150}]
+
+        sage_novel_fp = self.dirpath / 'sage_novel.vcf'
+        sage_novel_fp.write_text(cyvcf2.VCF(self.sage_fp).raw_header + ''.join(str(r) for r in sage_novel_records))
+        rename_fp = self.dirpath / 'rename_annotations.tsv'
+        rename_fp.write_text('FORMAT/SB\tSAGE_SB\n')
+        header_entries_fp = self.dirpath / 'header_entries.tsv'
+        header_entries_fp.write_text(
+            bolt_util.get_vcf_header_line(bolt_constants.VcfInfo.SAGE_HOTSPOT) + '\n' +
+            bolt_util.get_vcf_header_line(bolt_constants.VcfInfo.SAGE_NOVEL) + '\n'
+        )
+        renamed_fp = self.dirpath / 'sage_novel.renamed.vcf'
+        pysam.bcftools.annotate(
+            '--rename-annots', str(rename_fp),
+            '--header-lines', str(header_entries_fp),
+            '-o', str(renamed_fp),
+            str(sage_novel_fp),
+            catch_stdout=False,
+        )
+        flagged_fp = self.dirpath / 'sage_novel.flagged.vcf'
+        with renamed_fp.open('r') as in_fh, flagged_fp.open('w') as out_fh:
+            for line in in_fh:
+                if not line.startswith('#'):
+                    tokens = line.split('\t')
+                    tokens[7] = 'SAGE_HOTSPOT;SAGE_NOVEL'
+                    line = '\t'.join(tokens)
+                out_fh.write(line)
+        expected_fp = self.dirpath / 'sage_novel.expected.vcf'
+        pysam.bcftools.annotate(
+            '--remove', '^INFO/SAGE_HOTSPOT,INFO/SAGE_NOVEL,^FORMAT/SAGE_SB,FORMAT/AD,FORMAT/AF,FORMAT/DP',
+            '-o', str(expected_fp),
+            str(flagged_fp),
+            catch_stdout=False,
+        )
+
+        output_fp = smlv_somatic_rescue.prepare_sage_novel(
+            sage_novel_records,
+            self.sage_fp,
+            'tumor',
+            self.dirpath,
+        )
+
+        expected_fh = cyvcf2.VCF(expected_fp)
+        output_fh = cyvcf2.VCF(output_fp)
+        get_header_ids = lambda fh: [(h.type, h.info().get('ID')) for h in fh.header_iter() if h.type in {'INFO', 'FORMAT'}]
+        assert sorted(get_header_ids(output_fh)) == sorted(get_header_ids(expected_fh))
+        assert [str(r) for r in output_fh] == [str(r) for r in expected_fh]
+
+    def test_combine_sage_novel(self):
+        anno_fp, sage_novel_records = smlv_somatic_rescue.annotate_existing_sage_calls(
+            self.input_fp,
+            'tumor',
+            self.sage_fp,
+            self.dirpath,
+        )
+
+        output_fp = smlv_somatic_rescue.combine_sage_novel(
+            sage_novel_records,
+            self.sage_fp,
+            anno_fp,
+            'tumor',
+            self.dirpath,
+        )
+        assert pathlib.Path(f'{output_fp}.tbi').exists()
+
+        output_fh = cyvcf2.VCF(output_fp)
+        assert output_fh.get_header_type(bolt_constants.VcfInfo.SAGE_NOVEL.value)
+
+        # Records at the same position are ordered by alleles
+        records = [(r.CHROM, r.POS, r.ALT[0]) for r in output_fh]
+        assert records == [
+            ('chr1', 100, 'G'),
+            ('chr1', 100, 'T'),
+            ('chr1', 150, 'C'),
+            ('chr1', 200, 'T'),
+            ('chr2', 50, 'A'),
+            ('chr10', 5, 'A'),
+            ('chr10', 10, 'C'),
+        ]
+
+    def test_unsorted_input(self):
+        contig_ranks = {'chr1': 0, 'chr2': 1, 'chr10': 2}
+        records = [cyvcf2.VCF(self.input_fp)('chr2'), cyvcf2.VCF(self.input_fp)('chr1')]
+        entries = smlv_somatic_rescue.iter_sage_existing_and_novel(
+            itertools.chain(*records),
+            cyvcf2.VCF(self.sage_fp),
+            contig_ranks,
+        )
+        with self.assertRaises(AssertionError):
+            list(entries)
+
+    def test_undefined_contig(self):
+        contig_ranks = {'chr1': 0, 'chr2': 1}
+        entries = smlv_somatic_rescue.iter_sage_existing_and_novel(
+            cyvcf2.VCF(self.input_fp),
+            cyvcf2.VCF(self.sage_fp),
+            contig_ranks,
+        )
+        with self.assertRaises(SystemExit):
+            list(entries)
+
+    def test_select_hotspots_vcf(self):
+        # Hotspot VCF records span POS to POS+len(REF)-1, so the deletion covers chr10:5
+        hotspots = (
+            ('chr1',  150, 'G',  'C', '.'),
+            ('chr2',  50,  'G',  'A', '.'),
+            ('chr10', 4,   'TC', 'T', '.'),
+        )
+        hotspots_fp = self.dirpath / 'hotspots.vcf.gz'
+        write_vcf(hotspots_fp, hotspots)
+        hotspots_plain_fp = self.dirpath / 'hotspots.vcf'
+        hotspots_plain_fp.write_bytes(gzip.decompress(hotspots_fp.read_bytes()))
+
+        for fp in (hotspots_fp, hotspots_plain_fp):
+            hotspot_regions = smlv_somatic_rescue.intervals.read_regions(fp, one_based=True)
+            assert hotspot_regions == {'chr1': ([149], [150]), 'chr2': ([49], [50]), 'chr10': ([3], [5])}
+
+            records = smlv_somatic_rescue.select_sage_pass_hotspot_records(cyvcf2.VCF(self.sage_fp), hotspot_regions)
+            assert [(r.CHROM, r.POS) for r in records] == [('chr1', 150), ('chr10', 5)]
+
+    def test_rescue_fused(self):
+        # Emulate hotspot selection of the staged path, which uses bcftools view
+        sage_pass_fp = self.dirpath / 'sage.hotspot_pass.vcf.gz'
+        sage_fh = cyvcf2.VCF(self.sage_fp)
+        sage_pass_fh = bgzf.VcfIndexedWriter(sage_pass_fp, sage_fh)
+        for record in sage_fh:
+            if record.FILTER is None and record.CHROM in {'chr1', 'chr10'}:
+                sage_pass_fh.write_record(record)
+        sage_pass_fh.close()
+
+        hotspots_fp = self.dirpath / 'hotspots.bed'
+        hotspots_fp.write_text('chr1\t0\t1000\nchr10\t0\t100\n')
+
+        staged_dir = self.dirpath / 'staged'
+        staged_dir.mkdir()
+        anno_fp, sage_novel_records = smlv_somatic_rescue.annotate_existing_sage_calls(
+            self.input_fp,
+            'tumor',
+            sage_pass_fp,
+            staged_dir,
+        )
+        staged_fp = smlv_somatic_rescue.combine_sage_novel(
+            sage_novel_records,
+            sage_pass_fp,
+            anno_fp,
+            'tumor',
+            staged_dir,
+        )
+
+        fused_dir = self.dirpath / 'fused'
+        fused_dir.mkdir()
+        fused_fp = smlv_somatic_rescue.rescue_fused(
+            self.input_fp,
+            'tumor',
+            self.sage_fp,
+            hotspots_fp,
+            fused_dir,
+        )
+
+        # Only the final output is written
+        assert sorted(fused_dir.iterdir()) == [fused_fp, pathlib.Path(f'{fused_fp}.tbi')]
+        assert [str(r) for r in cyvcf2.VCF(fused_fp)] == [str(r) for r in cyvcf2.VCF(staged_fp)]
@@ -0,0 +1,210 @@
+import gzip
+import json
+import os
+import pathlib
+
+
+import cyvcf2
+
+
+import bolt.common.metrics as bolt_metrics
+import bolt.util as bolt_util
+
+
+from . import helpers
+
+
+HEADER_STR = (
+    '##fileformat=VCFv4.2\n'
+    '##FILTER=<ID=PASS,Description="All filters passed">\n'
+    '##FILTER=<ID=lowqual,Description="">\n'
+    '##FORMAT=<ID=GT,Number=1,Type=String,Description="">\n'
+    '##FORMAT=<ID=AF,Number=A,Type=Float,Description="">\n'
+    '##contig=<ID=chr1,length=248956422>\n'
+    '##contig=<ID=chr2,length=242193529>\n'
+    '##contig=<ID=chr3,length=198295559>\n'
+    '##contig=<ID=chrM,length=16569>\n'
+    '#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\tsample\n'
+)
+
+
+def create_indexed_vcf(dirpath, contigs=('chr2', 'chr1', 'chrM'), count=500):
+    # NOTE: contigs are deliberately written out of header order
+    lines = list()
+    for contig in contigs:
+        for i in range(count):
+            vfilter = 'lowqual' if i % 3 == 0 else '.'
+            af = (i % 100) / 100
+            lines.append((contig, i * 10 + 1, '.', 'A', 'T', '.', vfilter, '.', 'GT:AF', f'0/1:{af}'))
+
+    vcf_gz_fp = pathlib.Path(dirpath) / 'input.vcf.gz'
+    helpers.write_vcf(vcf_gz_fp, HEADER_STR, lines)
+
+    return vcf_gz_fp
+
+
+def add_header_entries(fh):
+    fh.add_info_to_header({'ID': 'TEST', 'Number': '0', 'Type': 'Flag', 'Description': ''})
+
+
+def process_record(record, drop_contig):
+    if record.CHROM == drop_contig:
+        return None
+    if record.FILTER is None:
+        record.FILTER = 'PASS'
+        record.INFO['TEST'] = True
+    return record
+
+
+class TestProcessVcfRecords(helpers.TemporaryDirectoryTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.input_fp = create_indexed_vcf(self.dirpath)
+
+    def run_process(self, threads):
+        output_fp = self.dirpath / f'output.threads_{threads}.vcf.gz'
+        pass_fp = self.dirpath / f'output.threads_{threads}.pass.vcf.gz'
+        bolt_util.process_vcf_records(
+            self.input_fp,
+            output_fp,
+            process_record,
+            header_fn=add_header_entries,
+            threads=threads,
+            extra_outputs={pass_fp: lambda r: r.FILTER is None},
+            drop_contig='chrM',
+        )
+        return output_fp, pass_fp
+
+
+    def test_index_contig_order(self):
+        contigs = bolt_util.get_vcf_index_contigs(self.input_fp)
+        assert contigs == ['chr2', 'chr1', 'chrM']
+
+
+    def test_sharded_output_identical(self):
+        serial_fps = self.run_process(threads=1)
+        sharded_fps = self.run_process(threads=3)
+
+        for serial_fp, sharded_fp in zip(serial_fps, sharded_fps):
+            assert serial_fp.read_bytes() == sharded_fp.read_bytes()
+            assert pathlib.Path(f'{serial_fp}.tbi').read_bytes() == pathlib.Path(f'{sharded_fp}.tbi').read_bytes()
+
+        sharded_fp, pass_fp = sharded_fps
+
+        records = list(cyvcf2.VCF(sharded_fp))
+        assert len(records) == 1000
+        assert [r.CHROM for r in records[::500]] == ['chr2', 'chr1']
+        assert all(r.FILTER in ('lowqual', None) for r in records)
+        assert sum(r.INFO.get('TEST') is not None for r in records) == 666
+
+        pass_records = list(cyvcf2.VCF(pass_fp))
+        assert len(pass_records) == 666
+        assert all(r.FILTER is None for r in pass_records)
+
+
+    def test_output_index_query(self):
+        output_fp, pass_fp = self.run_process(threads=1)
+        output_fh = cyvcf2.VCF(output_fp)
+        assert len(list(output_fh('chr1:1-1000'))) == 100
+        assert len(list(output_fh('chr2:4001-4991'))) == 100
+        assert len(list(cyvcf2.VCF(pass_fp)('chr1:1-1000'))) == 66
+
+
+class TestCountVcfRecords(helpers.TemporaryDirectoryTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.input_fp = create_indexed_vcf(self.dirpath)
+
+
+    def test_count_from_index(self):
+        assert bolt_util.get_vcf_index_record_count(self.input_fp) == 1500
+        assert bolt_util.count_vcf_records(self.input_fp) == 1500
+
+
+    def test_count_without_index(self):
+        pathlib.Path(f'{self.input_fp}.tbi').unlink()
+        assert bolt_util.get_vcf_index_record_count(self.input_fp) is None
+        assert bolt_util.count_vcf_records(self.input_fp) == 1500
+        assert bolt_util.count_vcf_lines(self.input_fp, chunk_size=100) == 1500
+        uncompressed_fp = self.dirpath / 'input.vcf'
+        uncompressed_fp.write_bytes(gzip.decompress(self.input_fp.read_bytes()))
+        assert bolt_util.count_vcf_lines(uncompressed_fp) == 1500
+
+
+    def test_count_stale_index(self):
+        index_fp = pathlib.Path(f'{self.input_fp}.tbi')
+        index_mtime = self.input_fp.stat().st_mtime - 10
+        os.utime(index_fp, (index_mtime, index_mtime))
+        assert bolt_util.get_vcf_index_record_count(self.input_fp) is None
+
+
+class TestExecuteCommandStdin(helpers.TemporaryDirectoryTestCase):
+
+    def setUp(self):
+        super().setUp()
+
+
+    def test_stream_to_pipeline(self):
+        output_fp = self.dirpath / 'output.txt'
+        with bolt_util.execute_command_stdin(f'sed "s/^/line /" | gzip -c > {output_fp}') as fh:
+            for i in range(100_000):
+                fh.write(f'{i}\n')
+
+        with gzip.open(output_fp, 'rt') as fh:
+            lines = fh.read().splitlines()
+        assert len(lines) == 100_000
+        assert lines[-1] == 'line 99999'
+
+    def test_command_early_exit(self):
+        # Input not read by a command is a failure even where it exits successfully
+        with self.assertRaises(SystemExit):
+            with bolt_util.execute_command_stdin('head -n 1 > /dev/null') as fh:
+                for i in range(100_000):
+                    fh.write(f'{i}\n')
+
+    def test_command_failure(self):
+        with self.assertRaises(SystemExit):
+            with bolt_util.execute_command_stdin('head -n 1 > /dev/null && exit 1') as fh:
+                for i in range(100_000):
+                    fh.write(f'{i}\n')
+
+
+class TestMetrics(helpers.TemporaryDirectoryTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.input_fp = create_indexed_vcf(self.dirpath)
+        bolt_metrics.enable()
+
+    def tearDown(self):
+        bolt_metrics.COLLECTOR = None
+        super().tearDown()
+
+
+    def test_metrics_collected(self):
+        output_fp = self.dirpath / 'output.vcf.gz'
+        bolt_util.execute_command('echo metrics')
+        bolt_util.process_vcf_records(
+            self.input_fp,
+            output_fp,
+            process_record,
+            header_fn=add_header_entries,
+            drop_contig='chrM',
+        )
+
+        metrics_fp = self.dirpath / 'metrics.json'
+        bolt_metrics.write(metrics_fp, 'test', 1.0)
+        with metrics_fp.open('r') as fh:
+            data = json.load(fh)
+
+        [command] = data['commands']
+        assert command['command'].endswith('echo metrics')
+        assert command['stdout_bytes'] == 8
+
+        [record_loop] = data['record_loops']
+        assert record_loop['name'] == f'{__name__}.process_record'
+        assert record_loop['records'] == 1000
+        assert record_loop['input_bytes'] == self.input_fp.stat().st_size
+        assert record_loop['output_bytes'] == output_fp.stat().st_size